@@ -0,0 +1,199 @@
+"""
+Admission control and load shedding.
+
+The service used to accept every request however saturated it was, so
+overload showed up as slow timeouts on the client side instead of fast,
+retryable rejections. Requests now pass the AdmissionController before they
+are queued for the scheduler:
+
+    - every metric type has its own limit of admitted (queued or running)
+      evaluations, since a TALE evaluation costs far more than a G-Eval one,
+    - a request is shed when more evaluations are waiting for the scheduler
+      ahead of it (same or more urgent priority class) than `max_queue`, so
+      bulk requests are shed long before interactive ones.
+
+Shed requests get 503 with a Retry-After estimated from the recent evaluation
+durations, and /readyz reports the same saturation, so callers and the docker
+healthcheck can back off before requests time out.
+
+Limits and queue length are those of the whole service; with several workers
+each worker admits its share (see shared_state.per_worker).
+
+Configuration (environment variables):
+    ADMISSION_MAX_IN_FLIGHT          Limits per metric type, e.g. "tale=16,dag=64,g-eval=128"
+                                     (default: tale=16,dag=64,g-eval=128)
+    ADMISSION_DEFAULT_MAX_IN_FLIGHT  Limit of metric types not listed (default: 64)
+    ADMISSION_MAX_QUEUE              Evaluations waiting ahead of a request before it is shed (default: 256)
+"""
+
+import os
+import math
+import threading
+from contextlib import contextmanager
+from typing import Dict, Any, Optional
+from eval_logger import eval_logger
+from scheduler import evaluation_scheduler, EvaluationScheduler, PRIORITY_CLASSES
+from service_metrics import admission_rejections, admission_in_flight
+from shared_state import per_worker
+
+
+class Overloaded(Exception):
+    """The request was shed; retry after `retry_after` seconds."""
+
+    def __init__(self, reason: str, retry_after: int, detail: str):
+        super().__init__(detail)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def parse_limits(value: str) -> Dict[str, int]:
+    """Parse "type=limit,type=limit" into a dict."""
+    limits = {}
+    for part in value.split(","):
+        if "=" not in part:
+            continue
+        metric_type, limit = part.split("=", 1)
+        try:
+            limits[metric_type.strip().lower()] = max(1, int(limit))
+        except ValueError:
+            continue
+    return limits
+
+
+class AdmissionController:
+    """
+    In-flight limits per metric type and queue based load shedding. Thread-safe.
+
+    Args:
+        limits: Admitted evaluations allowed per metric type
+        default_limit: Limit of metric types missing from `limits`
+        max_queue: Evaluations waiting ahead of a request before it is shed
+        scheduler: Scheduler whose queue is watched
+        min_retry_after: Lower bound of the Retry-After estimate in seconds
+        max_retry_after: Upper bound of the Retry-After estimate in seconds
+    """
+
+    def __init__(self, limits: Dict[str, int], default_limit: int = 64, max_queue: int = 256,
+                 scheduler: EvaluationScheduler = evaluation_scheduler,
+                 min_retry_after: int = 1, max_retry_after: int = 300):
+        self.limits = {metric_type.lower(): limit for metric_type, limit in limits.items()}
+        self.default_limit = max(1, default_limit)
+        self.max_queue = max(0, max_queue)
+        self.scheduler = scheduler
+        self.min_retry_after = min_retry_after
+        self.max_retry_after = max_retry_after
+        self._lock = threading.Lock()
+        self._in_flight: Dict[str, int] = {}
+        # Moving average of evaluation durations per metric type, in seconds
+        self._average_duration: Dict[str, float] = {}
+
+    def limit(self, metric_type: str) -> int:
+        return self.limits.get(metric_type.lower(), self.default_limit)
+
+    def _retry_after(self, seconds: float) -> int:
+        return int(min(self.max_retry_after, max(self.min_retry_after, math.ceil(seconds))))
+
+    def _average(self, metric_type: Optional[str] = None) -> float:
+        if metric_type is not None and metric_type in self._average_duration:
+            return self._average_duration[metric_type]
+        durations = list(self._average_duration.values())
+        return sum(durations) / len(durations) if durations else 10.0
+
+    @contextmanager
+    def admit(self, metric_type: str, priority: str):
+        """
+        Hold an admission for the with block.
+
+        Raises:
+            Overloaded: The metric type is at its limit or too many evaluations wait ahead
+        """
+        metric_type = metric_type.lower()
+        limit = self.limit(metric_type)
+        waiting_ahead = self.scheduler.waiting_ahead(priority)
+        with self._lock:
+            in_flight = self._in_flight.get(metric_type, 0)
+            if in_flight >= limit:
+                # Roughly one admission frees up every average duration / limit
+                rejection = Overloaded(
+                    "metric_limit",
+                    self._retry_after(self._average(metric_type) / limit),
+                    f"Too many {metric_type} evaluations in flight ({in_flight}/{limit})")
+            elif waiting_ahead >= self.max_queue:
+                rejection = Overloaded(
+                    "queue_full",
+                    self._retry_after(waiting_ahead * self._average() / self.scheduler.max_concurrent),
+                    f"Too many evaluations waiting ({waiting_ahead}/{self.max_queue})")
+            else:
+                rejection = None
+                self._in_flight[metric_type] = in_flight + 1
+
+        if rejection is not None:
+            admission_rejections.inc(metric_type=metric_type, priority=priority, reason=rejection.reason)
+            eval_logger.info("admission", "Request shed", {
+                "metric_type": metric_type,
+                "priority": priority,
+                "reason": rejection.reason,
+                "detail": str(rejection),
+                "retry_after_seconds": rejection.retry_after
+            })
+            raise rejection
+
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._in_flight[metric_type] -= 1
+
+    def record_duration(self, metric_type: str, seconds: float):
+        """Feed the duration of a finished evaluation into the Retry-After estimates."""
+        metric_type = metric_type.lower()
+        with self._lock:
+            average = self._average_duration.get(metric_type)
+            self._average_duration[metric_type] = seconds if average is None else 0.9 * average + 0.1 * seconds
+
+    def readiness(self) -> Dict[str, Any]:
+        """
+        Saturation of the process. Ready means a bulk request of some metric
+        type would currently be admitted.
+        """
+        scheduler_state = self.scheduler.snapshot()
+        waiting_bulk = self.scheduler.waiting_ahead(PRIORITY_CLASSES[-1])
+        with self._lock:
+            metric_types = sorted(set(self.limits) | set(self._in_flight))
+            by_metric_type = {
+                metric_type: {
+                    "in_flight": self._in_flight.get(metric_type, 0),
+                    "limit": self.limit(metric_type),
+                    "average_duration_seconds": round(self._average_duration[metric_type], 1)
+                    if metric_type in self._average_duration else None
+                }
+                for metric_type in metric_types
+            }
+        queue_full = waiting_bulk >= self.max_queue
+        all_types_full = bool(by_metric_type) and all(
+            state["in_flight"] >= state["limit"] for state in by_metric_type.values())
+        return {
+            "ready": not queue_full and not all_types_full,
+            "queue": {"waiting": waiting_bulk, "max_queue": self.max_queue,
+                      "utilization": round(waiting_bulk / self.max_queue, 2) if self.max_queue else None},
+            "running": {"running": scheduler_state["running"], "max_concurrent": scheduler_state["max_concurrent"],
+                        "utilization": round(scheduler_state["running"] / scheduler_state["max_concurrent"], 2)},
+            "by_metric_type": by_metric_type
+        }
+
+    def in_flight(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._in_flight)
+
+
+# Global admission controller instance
+admission_controller = AdmissionController(
+    limits={metric_type: int(per_worker(limit)) for metric_type, limit in
+            parse_limits(os.environ.get("ADMISSION_MAX_IN_FLIGHT", "tale=16,dag=64,g-eval=128")).items()},
+    default_limit=int(per_worker(int(os.environ.get("ADMISSION_DEFAULT_MAX_IN_FLIGHT", "64")))),
+    max_queue=int(per_worker(int(os.environ.get("ADMISSION_MAX_QUEUE", "256"))))
+)
+
+admission_in_flight.set_callback(lambda: {
+    (metric_type,): count for metric_type, count in admission_controller.in_flight().items()
+})
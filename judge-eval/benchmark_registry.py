@@ -0,0 +1,162 @@
+"""
+Registry of the evaluations running for each benchmark.
+
+A benchmark run fans out thousands of evaluation requests. Requests carrying
+a benchmark_id register their cancellation token here for as long as they are
+queued or running, so POST /benchmarks/{id}/cancel can cancel all of them at
+once: queued evaluations stop before they start, running ones at their next
+cancellation check (provider queue, retry backoff, stream chunk, TALE step).
+
+The PHP queue keeps delivering requests of a cancelled benchmark until it is
+drained. The cancellation is therefore remembered for a while and requests of
+the benchmark arriving later are cancelled immediately, without any provider
+call. DELETE /benchmarks/{id}/cancel lifts it before it expires, e.g. to
+re-run the benchmark after fixing its configuration.
+
+With several workers (see shared_state) a cancellation is published as a
+marker file, so the requests of the benchmark served by the other workers
+are cancelled too, at the latest after SHARED_STATE_POLL_SECONDS.
+
+Configuration (environment variables):
+    BENCHMARK_CANCEL_TTL_SECONDS    How long a cancellation applies to new requests (default: 3600)
+"""
+
+import os
+import time
+import threading
+from typing import Dict, Any, Set, Optional
+from eval_logger import eval_logger
+from cancellation import CancellationToken
+from shared_state import SharedDirectory, Poller, shared_state, POLL_SECONDS
+
+
+class BenchmarkRegistry:
+    """
+    Cancellation tokens of the queued and running evaluations per benchmark. Thread-safe.
+
+    Args:
+        cancel_ttl_seconds: How long a cancellation applies to new requests
+        shared: Directory the cancellations are published in for the other workers, None with one worker
+        poll_seconds: How often cancellations published by other workers are looked for
+    """
+
+    def __init__(self, cancel_ttl_seconds: float = 3600.0, shared: Optional[SharedDirectory] = None,
+                 poll_seconds: float = 1.0):
+        self.cancel_ttl_seconds = cancel_ttl_seconds
+        self.shared = shared
+        self._lock = threading.Lock()
+        self._tokens: Dict[str, Set[CancellationToken]] = {}
+        self._cancelled_at: Dict[str, float] = {}
+        self._poller = Poller("benchmark_registry", poll_seconds, self._apply_shared_cancellations)
+
+    @staticmethod
+    def _key(benchmark_id: Any) -> str:
+        return str(benchmark_id)
+
+    @staticmethod
+    def _marker(key: str) -> str:
+        return f"benchmark-{key}.cancelled"
+
+    def _cancelled_since(self, key: str) -> Optional[float]:
+        if self.shared is not None:
+            return self.shared.mtime(self._marker(key))
+        return self._cancelled_at.get(key)
+
+    def _clear(self, key: str):
+        self._cancelled_at.pop(key, None)
+        if self.shared is not None:
+            self.shared.remove(self._marker(key))
+
+    def _is_cancelled(self, key: str) -> bool:
+        cancelled_at = self._cancelled_since(key)
+        if cancelled_at is None:
+            return False
+        if time.time() - cancelled_at > self.cancel_ttl_seconds:
+            self._clear(key)
+            return False
+        return True
+
+    def _apply_shared_cancellations(self):
+        """Cancel the evaluations of benchmarks another worker cancelled."""
+        with self._lock:
+            cancelled = [token for key, tokens in self._tokens.items() if self._is_cancelled(key)
+                         for token in tokens if not token.cancelled]
+        for token in cancelled:
+            token.cancel()
+
+    def register(self, benchmark_id: Any, token: CancellationToken):
+        """Track an evaluation of the benchmark; it is cancelled right away if the benchmark is."""
+        key = self._key(benchmark_id)
+        with self._lock:
+            self._tokens.setdefault(key, set()).add(token)
+            cancelled = self._is_cancelled(key)
+        if cancelled:
+            token.cancel()
+        if self.shared is not None:
+            self._poller.start()
+
+    def unregister(self, benchmark_id: Any, token: CancellationToken):
+        """Stop tracking a finished evaluation. Unknown tokens are ignored."""
+        key = self._key(benchmark_id)
+        with self._lock:
+            tokens = self._tokens.get(key)
+            if tokens is None:
+                return
+            tokens.discard(token)
+            if not tokens:
+                del self._tokens[key]
+
+    def cancel(self, benchmark_id: Any) -> int:
+        """
+        Cancel all queued and running evaluations of the benchmark and the ones
+        arriving during the next cancel_ttl_seconds.
+
+        Returns:
+            int: Number of evaluations cancelled now
+        """
+        key = self._key(benchmark_id)
+        with self._lock:
+            self._cancelled_at[key] = time.time()
+            if self.shared is not None:
+                self.shared.touch(self._marker(key))
+            tokens = [token for token in self._tokens.get(key, ()) if not token.cancelled]
+        for token in tokens:
+            token.cancel()
+        eval_logger.info("benchmark_registry", "Benchmark cancelled", {
+            "benchmark_id": key,
+            "cancelled_evaluations": len(tokens),
+            "applies_to_new_requests_for_seconds": self.cancel_ttl_seconds
+        })
+        return len(tokens)
+
+    def lift(self, benchmark_id: Any) -> bool:
+        """Accept new requests of a cancelled benchmark again; returns whether it was cancelled."""
+        key = self._key(benchmark_id)
+        with self._lock:
+            was_cancelled = self._is_cancelled(key)
+            self._clear(key)
+        if was_cancelled:
+            eval_logger.info("benchmark_registry", "Benchmark cancellation lifted", {"benchmark_id": key})
+        return was_cancelled
+
+    def status(self, benchmark_id: Any) -> Dict[str, Any]:
+        key = self._key(benchmark_id)
+        with self._lock:
+            cancelled = self._is_cancelled(key)
+            cancelled_at: Optional[float] = self._cancelled_since(key)
+            in_flight = len(self._tokens.get(key, ()))
+        return {
+            "benchmark_id": key,
+            "in_flight": in_flight,
+            "cancelled": cancelled,
+            "cancellation_expires_in_seconds": round(cancelled_at + self.cancel_ttl_seconds - time.time())
+            if cancelled and cancelled_at is not None else None
+        }
+
+
+# Global benchmark registry instance
+benchmark_registry = BenchmarkRegistry(
+    cancel_ttl_seconds=float(os.environ.get("BENCHMARK_CANCEL_TTL_SECONDS", "3600")),
+    shared=shared_state,
+    poll_seconds=POLL_SECONDS
+)
@@ -0,0 +1,406 @@
+"""
+Lifecycle of the response cache: expiry, size bound and statistics.
+
+Responses of the model under test are cached in /app/cache (see
+llmrequestor) for a time to live. Expired entries used to be deleted by the
+read that found them, on the request path, entries nobody asked for again
+were never deleted, nothing bounded the size of the cache, and every cache
+miss left a .lock file behind for good. A background sweep now
+
+    - removes entries older than the time to live of their model,
+    - removes lock files and temporary files of interrupted writes that were
+      not used for CACHE_LOCK_GRACE_SECONDS (a lock file is only removed while
+      the sweep holds its lock),
+    - evicts the least recently used entries (by the access time tiered_cache
+      records on hits) while the entries take more than RESPONSE_CACHE_MAX_MB,
+      down to 90% of it, so the next sweeps do not evict again right away.
+
+Reads still treat expired entries as misses. With several workers every
+worker runs the sweep, but only the one holding the maintenance lock of the
+directory sweeps at a time.
+
+Other stores of the cache volume register their own sweeps, which run after
+each sweep of the response cache (see CacheMaintenance.register):
+
+    checkpoints      Checkpoints of evaluations that were never retried (checkpoint_store)
+    evidence_index   TALE pages beyond its age and size bounds (evidence_index)
+    logs             Logs returned by reference, past their retention (log_store)
+
+GET /cache/stats reports entries, bytes, an age histogram and the hit ratio of
+the worker that answers; POST /cache/sweep runs the sweeps at once. Without the
+service running, `python cache_maintenance.py stats|sweep [--dir DIR]` does the
+same on the cache directory (without hit ratio).
+
+Time to live per model: RESPONSE_CACHE_TTL_BY_MODEL holds comma separated
+`model=hours` pairs, e.g. "gpt-4o=168,local-llama=0"; 0 hours never expires.
+Sweeping with per-model times to live reads the model name of every entry
+once per process.
+
+Configuration (environment variables):
+    RESPONSE_CACHE_TTL_HOURS             Time to live of entries of other models, 0 for none (default: 24)
+    RESPONSE_CACHE_TTL_BY_MODEL          Time to live per model in hours (default: none)
+    RESPONSE_CACHE_MAX_MB                Size bound of the entries, 0 for none (default: 1024)
+    CACHE_MAINTENANCE_INTERVAL_SECONDS   Interval of the background sweep, 0 to disable it (default: 600)
+    CACHE_LOCK_GRACE_SECONDS             Age of unused lock and temporary files to remove (default: 3600)
+"""
+
+import os
+import sys
+import json
+import time
+import fcntl
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from eval_logger import eval_logger
+from shared_state import Poller
+from tiered_cache import TieredCache
+from service_metrics import (
+    cache_maintenance_removed,
+    cache_maintenance_duration,
+    response_cache_size,
+    response_cache_requests,
+    cache_lookups
+)
+
+_LOCK_SUFFIX = ".json.lock"
+_TMP_SUFFIX = ".tmp"
+_ENTRY_SUFFIX = ".json"
+
+# Upper bounds of the age histogram of /cache/stats
+AGE_BUCKETS = ((3600, "1h"), (6 * 3600, "6h"), (24 * 3600, "24h"), (7 * 24 * 3600, "7d"), (30 * 24 * 3600, "30d"))
+
+
+class CachePolicy:
+    """
+    Time to live of cached responses by model.
+
+    Args:
+        default_ttl_hours: Time to live of entries of models without their own, 0 for none
+        ttl_hours_by_model: Time to live per model name, 0 for none
+    """
+
+    def __init__(self, default_ttl_hours: float = 24.0, ttl_hours_by_model: Optional[Dict[str, float]] = None):
+        self.default_ttl_hours = default_ttl_hours
+        self.ttl_hours_by_model = dict(ttl_hours_by_model or {})
+
+    @staticmethod
+    def parse_ttl_by_model(value: str) -> Dict[str, float]:
+        """Parse "model=hours,model=hours"; malformed pairs are logged and ignored."""
+        ttl_by_model = {}
+        for pair in value.split(","):
+            if not pair.strip():
+                continue
+            model, _, hours = pair.rpartition("=")
+            try:
+                ttl_by_model[model.strip()] = float(hours)
+            except ValueError:
+                eval_logger.log_error("cache_maintenance", f"Ignoring malformed cache TTL: {pair!r}")
+        return ttl_by_model
+
+    @property
+    def by_model(self) -> bool:
+        return bool(self.ttl_hours_by_model)
+
+    def ttl_seconds(self, model_name: Optional[str]) -> Optional[float]:
+        """Time to live of a model's entries in seconds, None if they do not expire."""
+        hours = self.ttl_hours_by_model.get(model_name, self.default_ttl_hours)
+        return hours * 3600 if hours and hours > 0 else None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"default_ttl_hours": self.default_ttl_hours, "ttl_hours_by_model": dict(self.ttl_hours_by_model)}
+
+
+class CacheMaintenance:
+    """
+    Sweeps a TieredCache directory of LlmRequestor responses and reports on it.
+
+    Args:
+        cache: Cache to maintain
+        policy: Time to live of its entries
+        max_bytes: Size bound of the entries, 0 for none
+        interval: Seconds between background sweeps, 0 for none
+        lock_grace: Age of unused lock and temporary files to remove
+    """
+
+    def __init__(self, cache: TieredCache, policy: CachePolicy, max_bytes: int = 0, interval: float = 600.0,
+                 lock_grace: float = 3600.0):
+        self.cache = cache
+        self.policy = policy
+        self.max_bytes = max(0, max_bytes)
+        self.interval = interval
+        self.lock_grace = lock_grace
+        self._lock = threading.Lock()
+        # Model of each entry by key, valid for the entry's modification time
+        self._models: Dict[str, Tuple[int, Optional[str]]] = {}
+        self.last_sweep: Optional[Dict[str, Any]] = None
+        self._sweeps: List[Tuple[str, Callable[[], Dict[str, Any]]]] = []
+        self.last_sweeps: Dict[str, Dict[str, Any]] = {}
+        self._poller = Poller("cache-maintenance", interval, self.sweep_all) if interval > 0 else None
+
+    def register(self, name: str, sweep: Callable[[], Dict[str, Any]]):
+        """
+        Run another sweep after each sweep of the response cache. It must be safe
+        to run in several workers at once and return a dict whose "removed" counts
+        what it removed.
+        """
+        self._sweeps.append((name, sweep))
+
+    def start(self):
+        """Start the background sweeps; idempotent."""
+        if self._poller is not None:
+            self._poller.start()
+
+    def _scan(self) -> Tuple[List[Tuple[str, os.stat_result]], List[Tuple[str, os.stat_result]],
+                             List[Tuple[str, os.stat_result]]]:
+        """Entries (by key), lock files and temporary files of the cache directory."""
+        entries, locks, temporary = [], [], []
+        try:
+            with os.scandir(self.cache.directory) as scanned:
+                for item in scanned:
+                    try:
+                        if not item.is_file(follow_symlinks=False):
+                            continue
+                        if item.name.endswith(_LOCK_SUFFIX):
+                            locks.append((item.path, item.stat()))
+                        elif item.name.endswith(_TMP_SUFFIX):
+                            temporary.append((item.path, item.stat()))
+                        elif item.name.endswith(_ENTRY_SUFFIX):
+                            entries.append((item.name[:-len(_ENTRY_SUFFIX)], item.stat()))
+                    except OSError:
+                        # Removed while scanning
+                        continue
+        except FileNotFoundError:
+            pass
+        return entries, locks, temporary
+
+    def _model_of(self, key: str, stat: os.stat_result) -> Optional[str]:
+        with self._lock:
+            known = self._models.get(key)
+        if known is not None and known[0] == stat.st_mtime_ns:
+            return known[1]
+        path = self.cache.path(key)
+        try:
+            try:
+                # Reading must not count as a use of the entry for the LRU eviction
+                fd = os.open(path, os.O_RDONLY | getattr(os, "O_NOATIME", 0))
+            except PermissionError:
+                # O_NOATIME is only allowed to the owner of the file
+                fd = os.open(path, os.O_RDONLY)
+            with open(fd, "r", encoding="utf-8") as f:
+                model_name = json.load(f).get("model_name")
+        except (OSError, ValueError, AttributeError):
+            model_name = None
+        with self._lock:
+            self._models[key] = (stat.st_mtime_ns, model_name)
+        return model_name
+
+    def _is_expired(self, key: str, stat: os.stat_result, now: float) -> bool:
+        ttl = self.policy.ttl_seconds(self._model_of(key, stat) if self.policy.by_model else None)
+        return ttl is not None and now - stat.st_mtime > ttl
+
+    def _discard_unchanged(self, key: str, stat: os.stat_result) -> bool:
+        """Remove an entry unless it was written again since it was scanned."""
+        try:
+            if os.stat(self.cache.path(key)).st_mtime_ns != stat.st_mtime_ns:
+                return False
+        except OSError:
+            return False
+        self.cache.discard(key)
+        return True
+
+    def _remove_unused_lock(self, path: str) -> bool:
+        """Remove a lock file unless some request holds it."""
+        try:
+            with open(path, "a") as lock_file:
+                try:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    return False
+                # A request that opened the file before the removal takes its lock after
+                # the sweep releases it; at worst, it generates a response twice
+                os.remove(path)
+                return True
+        except OSError:
+            return False
+
+    def sweep(self) -> Dict[str, Any]:
+        """
+        Remove expired entries, unused lock and temporary files, and evict entries
+        above the size bound.
+
+        Returns:
+            dict: What was removed, the size of the cache afterwards and the sweep
+                  duration; "skipped" if another worker is sweeping
+        """
+        started = time.perf_counter()
+        try:
+            os.makedirs(self.cache.directory, exist_ok=True)
+            maintenance_lock = open(os.path.join(self.cache.directory, ".maintenance.lock"), "a")
+        except OSError as e:
+            eval_logger.log_error("cache_maintenance", f"Failed to open the maintenance lock: {e}")
+            return {"skipped": str(e)}
+        with maintenance_lock:
+            try:
+                fcntl.flock(maintenance_lock.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return {"skipped": "another worker is sweeping"}
+
+            now = time.time()
+            entries, locks, temporary = self._scan()
+            removed = {"expired": 0, "evicted": 0, "lock_files": 0, "temp_files": 0}
+            freed_bytes = 0
+
+            kept = []
+            for key, stat in entries:
+                if not self._is_expired(key, stat, now):
+                    kept.append((key, stat))
+                elif self._discard_unchanged(key, stat):
+                    removed["expired"] += 1
+                    freed_bytes += stat.st_size
+
+            total_bytes = sum(stat.st_size for _, stat in kept)
+            if self.max_bytes and total_bytes > self.max_bytes:
+                # Least recently used first: the access time is set on hits, the
+                # modification time when the entry was written
+                kept.sort(key=lambda entry: max(entry[1].st_atime, entry[1].st_mtime))
+                target = self.max_bytes * 0.9
+                evict = 0
+                while evict < len(kept) and total_bytes > target:
+                    key, stat = kept[evict]
+                    if self._discard_unchanged(key, stat):
+                        total_bytes -= stat.st_size
+                        freed_bytes += stat.st_size
+                        removed["evicted"] += 1
+                    evict += 1
+                kept = kept[evict:]
+
+            for path, stat in locks:
+                if now - stat.st_mtime > self.lock_grace and self._remove_unused_lock(path):
+                    removed["lock_files"] += 1
+            for path, stat in temporary:
+                if now - stat.st_mtime > self.lock_grace:
+                    try:
+                        os.remove(path)
+                        removed["temp_files"] += 1
+                    except OSError:
+                        pass
+
+        with self._lock:
+            kept_keys = {key for key, _ in kept}
+            for key in [key for key in self._models if key not in kept_keys]:
+                del self._models[key]
+
+        duration = time.perf_counter() - started
+        for reason, count in removed.items():
+            if count:
+                cache_maintenance_removed.inc(count, reason=reason)
+        cache_maintenance_duration.observe(duration)
+        report = {
+            "removed": removed,
+            "freed_bytes": freed_bytes,
+            "entries": len(kept),
+            "bytes": total_bytes,
+            "duration_seconds": round(duration, 3),
+            "finished_at": now
+        }
+        self.last_sweep = report
+        if any(removed.values()):
+            eval_logger.info("cache_maintenance", "Swept response cache", report)
+        return report
+
+    def sweep_all(self) -> Dict[str, Any]:
+        """Sweep the response cache, then run the registered sweeps; see sweep()."""
+        report = self.sweep()
+        sweeps = {}
+        for name, sweep in self._sweeps:
+            try:
+                sweeps[name] = sweep()
+            except Exception as e:
+                eval_logger.log_error("cache_maintenance", f"Sweeping {name} failed: {e}")
+                sweeps[name] = {"error": str(e)}
+                continue
+            if sweeps[name].get("removed"):
+                cache_maintenance_removed.inc(sweeps[name]["removed"], reason=name)
+        with self._lock:
+            self.last_sweeps.update(sweeps)
+        return {**report, "sweeps": sweeps}
+
+    @staticmethod
+    def hit_ratio() -> Dict[str, Any]:
+        """Response cache lookups of this process and the share answered from the cache."""
+        requests = {key[0]: value for key, value in response_cache_requests.values().items()}
+        hits = requests.get("hit", 0) + requests.get("hit_after_lock", 0)
+        lookups = hits + requests.get("miss", 0)
+        tiers = {key[1]: value for key, value in cache_lookups.values().items() if key[0] == "response"}
+        return {
+            "lookups": int(lookups),
+            "hits": int(hits),
+            "ratio": round(hits / lookups, 4) if lookups else None,
+            "by_tier": {tier: int(count) for tier, count in tiers.items()}
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        """Entries, bytes, age histogram and (not yet swept) expired entries of the cache directory."""
+        now = time.time()
+        entries, locks, temporary = self._scan()
+        histogram = {f"<{label}": 0 for _, label in AGE_BUCKETS}
+        histogram[f">{AGE_BUCKETS[-1][1]}"] = 0
+        total_bytes = 0
+        expired = 0
+        oldest = None
+        for key, stat in entries:
+            age = now - stat.st_mtime
+            total_bytes += stat.st_size
+            oldest = age if oldest is None else max(oldest, age)
+            for bound, label in AGE_BUCKETS:
+                if age < bound:
+                    histogram[f"<{label}"] += 1
+                    break
+            else:
+                histogram[f">{AGE_BUCKETS[-1][1]}"] += 1
+            if self._is_expired(key, stat, now):
+                expired += 1
+        response_cache_size.set(len(entries), unit="entries")
+        response_cache_size.set(total_bytes, unit="bytes")
+        return {
+            "directory": self.cache.directory,
+            "entries": len(entries),
+            "bytes": total_bytes,
+            "max_bytes": self.max_bytes or None,
+            "expired": expired,
+            "oldest_age_hours": round(oldest / 3600, 2) if oldest is not None else None,
+            "age_histogram": histogram,
+            "lock_files": len(locks),
+            "temp_files": len(temporary),
+            "policy": self.policy.to_dict(),
+            "last_sweep": self.last_sweep,
+            "last_sweeps": dict(self.last_sweeps)
+        }
+
+
+# Response cache lifecycle settings
+RESPONSE_CACHE_POLICY = CachePolicy(
+    default_ttl_hours=float(os.environ.get("RESPONSE_CACHE_TTL_HOURS", "24")),
+    ttl_hours_by_model=CachePolicy.parse_ttl_by_model(os.environ.get("RESPONSE_CACHE_TTL_BY_MODEL", ""))
+)
+RESPONSE_CACHE_MAX_BYTES = int(float(os.environ.get("RESPONSE_CACHE_MAX_MB", "1024")) * 1024 * 1024)
+MAINTENANCE_INTERVAL_SECONDS = float(os.environ.get("CACHE_MAINTENANCE_INTERVAL_SECONDS", "600"))
+LOCK_GRACE_SECONDS = float(os.environ.get("CACHE_LOCK_GRACE_SECONDS", "3600"))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Report on or sweep the response cache.")
+    parser.add_argument("command", choices=("stats", "sweep"))
+    parser.add_argument("--dir", help="Cache directory (default: the service's response cache)")
+    arguments = parser.parse_args()
+
+    if arguments.dir:
+        maintenance = CacheMaintenance(TieredCache("response", arguments.dir, memory_entries=0),
+                                       RESPONSE_CACHE_POLICY, RESPONSE_CACHE_MAX_BYTES, 0, LOCK_GRACE_SECONDS)
+    else:
+        from llmrequestor import response_cache_maintenance as maintenance
+    report = maintenance.stats() if arguments.command == "stats" else maintenance.sweep()
+    json.dump(report, sys.stdout, indent=2)
+    print()
@@ -0,0 +1,274 @@
+"""
+Record and replay of the external calls of evaluations.
+
+Every evaluation depends on the model under test, the judge, the search
+engine and the web, which makes runs slow, costly and never quite the same.
+With EVAL_CALL_TRACE=record, each evaluation writes a trace of its outbound
+calls:
+
+    completion   LlmRequestor completions (messages -> output and generation stats)
+    judge        Judge.generate calls (prompt -> chat completion response)
+    search       TALE search engine requests (query, engines, time range -> response)
+    page         TALE page fetches (URL -> page bytes)
+
+With EVAL_CALL_TRACE=replay, the same evaluation (same fingerprint as used by
+checkpoint_store) is served from its trace instead: each call returns the
+recorded response or raises the recorded failure after its recorded latency,
+multiplied by EVAL_CALL_TRACE_LATENCY_SCALE (0 answers at once). Everything
+else, the scheduling, limiters, caches' locking, parsing and scoring, runs as
+it does live, so replays profile the service's own overhead and give exactly
+reproducible scores, also under load.
+
+Calls are matched by kind and request, not by order, since TALE and DeepEval
+issue calls concurrently; identical requests are numbered in call order like
+the judge journal of checkpoints. A call without a recorded counterpart fails
+with TraceMiss. Credentials and endpoint URLs are not part of the recorded
+requests, so a trace replays against any deployment.
+
+While calls are traced, neither the response cache nor TALE's local evidence
+index are read, so every completion and search of a recording is in its trace
+and every completion and search of a replay comes from it. Traced
+evaluations never write the response cache either (nor take its locks):
+replayed outputs would otherwise be served to live evaluations and
+pre-generations once tracing is turned off. A recorded evaluation does not
+resume the checkpoint of a previous attempt (see checkpoint_store) either,
+whose generation, TALE iterations and judge calls would otherwise be missing
+from the trace.
+
+Traces are written as gzip compressed JSON, one file per evaluation, when the
+evaluation ends (also when it fails or is cancelled).
+
+Configuration (environment variables):
+    EVAL_CALL_TRACE                 "record", "replay" or "off" (default: off)
+    EVAL_CALL_TRACE_DIR             Directory of the traces (default: /app/cache/traces)
+    EVAL_CALL_TRACE_LATENCY_SCALE   Factor applied to recorded latencies on replay (default: 1.0)
+"""
+
+import os
+import json
+import gzip
+import time
+import hashlib
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple, Type
+from eval_logger import eval_logger
+from service_metrics import call_trace_calls
+
+OFF = "off"
+RECORD = "record"
+REPLAY = "replay"
+
+
+class TraceMiss(Exception):
+    """A replayed evaluation made a call its trace holds no answer for."""
+
+
+class ReplayedFailure(Exception):
+    """A recorded failure of a type the call site did not ask to be re-created."""
+
+    def __init__(self, error_type: str, message: str):
+        super().__init__(f"{error_type}: {message}")
+        self.error_type = error_type
+
+
+def _request_key(kind: str, request: Dict[str, Any]) -> str:
+    canonical = json.dumps(request, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(f"{kind}\n{canonical}".encode("utf-8")).hexdigest()[:32]
+
+
+class CallTrace:
+    """Recorded or replayed calls of one evaluation. Thread-safe."""
+
+    def __init__(self, mode: str, path: str, fingerprint: str, latency_scale: float = 1.0,
+                 interactions: Optional[list] = None):
+        self.mode = mode
+        self.path = path
+        self.fingerprint = fingerprint
+        self.latency_scale = max(0.0, latency_scale)
+        self._lock = threading.Lock()
+        self._started = time.perf_counter()
+        self._interactions = []
+        self._recorded: Dict[Tuple[str, str, int], Dict[str, Any]] = {}
+        self._occurrences: Dict[Tuple[str, str], int] = {}
+        self.calls = 0
+        self.missing = 0
+        for interaction in interactions or []:
+            self._recorded[(interaction["kind"], interaction["key"], interaction["occurrence"])] = interaction
+
+    @property
+    def recording(self) -> bool:
+        return self.mode == RECORD
+
+    def _next_occurrence(self, kind: str, key: str) -> int:
+        with self._lock:
+            occurrence = self._occurrences.get((kind, key), 0)
+            self._occurrences[(kind, key)] = occurrence + 1
+            self.calls += 1
+            return occurrence
+
+    def call(self, kind: str, request: Dict[str, Any], live: Callable[[], Any],
+             encode: Optional[Callable[[Any], Any]] = None, decode: Optional[Callable[[Any], Any]] = None,
+             errors: Tuple[Type[Exception], ...] = (), cancellation=None) -> Any:
+        """
+        Make a call, recording it, or answer it from the trace.
+
+        Args:
+            kind: Kind of call ("completion", "judge", "search", "page")
+            request: What identifies the call; JSON serializable, without credentials
+            live: Makes the call; its result must be JSON serializable after encode
+            encode, decode: Convert the result to and from its recorded form
+            errors: Exception types re-created by type name when a recorded failure is replayed
+            cancellation: Token of the evaluation; replayed latencies end early when it is cancelled
+
+        Raises:
+            TraceMiss: Replaying, and the trace has no answer for the call
+        """
+        key = _request_key(kind, request)
+        occurrence = self._next_occurrence(kind, key)
+        if self.mode == REPLAY:
+            return self._replay(kind, key, occurrence, decode, errors, cancellation)
+
+        started = time.perf_counter()
+        interaction = {
+            "kind": kind,
+            "key": key,
+            "occurrence": occurrence,
+            "offset_ms": round((started - self._started) * 1000, 1),
+            "request": request
+        }
+        try:
+            result = live()
+        except Exception as e:
+            interaction["error"] = {"type": type(e).__name__, "message": str(e)}
+            raise
+        else:
+            interaction["response"] = encode(result) if encode is not None else result
+            return result
+        finally:
+            # Cancellations (BaseException) end the call without an answer to record
+            if "error" in interaction or "response" in interaction:
+                interaction["latency_ms"] = round((time.perf_counter() - started) * 1000, 1)
+                with self._lock:
+                    self._interactions.append(interaction)
+                call_trace_calls.inc(kind=kind, mode=RECORD, outcome="error" if "error" in interaction else "success")
+
+    def _replay(self, kind: str, key: str, occurrence: int, decode, errors, cancellation) -> Any:
+        interaction = self._recorded.get((kind, key, occurrence))
+        if interaction is None:
+            with self._lock:
+                self.missing += 1
+            call_trace_calls.inc(kind=kind, mode=REPLAY, outcome="miss")
+            raise TraceMiss(f"No recorded {kind} call matches this request (occurrence {occurrence + 1})")
+
+        delay = interaction.get("latency_ms", 0) / 1000 * self.latency_scale
+        if delay > 0:
+            if cancellation is not None:
+                cancellation.sleep(delay)
+            else:
+                time.sleep(delay)
+
+        error = interaction.get("error")
+        if error is not None:
+            call_trace_calls.inc(kind=kind, mode=REPLAY, outcome="error")
+            for error_class in errors:
+                if error_class.__name__ == error["type"]:
+                    raise error_class(error["message"])
+            raise ReplayedFailure(error["type"], error["message"])
+        call_trace_calls.inc(kind=kind, mode=REPLAY, outcome="success")
+        response = interaction.get("response")
+        return decode(response) if decode is not None else response
+
+    def save(self):
+        """Write a recorded trace; replayed traces are left as they are."""
+        if self.mode != RECORD:
+            return
+        with self._lock:
+            interactions = sorted(self._interactions, key=lambda interaction: interaction["offset_ms"])
+        document = {"fingerprint": self.fingerprint, "recorded_at": time.time(), "interactions": interactions}
+        tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(tmp_path, "wb") as f:
+                f.write(gzip.compress(json.dumps(document, ensure_ascii=False, default=str).encode("utf-8"),
+                                      mtime=0))
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            eval_logger.log_error("call_trace", f"Failed to write call trace: {e}", {"file": self.path})
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            summary = {"mode": self.mode, "trace": os.path.basename(self.path), "calls": self.calls}
+            if self.mode == REPLAY:
+                summary.update(recorded=len(self._recorded), missing=self.missing)
+            return summary
+
+
+class CallTraceStore:
+    """
+    Opens the call trace of each evaluation according to the configured mode.
+
+    Args:
+        mode: "record", "replay" or "off"
+        directory: Directory of the trace files
+        latency_scale: Factor applied to recorded latencies on replay
+    """
+
+    def __init__(self, mode: str = OFF, directory: str = "/app/cache/traces", latency_scale: float = 1.0):
+        self.mode = mode if mode in (RECORD, REPLAY) else OFF
+        self.directory = directory
+        self.latency_scale = latency_scale
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != OFF
+
+    def open(self, fingerprint: str) -> Optional[CallTrace]:
+        """
+        Start the trace of an evaluation, None when tracing is off.
+
+        A replayed evaluation without a trace file gets an empty trace, so each
+        of its calls fails with TraceMiss.
+        """
+        if not self.enabled:
+            return None
+        path = os.path.join(self.directory, f"{fingerprint}.json.gz")
+        if self.mode == RECORD:
+            return CallTrace(RECORD, path, fingerprint)
+
+        interactions = []
+        try:
+            with open(path, "rb") as f:
+                interactions = json.loads(gzip.decompress(f.read()))["interactions"]
+        except FileNotFoundError:
+            eval_logger.log_error("call_trace", "No call trace recorded for this evaluation", {"file": path})
+        except (OSError, ValueError, KeyError) as e:
+            eval_logger.log_error("call_trace", f"Failed to read call trace: {e}", {"file": path})
+        return CallTrace(REPLAY, path, fingerprint, self.latency_scale, interactions)
+
+
+def traced_call(kind: str, request: Dict[str, Any], live: Callable[[], Any], **options: Any) -> Any:
+    """
+    Make an external call through the call trace of the running evaluation, if
+    any (see CallTrace.call for the options); outside of traced evaluations the
+    call is simply made.
+    """
+    # Imported here, eval_context refers to CallTrace
+    from eval_context import current_context
+
+    context = current_context()
+    trace = context.call_trace if context is not None else None
+    if trace is None:
+        return live()
+    return trace.call(kind, request, live, cancellation=context.cancellation, **options)
+
+
+# Global call trace store instance
+call_trace_store = CallTraceStore(
+    mode=os.environ.get("EVAL_CALL_TRACE", OFF).lower(),
+    directory=os.environ.get("EVAL_CALL_TRACE_DIR", "/app/cache/traces"),
+    latency_scale=float(os.environ.get("EVAL_CALL_TRACE_LATENCY_SCALE", "1.0"))
+)
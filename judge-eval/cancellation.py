@@ -0,0 +1,120 @@
+"""
+Deadlines and cooperative cancellation of evaluations.
+
+An evaluation used to run to the end even after the PHP client timed out or
+disconnected, paying for judge, model and search calls whose result nobody
+would read. Every evaluation now carries a CancellationToken with an optional
+deadline. The token is cancelled when the deadline passes, when the client
+disconnects or when the evaluation is cancelled explicitly, and the components
+taking part in the evaluation check it cooperatively:
+
+    - provider calls clamp their connect/read timeouts to the remaining time,
+      and the retry policy neither starts attempts nor sleeps past the deadline,
+    - waiting for a provider concurrency slot stops when the token is cancelled,
+    - streamed generations stop reading between chunks,
+    - TALE stops searching early to leave time for its final judgment.
+
+Work that is already in flight is not interrupted; the next checkpoint raises
+EvaluationCancelled. Like asyncio.CancelledError it derives from BaseException,
+so the many `except Exception` blocks that wrap provider errors into
+ValueErrors let it pass instead of turning a cancellation into a failure.
+
+Configuration (environment variables):
+    EVAL_DEFAULT_DEADLINE_SECONDS    Deadline of requests that do not set one, 0 for none (default: 0)
+"""
+
+import os
+import time
+import threading
+from typing import Optional, Tuple, Dict, Any
+
+
+DEADLINE_EXCEEDED = "deadline_exceeded"
+CLIENT_DISCONNECTED = "client_disconnected"
+CANCELLED = "cancelled"
+
+
+class EvaluationCancelled(BaseException):
+    """
+    The evaluation was cancelled or ran past its deadline.
+
+    Attributes:
+        reason: DEADLINE_EXCEEDED, CLIENT_DISCONNECTED or CANCELLED
+        partial: What the evaluation completed before it stopped, filled in by the Evaluator
+    """
+
+    def __init__(self, reason: str, message: Optional[str] = None):
+        super().__init__(message or f"Evaluation stopped: {reason}")
+        self.reason = reason
+        self.partial: Dict[str, Any] = {}
+
+
+class CancellationToken:
+    """
+    Deadline and cancellation state of one evaluation. Thread-safe.
+
+    Args:
+        deadline_seconds: Seconds from now until the deadline, None for no deadline
+    """
+
+    def __init__(self, deadline_seconds: Optional[float] = None):
+        self.deadline = time.monotonic() + deadline_seconds if deadline_seconds else None
+        self.deadline_seconds = deadline_seconds or None
+        self.reason: Optional[str] = None
+        self._event = threading.Event()
+
+    def cancel(self, reason: str = CANCELLED):
+        """Cancel the evaluation; the first reason given is kept."""
+        if self.reason is None:
+            self.reason = reason
+        self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        if not self._event.is_set() and self.deadline is not None and time.monotonic() >= self.deadline:
+            self.cancel(DEADLINE_EXCEEDED)
+        return self._event.is_set()
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left until the deadline, None without a deadline."""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def check(self):
+        """Raise EvaluationCancelled if the evaluation was cancelled or its deadline passed."""
+        if self.cancelled:
+            raise EvaluationCancelled(self.reason)
+
+    def clamp_timeout(self, timeout: Tuple[float, float]) -> Tuple[float, float]:
+        """Shorten a (connect, read) timeout so the call cannot outlive the deadline."""
+        self.check()
+        remaining = self.remaining()
+        if remaining is None:
+            return timeout
+        connect_timeout, read_timeout = timeout
+        return min(connect_timeout, remaining), min(read_timeout, remaining)
+
+    def sleep(self, seconds: float):
+        """Sleep, waking up early and raising EvaluationCancelled if the evaluation is cancelled."""
+        self.check()
+        remaining = self.remaining()
+        if remaining is not None and seconds >= remaining:
+            # Sleeping would only end past the deadline
+            self.cancel(DEADLINE_EXCEEDED)
+            self.check()
+        if self._event.wait(seconds):
+            self.check()
+
+    def to_dict(self) -> Dict[str, Any]:
+        remaining = self.remaining()
+        return {
+            "deadline_seconds": self.deadline_seconds,
+            "remaining_seconds": round(remaining, 1) if remaining is not None else None,
+            "cancelled": self.cancelled,
+            "reason": self.reason
+        }
+
+
+# Deadline applied to requests that do not set their own
+DEFAULT_DEADLINE_SECONDS = float(os.environ.get("EVAL_DEFAULT_DEADLINE_SECONDS", "0")) or None
@@ -0,0 +1,351 @@
+"""
+Durable checkpoints of running evaluations.
+
+A failed TALE or DAG evaluation used to lose everything it had done, and the
+PHP retry started again from scratch. Progress is now written to a checkpoint
+keyed by the evaluation fingerprint (prompt, model, system prompt, metric,
+judge model and run index):
+
+    generation.json       Output of the model under test
+    tale.json             TALE memory, reflection and counters after the last
+                          completed iteration
+    judge_journal.jsonl   Every completed judge call (DAG node verdicts, G-Eval
+                          scores, TALE reflections, ...), appended as it finishes
+
+A retried request with the same fingerprint resumes from the checkpoint:
+the generation is reused, TALE continues after its last completed iteration,
+and judge calls whose prompt was already answered are replayed from the
+journal instead of being paid for again. Checkpoints are removed when the
+evaluation succeeds, and checkpoints older than CHECKPOINT_TTL_HOURS (of
+evaluations that failed, were cancelled and never retried) by the background
+sweep of cache_maintenance.
+
+Each attempt holds an exclusive lock on its fingerprint (<fingerprint>.lock
+next to the checkpoint directory) from open() until close(). A retry arriving
+while the previous attempt still runs waits for it (or its own cancellation)
+before it resumes, so two attempts never write, resume or remove one
+checkpoint at the same time.
+
+Configuration (environment variables):
+    CHECKPOINT_DIR          Directory of the checkpoints (default: /app/cache/checkpoints)
+    CHECKPOINT_TTL_HOURS    Older checkpoints are ignored and swept (default: 24)
+"""
+
+import os
+import json
+import time
+import fcntl
+import shutil
+import hashlib
+import threading
+from typing import Dict, Any, IO, Optional, Tuple
+from eval_logger import eval_logger
+from cancellation import CancellationToken
+
+# Interval at which an attempt looks whether the previous attempt released the checkpoint
+LOCK_POLL_SECONDS = 0.5
+
+
+def _prompt_key(prompt: str) -> str:
+    return hashlib.md5(prompt.encode("utf-8")).hexdigest()
+
+
+class Checkpoint:
+    """Checkpoint of one evaluation fingerprint. Thread-safe."""
+
+    def __init__(self, directory: str, fingerprint: str, ttl_seconds: float, lock_file: Optional[IO] = None):
+        self.directory = directory
+        self.fingerprint = fingerprint
+        self.ttl_seconds = ttl_seconds
+        self._lock_file = lock_file
+        self._lock = threading.Lock()
+        self._journal: Dict[Tuple[str, int], Dict[str, Any]] = {}
+        self._occurrences: Dict[str, int] = {}
+        self.replayed_judge_calls = 0
+        self.restored = {"generation": False, "tale_iterations": 0}
+        self._load_journal()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _is_fresh(self, path: str) -> bool:
+        try:
+            return time.time() - os.path.getmtime(path) <= self.ttl_seconds
+        except OSError:
+            return False
+
+    def _read_json(self, name: str) -> Optional[Dict[str, Any]]:
+        path = self._path(name)
+        if not self._is_fresh(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            eval_logger.log_error("checkpoint_store", f"Failed to read checkpoint: {e}", {"file": path})
+            return None
+
+    def _write_json(self, name: str, data: Dict[str, Any]):
+        path = self._path(name)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            eval_logger.log_error("checkpoint_store", f"Failed to write checkpoint: {e}", {"file": path})
+
+    # --- Generation ---------------------------------------------------------
+
+    def load_generation(self) -> Optional[Dict[str, Any]]:
+        """Return {"actual_output", "generation_stats"} of a previous attempt, if any."""
+        generation = self._read_json("generation.json")
+        if generation is not None:
+            self.restored["generation"] = True
+        return generation
+
+    def save_generation(self, actual_output: str, generation_stats: Dict[str, Any]):
+        self._write_json("generation.json", {
+            "actual_output": actual_output,
+            "generation_stats": generation_stats
+        })
+
+    # --- TALE ---------------------------------------------------------------
+
+    def load_tale(self) -> Optional[Dict[str, Any]]:
+        """Return the TALE state after the last completed iteration of a previous attempt, if any."""
+        state = self._read_json("tale.json")
+        if state is not None:
+            self.restored["tale_iterations"] = state.get("iteration", 0)
+        return state
+
+    def save_tale(self, state: Dict[str, Any]):
+        self._write_json("tale.json", state)
+
+    # --- Judge journal ------------------------------------------------------
+
+    def _load_journal(self):
+        path = self._path("judge_journal.jsonl")
+        if not self._is_fresh(path):
+            return
+        try:
+            with open(path, "rb+") as f:
+                end = 0
+                for line in f:
+                    try:
+                        if not line.endswith(b"\n"):
+                            raise ValueError("Unterminated journal line")
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A line torn by a crash mid-write ends the usable journal;
+                        # cut it off, or the next entry would be appended to it
+                        f.truncate(end)
+                        break
+                    self._journal[(entry["key"], entry["occurrence"])] = entry
+                    end += len(line)
+        except OSError as e:
+            eval_logger.log_error("checkpoint_store", f"Failed to read judge journal: {e}", {"file": path})
+
+    def replay_judge(self, prompt: str) -> Tuple[Tuple[str, int], Optional[Dict[str, Any]]]:
+        """
+        Look up the journaled judge response for the next occurrence of a prompt.
+
+        Identical prompts are numbered in call order, so a DAG that asks the
+        same question twice replays both answers.
+
+        Returns:
+            tuple: (journal slot to pass to record_judge(), {"response", "usage"} or
+                   None if this call was not completed by a previous attempt)
+        """
+        key = _prompt_key(prompt)
+        with self._lock:
+            occurrence = self._occurrences.get(key, 0)
+            self._occurrences[key] = occurrence + 1
+            entry = self._journal.get((key, occurrence))
+            if entry is None:
+                return (key, occurrence), None
+            self.replayed_judge_calls += 1
+            return (key, occurrence), {"response": entry["response"], "usage": entry.get("usage")}
+
+    def record_judge(self, slot: Tuple[str, int], response: str, usage: Optional[Dict[str, Any]] = None):
+        """Append a completed judge call to the journal."""
+        key, occurrence = slot
+        entry = {"key": key, "occurrence": occurrence, "response": response, "usage": usage}
+        with self._lock:
+            self._journal[slot] = entry
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                with open(self._path("judge_journal.jsonl"), "a", encoding="utf-8") as f:
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            except OSError as e:
+                eval_logger.log_error("checkpoint_store", f"Failed to append to judge journal: {e}")
+
+    # --- Lifecycle ----------------------------------------------------------
+
+    def summary(self) -> Dict[str, Any]:
+        """Describe what was resumed from a previous attempt."""
+        return {
+            "fingerprint": self.fingerprint,
+            "resumed": bool(self.restored["generation"] or self.restored["tale_iterations"]
+                            or self.replayed_judge_calls),
+            "generation_restored": self.restored["generation"],
+            "tale_iterations_restored": self.restored["tale_iterations"],
+            "replayed_judge_calls": self.replayed_judge_calls
+        }
+
+    def discard(self):
+        """Remove the checkpoint after the evaluation succeeded."""
+        shutil.rmtree(self.directory, ignore_errors=True)
+        if self._lock_file is not None:
+            # Still held: an attempt waiting for it notices the removal and locks a new file
+            try:
+                os.remove(self._lock_file.name)
+            except OSError:
+                pass
+
+    def close(self):
+        """Release the checkpoint to the next attempt; idempotent."""
+        lock_file, self._lock_file = self._lock_file, None
+        if lock_file is not None:
+            lock_file.close()
+
+
+class CheckpointStore:
+    """File based store of evaluation checkpoints."""
+
+    def __init__(self, checkpoint_dir: str = "/app/cache/checkpoints", ttl_hours: float = 24.0):
+        self.checkpoint_dir = checkpoint_dir
+        self.ttl_seconds = ttl_hours * 3600
+
+    def fingerprint(self, **parts: Any) -> str:
+        """Build the fingerprint of an evaluation from JSON serializable parts."""
+        return hashlib.md5(json.dumps(parts, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+    def _lock_path(self, fingerprint: str) -> str:
+        return os.path.join(self.checkpoint_dir, f"{fingerprint}.lock")
+
+    def _lock(self, fingerprint: str, cancellation: Optional[CancellationToken]) -> Optional[IO]:
+        """
+        Take the exclusive lock of a fingerprint, waiting for an attempt holding it.
+
+        Returns:
+            The open lock file, or None if it cannot be created (the attempt then
+            runs unlocked, as writing its checkpoint fails as well)
+
+        Raises:
+            EvaluationCancelled: The evaluation was cancelled while waiting
+        """
+        path = self._lock_path(fingerprint)
+        waited = False
+        while True:
+            try:
+                os.makedirs(self.checkpoint_dir, exist_ok=True)
+                lock_file = open(path, "a")
+            except OSError as e:
+                eval_logger.log_error("checkpoint_store", f"Failed to open checkpoint lock: {e}", {"file": path})
+                return None
+            try:
+                while True:
+                    try:
+                        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        break
+                    except BlockingIOError:
+                        if not waited:
+                            waited = True
+                            eval_logger.info("checkpoint_store", "Waiting for the running attempt of this evaluation", {
+                                "fingerprint": fingerprint
+                            })
+                        if cancellation is not None:
+                            cancellation.sleep(LOCK_POLL_SECONDS)
+                        else:
+                            time.sleep(LOCK_POLL_SECONDS)
+                # The holder may have removed the file (discard, sweep) before releasing it
+                try:
+                    if os.stat(path).st_ino == os.fstat(lock_file.fileno()).st_ino:
+                        return lock_file
+                except FileNotFoundError:
+                    pass
+            except BaseException:
+                lock_file.close()
+                raise
+            lock_file.close()
+
+    def open(self, fingerprint: str, resume: bool = True,
+             cancellation: Optional[CancellationToken] = None) -> Checkpoint:
+        """
+        Open the checkpoint of a fingerprint, loading what a previous attempt left.
+        Waits while another attempt of the evaluation holds it; close() releases it.
+
+        Args:
+            resume: False discards what a previous attempt left, so the evaluation starts over
+            cancellation: Token of the evaluation, ending the wait when it is cancelled
+
+        Raises:
+            EvaluationCancelled: The evaluation was cancelled while waiting
+        """
+        lock_file = self._lock(fingerprint, cancellation)
+        directory = os.path.join(self.checkpoint_dir, fingerprint)
+        if not resume:
+            shutil.rmtree(directory, ignore_errors=True)
+        return Checkpoint(directory, fingerprint, self.ttl_seconds, lock_file)
+
+    def _remove_unlocked(self, fingerprint: str) -> bool:
+        """Remove the checkpoint and lock file of a fingerprint unless an attempt holds it."""
+        path = self._lock_path(fingerprint)
+        try:
+            with open(path, "a") as lock_file:
+                try:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    return False
+                shutil.rmtree(os.path.join(self.checkpoint_dir, fingerprint), ignore_errors=True)
+                os.remove(path)
+                return True
+        except OSError:
+            return False
+
+    def sweep(self) -> Dict[str, Any]:
+        """
+        Remove checkpoints (and lock files) not written for longer than the time to
+        live, which no attempt holds.
+
+        Returns:
+            dict: Number of removed checkpoints
+        """
+        now = time.time()
+        stale = set()
+        try:
+            with os.scandir(self.checkpoint_dir) as scanned:
+                for item in scanned:
+                    try:
+                        if item.is_dir(follow_symlinks=False):
+                            # Last written file of the checkpoint
+                            newest = max([item.stat().st_mtime] + [
+                                child.stat().st_mtime for child in os.scandir(item.path)])
+                            fingerprint = item.name
+                        elif item.name.endswith(".lock"):
+                            newest = item.stat().st_mtime
+                            fingerprint = item.name[:-len(".lock")]
+                            if os.path.isdir(os.path.join(self.checkpoint_dir, fingerprint)):
+                                continue
+                        else:
+                            continue
+                    except OSError:
+                        # Removed while scanning
+                        continue
+                    if now - newest > self.ttl_seconds:
+                        stale.add(fingerprint)
+        except FileNotFoundError:
+            pass
+        removed = sum(1 for fingerprint in stale if self._remove_unlocked(fingerprint))
+        if removed:
+            eval_logger.info("checkpoint_store", "Removed expired checkpoints", {"removed": removed})
+        return {"removed": removed}
+
+
+# Global checkpoint store instance
+checkpoint_store = CheckpointStore(
+    checkpoint_dir=os.environ.get("CHECKPOINT_DIR", "/app/cache/checkpoints"),
+    ttl_hours=float(os.environ.get("CHECKPOINT_TTL_HOURS", "24"))
+)
@@ -0,0 +1,285 @@
+"""
+Adaptive per-provider concurrency control.
+
+Calls to model providers (the model under test and the judge) queue on a
+limiter keyed by (base_url, model) instead of all hitting the provider at
+once. The number of calls allowed in flight follows AIMD:
+
+    - every successful call with normal latency raises the limit additively
+      (by one per window of `limit` calls),
+    - a 429 halves the limit and pauses the provider for its Retry-After,
+    - a 5xx or connection failure cuts the limit by a quarter,
+    - a call much slower than the running average trims it by 10%.
+
+Rate limit headers (x-ratelimit-remaining-requests/-tokens with their reset
+times) pause the provider before it starts answering 429. Throughput then
+tracks the real capacity of the provider instead of swinging between overload
+and idle. Rejected calls are retried by the caller's retry policy and queue on
+the limiter again, waiting out any pause. Waiting calls are served by the
+priority class of their evaluation: a bulk call only takes a free slot while no
+interactive call is waiting for the same provider.
+
+Both limits are those of the whole service; with several workers each worker
+limits each provider to its share (see shared_state.per_worker).
+
+Configuration (environment variables):
+    PROVIDER_INITIAL_CONCURRENCY     Limit of a provider seen for the first time (default: 4)
+    PROVIDER_MAX_CONCURRENCY         Upper bound of the limit (default: 32)
+    PROVIDER_LATENCY_TOLERANCE       Latency / average ratio treated as congestion (default: 3.0)
+"""
+
+import os
+import re
+import time
+import threading
+from contextlib import contextmanager
+from typing import Dict, Tuple, Optional, Mapping, Any
+from eval_logger import eval_logger
+from service_metrics import provider_concurrency_limit, provider_in_flight, provider_throttled
+from tracing import span
+from cancellation import CancellationToken
+from scheduler import priority_rank
+from shared_state import per_worker
+
+
+_CANCELLATION_POLL_SECONDS = 0.5
+_DURATION_PART_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+
+
+def parse_reset_duration(value: Optional[str]) -> Optional[float]:
+    """Parse rate limit reset values like "1s", "6m0s", "250ms" or "12" into seconds."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    parts = _DURATION_PART_RE.findall(value)
+    if not parts:
+        return None
+    factors = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+    return sum(float(amount) * factors[unit] for amount, unit in parts)
+
+
+def pause_from_headers(status_code: Optional[int], headers: Optional[Mapping[str, str]]) -> Optional[float]:
+    """Return how long a provider asked us to wait, based on Retry-After and rate limit headers."""
+    if not headers:
+        return None
+    headers = {key.lower(): value for key, value in headers.items()}
+
+    if status_code == 429 or status_code == 503:
+        retry_after = parse_reset_duration(headers.get("retry-after-ms"))
+        if retry_after is not None:
+            return retry_after / 1000
+        retry_after = parse_reset_duration(headers.get("retry-after"))
+        if retry_after is not None:
+            return retry_after
+
+    pauses = []
+    for kind in ("requests", "tokens"):
+        remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+        if remaining is not None and remaining.strip() in ("0", "0.0"):
+            reset = parse_reset_duration(headers.get(f"x-ratelimit-reset-{kind}"))
+            if reset is not None:
+                pauses.append(reset)
+    return max(pauses) if pauses else None
+
+
+class AdaptiveLimiter:
+    """AIMD concurrency limit of one (base_url, model) pair. Thread-safe."""
+
+    def __init__(self, base_url: str, model: str, initial_limit: float, max_limit: float,
+                 latency_tolerance: float):
+        self.base_url = base_url
+        self.model = model
+        self.limit = float(initial_limit)
+        self.max_limit = float(max_limit)
+        self.latency_tolerance = latency_tolerance
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.average_latency: Optional[float] = None
+        self.last_decrease_at = 0.0
+        # Calls waiting for a slot by priority rank
+        self.waiting: Dict[int, int] = {}
+        self._condition = threading.Condition()
+
+    def acquire(self, cancellation: Optional[CancellationToken] = None, rank: int = 0):
+        """
+        Block until a call may start. Calls of a more urgent priority rank go first.
+
+        Raises:
+            EvaluationCancelled: The evaluation was cancelled while waiting
+        """
+        with self._condition:
+            self.waiting[rank] = self.waiting.get(rank, 0) + 1
+            try:
+                while True:
+                    if cancellation is not None:
+                        cancellation.check()
+                    pause = self.paused_until - time.monotonic()
+                    if pause <= 0 and self.in_flight < max(1, int(self.limit)) and \
+                            not any(count for waiting_rank, count in self.waiting.items() if waiting_rank < rank):
+                        self.in_flight += 1
+                        return
+                    timeout = pause if pause > 0 else None
+                    if cancellation is not None:
+                        # Wake up regularly to notice a cancellation
+                        timeout = min(timeout or _CANCELLATION_POLL_SECONDS, _CANCELLATION_POLL_SECONDS)
+                    self._condition.wait(timeout=timeout)
+            finally:
+                self.waiting[rank] -= 1
+                # Less urgent calls may have been held back by this one
+                self._condition.notify_all()
+
+    def release(self, signal: str, latency: Optional[float] = None, pause: Optional[float] = None):
+        """
+        Finish a call and adapt the limit.
+
+        Args:
+            signal: "success", "rate_limited", "server_error", "error" or "neutral"
+            latency: Seconds until the provider answered (only used for successes)
+            pause: Seconds the provider asked us to wait before the next call
+        """
+        with self._condition:
+            self.in_flight -= 1
+            previous_limit = self.limit
+
+            if signal == "rate_limited":
+                self._decrease(0.5)
+            elif signal in ("server_error", "error"):
+                self._decrease(0.75)
+            elif signal == "success" and latency is not None:
+                if self.average_latency is not None and latency > self.average_latency * self.latency_tolerance:
+                    self._decrease(0.9)
+                else:
+                    self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+                self.average_latency = latency if self.average_latency is None else \
+                    0.9 * self.average_latency + 0.1 * latency
+
+            if pause:
+                self.paused_until = max(self.paused_until, time.monotonic() + pause)
+            self._condition.notify_all()
+
+        if signal in ("rate_limited", "server_error", "error") or pause:
+            provider_throttled.inc(provider=self.base_url, model=self.model,
+                                   signal=signal if signal != "success" else "rate_limit_headers")
+            eval_logger.info("concurrency_limiter", "Provider signalled overload, adapting concurrency", {
+                "provider": self.base_url,
+                "model": self.model,
+                "signal": signal,
+                "previous_limit": round(previous_limit, 2),
+                "limit": round(self.limit, 2),
+                "pause_seconds": round(pause, 2) if pause else None
+            })
+
+
+    def _decrease(self, factor: float):
+        # Calls in flight during an overload all fail together; react once per
+        # round trip instead of collapsing the limit once per failed call
+        now = time.monotonic()
+        if now - self.last_decrease_at < max(self.average_latency or 0.0, 1.0):
+            return
+        self.last_decrease_at = now
+        self.limit = max(1.0, self.limit * factor)
+
+
+class ProviderSlot:
+    """A reserved call slot; report the outcome with record() before leaving the with block."""
+
+    def __init__(self, started: float):
+        self.started = started
+        self.signal: Optional[str] = None
+        self.latency: Optional[float] = None
+        self.pause: Optional[float] = None
+
+    def record(self, status_code: Optional[int], headers: Optional[Mapping[str, str]] = None):
+        """Record the provider's answer (HTTP status and headers) of this call."""
+        self.latency = time.perf_counter() - self.started
+        self.pause = pause_from_headers(status_code, headers)
+        if status_code == 429:
+            self.signal = "rate_limited"
+        elif status_code is not None and status_code >= 500:
+            self.signal = "server_error"
+        elif status_code is not None and status_code < 400:
+            self.signal = "success"
+        else:
+            # Other client errors say nothing about the provider's capacity
+            self.signal = "neutral"
+
+
+class ProviderLimiters:
+    """Registry of the adaptive limiters of all providers."""
+
+    def __init__(self, initial_limit: float = 4, max_limit: float = 32, latency_tolerance: float = 3.0):
+        self.initial_limit = initial_limit
+        self.max_limit = max_limit
+        self.latency_tolerance = latency_tolerance
+        self._lock = threading.Lock()
+        self._limiters: Dict[Tuple[str, str], AdaptiveLimiter] = {}
+
+    def limiter(self, base_url: str, model: str) -> AdaptiveLimiter:
+        key = ((base_url or "").rstrip("/"), model or "")
+        with self._lock:
+            limiter = self._limiters.get(key)
+            if limiter is None:
+                limiter = AdaptiveLimiter(key[0], key[1], self.initial_limit, self.max_limit,
+                                          self.latency_tolerance)
+                self._limiters[key] = limiter
+            return limiter
+
+    @contextmanager
+    def slot(self, base_url: str, model: str, cancellation: Optional[CancellationToken] = None,
+             priority: Optional[str] = None):
+        """
+        Hold one concurrency slot of the provider for the with block.
+
+        Exceptions leaving the block count as errors unless record() was called.
+        Waiting for the slot stops with EvaluationCancelled when the cancellation
+        token is cancelled. Calls of evaluations with a more urgent priority class
+        are given free slots first.
+        """
+        limiter = self.limiter(base_url, model)
+        with span("provider_queue", provider=limiter.base_url, model=limiter.model, limit=round(limiter.limit, 2),
+                  priority=priority):
+            limiter.acquire(cancellation, priority_rank(priority) if priority is not None else 0)
+        slot = ProviderSlot(time.perf_counter())
+        try:
+            yield slot
+        except BaseException:
+            if slot.signal is None:
+                slot.signal = "error"
+            raise
+        finally:
+            limiter.release(slot.signal or "success",
+                            slot.latency if slot.latency is not None else time.perf_counter() - slot.started,
+                            slot.pause)
+
+    def snapshot(self) -> Dict[Tuple[str, str], Dict[str, Any]]:
+        """Return the state of all limiters keyed by (base_url, model)."""
+        with self._lock:
+            limiters = list(self._limiters.values())
+        return {
+            (limiter.base_url, limiter.model): {
+                "limit": round(limiter.limit, 2),
+                "in_flight": limiter.in_flight,
+                "paused_for_seconds": round(max(0.0, limiter.paused_until - time.monotonic()), 1),
+                "average_latency_ms": round(limiter.average_latency * 1000, 1) if limiter.average_latency else None
+            }
+            for limiter in limiters
+        }
+
+
+# Global provider limiters instance
+provider_limiters = ProviderLimiters(
+    initial_limit=per_worker(float(os.environ.get("PROVIDER_INITIAL_CONCURRENCY", "4"))),
+    max_limit=per_worker(float(os.environ.get("PROVIDER_MAX_CONCURRENCY", "32"))),
+    latency_tolerance=float(os.environ.get("PROVIDER_LATENCY_TOLERANCE", "3.0"))
+)
+
+provider_concurrency_limit.set_callback(lambda: {
+    key: state["limit"] for key, state in provider_limiters.snapshot().items()
+})
+provider_in_flight.set_callback(lambda: {
+    key: state["in_flight"] for key, state in provider_limiters.snapshot().items()
+})
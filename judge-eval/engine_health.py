@@ -0,0 +1,250 @@
+"""
+Process-wide search engine health tracking for TALE.
+
+SearXNG reports the engines that failed or timed out for a search in its
+"unresponsive_engines" field. Without shared state every evaluation asks the
+same failing engines again and waits for their timeouts. The EngineHealthBoard
+keeps a rolling window of outcomes per engine and puts a circuit breaker in
+front of each one:
+
+    closed     Engine is used normally.
+    open       Engine failed repeatedly and is left out of searches until its
+               cooldown expires. The cooldown doubles with every failed probe.
+    half_open  Cooldown expired; one search may probe the engine. Success
+               closes the circuit, failure opens it again.
+
+SearXNG does not report per-engine latency, so the latency of the whole search
+request is recorded for each engine that answered.
+
+Configuration (environment variables):
+    TALE_ENGINE_WINDOW                 Outcomes kept per engine (default: 20)
+    TALE_ENGINE_FAILURE_RATE           Failure rate that opens the circuit (default: 0.5)
+    TALE_ENGINE_MIN_SAMPLES            Outcomes required before the failure rate applies (default: 5)
+    TALE_ENGINE_CONSECUTIVE_FAILURES   Consecutive failures that open the circuit (default: 3)
+    TALE_ENGINE_COOLDOWN_SECONDS       Initial open duration (default: 30)
+    TALE_ENGINE_MAX_COOLDOWN_SECONDS   Upper bound for the open duration (default: 600)
+"""
+
+import os
+import time
+import threading
+from collections import deque
+from typing import Dict, Any, List, Tuple, Optional
+from eval_logger import eval_logger
+from service_metrics import tale_engine_state, tale_engine_success_rate
+
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Numeric encoding of the circuit state for the metrics gauge
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class EngineHealth:
+    """Rolling outcome window and circuit state of one engine."""
+
+    def __init__(self, name: str, window: int):
+        self.name = name
+        self.outcomes = deque(maxlen=window)  # (success, latency_ms)
+        self.consecutive_failures = 0
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.cooldown = 0.0
+        self.probe_started_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    @property
+    def success_rate(self) -> Optional[float]:
+        if not self.outcomes:
+            return None
+        return sum(1 for success, _ in self.outcomes if success) / len(self.outcomes)
+
+    @property
+    def average_latency_ms(self) -> Optional[float]:
+        latencies = [latency for success, latency in self.outcomes if success and latency is not None]
+        if not latencies:
+            return None
+        return round(sum(latencies) / len(latencies), 1)
+
+
+class EngineHealthBoard:
+    """
+    Shared health scoreboard and circuit breakers of all search engines. Thread-safe.
+
+    Args:
+        window: Number of outcomes kept per engine
+        failure_rate: Failure rate over the window that opens the circuit
+        min_samples: Outcomes required before the failure rate is considered
+        consecutive_failures: Consecutive failures that open the circuit
+        cooldown_seconds: Initial time an open circuit stays open
+        max_cooldown_seconds: Upper bound for the cooldown after repeated failed probes
+    """
+
+    def __init__(self, window: int = 20, failure_rate: float = 0.5, min_samples: int = 5,
+                 consecutive_failures: int = 3, cooldown_seconds: float = 30.0,
+                 max_cooldown_seconds: float = 600.0):
+        self.window = window
+        self.failure_rate = failure_rate
+        self.min_samples = min_samples
+        self.consecutive_failures = consecutive_failures
+        self.cooldown_seconds = cooldown_seconds
+        self.max_cooldown_seconds = max_cooldown_seconds
+        self._lock = threading.Lock()
+        self._engines: Dict[str, EngineHealth] = {}
+
+    def _engine(self, name: str) -> EngineHealth:
+        engine = self._engines.get(name)
+        if engine is None:
+            engine = EngineHealth(name, self.window)
+            self._engines[name] = engine
+        return engine
+
+    def route(self, engines: List[str]) -> Tuple[List[str], List[str]]:
+        """
+        Pick the engines a search should use.
+
+        Engines with a closed circuit are always used. An engine whose cooldown
+        expired is used as the single probe of its half-open circuit. If every
+        requested engine is open, all of them are used anyway, since a search
+        without engines cannot succeed.
+
+        Returns:
+            tuple: (engines to use, engines skipped because their circuit is open)
+        """
+        now = time.monotonic()
+        selected = []
+        skipped = []
+        with self._lock:
+            for name in engines:
+                engine = self._engine(name)
+                if engine.state == OPEN and now - engine.opened_at >= engine.cooldown:
+                    engine.state = HALF_OPEN
+                    engine.probe_started_at = None
+
+                if engine.state == CLOSED:
+                    selected.append(name)
+                elif engine.state == HALF_OPEN and (engine.probe_started_at is None
+                                                    or now - engine.probe_started_at >= engine.cooldown):
+                    # Only one probe at a time; a probe that never reported back is replaced after a cooldown
+                    engine.probe_started_at = now
+                    selected.append(name)
+                else:
+                    skipped.append(name)
+
+        if not selected:
+            return list(engines), []
+
+        if skipped:
+            eval_logger.info("engine_health", "Skipping search engines with open circuit", {
+                "selected_engines": selected,
+                "skipped_engines": skipped
+            })
+        return selected, skipped
+
+    def record_search(self, engines: List[str], unresponsive_engines: List[Any], latency_ms: float):
+        """
+        Record the outcome of a successful SearXNG request.
+
+        Args:
+            engines: Engines the search was sent to
+            unresponsive_engines: The "unresponsive_engines" field of the SearXNG response
+            latency_ms: Duration of the search request
+        """
+        errors = {}
+        for engine_info in unresponsive_engines or []:
+            if isinstance(engine_info, (list, tuple)) and len(engine_info) >= 2:
+                errors[str(engine_info[0])] = str(engine_info[1])
+            else:
+                errors[str(engine_info)] = "unknown error"
+
+        for name in set(engines) | set(errors):
+            if name in errors:
+                self.record_failure(name, errors[name])
+            else:
+                self.record_success(name, latency_ms)
+
+    def record_success(self, name: str, latency_ms: Optional[float] = None):
+        with self._lock:
+            engine = self._engine(name)
+            engine.outcomes.append((True, latency_ms))
+            engine.consecutive_failures = 0
+            if engine.state != CLOSED:
+                eval_logger.info("engine_health", "Search engine recovered, closing circuit", {
+                    "engine": name,
+                    "previous_state": engine.state
+                })
+            engine.state = CLOSED
+            engine.cooldown = 0.0
+            engine.probe_started_at = None
+
+    def record_failure(self, name: str, error: str = ""):
+        with self._lock:
+            engine = self._engine(name)
+            engine.outcomes.append((False, None))
+            engine.consecutive_failures += 1
+            engine.last_error = error
+
+            if engine.state == HALF_OPEN:
+                # Failed probe: back off longer before the next one
+                self._open(engine, min(max(engine.cooldown, self.cooldown_seconds) * 2, self.max_cooldown_seconds))
+            elif engine.state == CLOSED and self._should_open(engine):
+                self._open(engine, self.cooldown_seconds)
+
+    def _should_open(self, engine: EngineHealth) -> bool:
+        if engine.consecutive_failures >= self.consecutive_failures:
+            return True
+        if len(engine.outcomes) >= self.min_samples:
+            return 1.0 - engine.success_rate >= self.failure_rate
+        return False
+
+    def _open(self, engine: EngineHealth, cooldown: float):
+        engine.state = OPEN
+        engine.opened_at = time.monotonic()
+        engine.cooldown = cooldown
+        engine.probe_started_at = None
+        eval_logger.info("engine_health", "Opening circuit for search engine", {
+            "engine": engine.name,
+            "cooldown_seconds": cooldown,
+            "consecutive_failures": engine.consecutive_failures,
+            "success_rate": engine.success_rate,
+            "last_error": engine.last_error
+        })
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Return the health of all known engines as JSON serializable data."""
+        now = time.monotonic()
+        with self._lock:
+            return {
+                name: {
+                    "state": engine.state,
+                    "success_rate": engine.success_rate,
+                    "average_latency_ms": engine.average_latency_ms,
+                    "samples": len(engine.outcomes),
+                    "consecutive_failures": engine.consecutive_failures,
+                    "cooldown_remaining_seconds": round(max(0.0, engine.cooldown - (now - engine.opened_at)), 1)
+                    if engine.state == OPEN else 0.0,
+                    "last_error": engine.last_error
+                }
+                for name, engine in self._engines.items()
+            }
+
+
+# Global engine health instance
+engine_health = EngineHealthBoard(
+    window=int(os.environ.get("TALE_ENGINE_WINDOW", "20")),
+    failure_rate=float(os.environ.get("TALE_ENGINE_FAILURE_RATE", "0.5")),
+    min_samples=int(os.environ.get("TALE_ENGINE_MIN_SAMPLES", "5")),
+    consecutive_failures=int(os.environ.get("TALE_ENGINE_CONSECUTIVE_FAILURES", "3")),
+    cooldown_seconds=float(os.environ.get("TALE_ENGINE_COOLDOWN_SECONDS", "30")),
+    max_cooldown_seconds=float(os.environ.get("TALE_ENGINE_MAX_COOLDOWN_SECONDS", "600"))
+)
+
+tale_engine_state.set_callback(lambda: {
+    (name,): STATE_VALUES[health["state"]] for name, health in engine_health.snapshot().items()
+})
+tale_engine_success_rate.set_callback(lambda: {
+    (name,): health["success_rate"] for name, health in engine_health.snapshot().items()
+    if health["success_rate"] is not None
+})
@@ -0,0 +1,80 @@
+"""
+Per-evaluation context.
+
+Evaluations run concurrently in FastAPI's threadpool, so state that belongs to
+a single evaluation (token usage, timing spans, ...) cannot live on module
+level singletons. It is kept on an EvaluationContext that is bound to a
+context variable for the duration of the evaluation. Context variables are copied into the asyncio
+tasks DeepEval creates for async metrics, so judge calls made from inside
+DeepEval still see the context of the evaluation they belong to.
+"""
+
+import contextvars
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Optional, Callable, Dict, Any
+from usage_tracker import UsageTracker
+from tracing import Tracer
+from retry_policy import RetryStats
+from checkpoint_store import Checkpoint
+from call_trace import CallTrace
+from cancellation import CancellationToken
+from scheduler import INTERACTIVE
+
+
+@dataclass
+class EvaluationContext:
+    """State shared by all components taking part in one evaluation."""
+    usage: UsageTracker = field(default_factory=UsageTracker)
+    tracer: Tracer = field(default_factory=Tracer)
+    retries: RetryStats = field(default_factory=RetryStats)
+    # Deadline of the evaluation; cancelled on expiry or when the client goes away
+    cancellation: CancellationToken = field(default_factory=CancellationToken)
+    # Priority class; orders the evaluation's calls waiting for provider slots
+    priority: str = INTERACTIVE
+    # Durable progress of the evaluation, None when checkpointing is not used
+    checkpoint: Optional[Checkpoint] = None
+    # Records or replays the external calls of the evaluation, None when tracing is off
+    call_trace: Optional[CallTrace] = None
+    # Receives progress events (name, data), e.g. to update an evaluation job
+    progress: Optional[Callable[[str, Dict[str, Any]], None]] = None
+
+
+_current_context: contextvars.ContextVar[Optional[EvaluationContext]] = contextvars.ContextVar(
+    "evaluation_context", default=None
+)
+
+
+def current_context() -> Optional[EvaluationContext]:
+    """Return the context of the running evaluation, or None outside of an evaluation."""
+    return _current_context.get()
+
+
+def report_progress(event: str, **data):
+    """Report a progress event of the running evaluation to its listener, if any."""
+    context = _current_context.get()
+    if context is None or context.progress is None:
+        return
+    try:
+        context.progress(event, data)
+    except Exception:
+        # Progress reporting must never fail an evaluation
+        pass
+
+
+def check_cancelled():
+    """Raise EvaluationCancelled if the running evaluation was cancelled or ran past its deadline."""
+    context = _current_context.get()
+    if context is not None:
+        context.cancellation.check()
+
+
+@contextmanager
+def evaluation_context(context: Optional[EvaluationContext] = None):
+    """Bind an evaluation context for the duration of the with block."""
+    context = context or EvaluationContext()
+    token = _current_context.set(context)
+    try:
+        yield context
+    finally:
+        _current_context.reset(token)
@@ -3,9 +3,14 @@ Global evaluation logging system.
 
 This module provides a thread-safe global logging system to capture
 decision-making, parameters, and conversations during evaluation.
+
+Each evaluation gets its own log session, bound to the calling context by
+reset(). Concurrent evaluations (threadpool requests and background jobs)
+therefore never see each other's entries.
 """
 
 import threading
+import contextvars
 import time
 import sys
 import json
@@ -24,6 +29,16 @@ class LogEntry:
     data: Optional[Dict[str, Any]] = None
 
 
+@dataclass
+class LogSession:
+    """Log entries of one evaluation."""
+    request_id: str
+    logs: List[LogEntry] = field(default_factory=list)
+
+
+_current_session: contextvars.ContextVar[Optional[LogSession]] = contextvars.ContextVar("eval_log_session", default=None)
+
+
 class EvalLogger:
     """
     Thread-safe global logger for evaluation processes.
@@ -37,25 +52,25 @@ class EvalLogger:
     
     def __init__(self, enable_terminal_output: bool = True, verbose_terminal: bool = False):
         self._lock = threading.Lock()
-        self._logs: List[LogEntry] = []
-        self._request_id: Optional[str] = None
+        # Entries logged outside of any evaluation (startup, background threads)
+        self._fallback_session = LogSession(request_id="global")
         self._enable_terminal_output = enable_terminal_output
         self._verbose_terminal = verbose_terminal
         
     def reset(self, request_id: Optional[str] = None):
-        """Reset logs for a new evaluation request."""
+        """Start a new log session for an evaluation request, bound to the calling context."""
+        session = LogSession(request_id=request_id or f"eval_{int(time.time() * 1000)}")
+        _current_session.set(session)
         with self._lock:
-            self._logs.clear()
-            self._request_id = request_id or f"eval_{int(time.time() * 1000)}"
             # Add initial log entry directly to avoid recursive lock
             entry = LogEntry(
                 timestamp=datetime.now(),
                 level="info",
                 component="eval_logger",
-                message=f"Started new evaluation session: {self._request_id}",
+                message=f"Started new evaluation session: {session.request_id}",
                 data={}
             )
-            self._logs.append(entry)
+            session.logs.append(entry)
             
             # Also output to terminal for Docker visibility
             self._output_to_terminal(entry)
@@ -124,8 +139,12 @@ class EvalLogger:
             if entry.data:
                 print(f"[LOG ERROR] Raw data: {entry.data}", flush=True)
     
+    def _session(self) -> LogSession:
+        return _current_session.get() or self._fallback_session
+
     def _add_log(self, level: str, component: str, message: str, data: Optional[Dict[str, Any]] = None):
         """Internal method to add a log entry."""
+        session = self._session()
         with self._lock:
             entry = LogEntry(
                 timestamp=datetime.now(),
@@ -134,7 +153,10 @@ class EvalLogger:
                 message=message,
                 data=data or {}
             )
-            self._logs.append(entry)
+            session.logs.append(entry)
+            if session is self._fallback_session and len(session.logs) > 1000:
+                # Nobody collects these entries, keep only the recent ones
+                del session.logs[:500]
             
             # Also output to terminal for Docker visibility
             self._output_to_terminal(entry)
@@ -180,7 +202,8 @@ class EvalLogger:
         })
     
     def get_logs(self) -> List[Dict[str, Any]]:
-        """Get all logs as a list of dictionaries."""
+        """Get all logs of the current session as a list of dictionaries."""
+        session = self._session()
         with self._lock:
             return [
                 {
@@ -190,7 +213,7 @@ class EvalLogger:
                     "message": entry.message,
                     "data": entry.data
                 }
-                for entry in self._logs
+                for entry in session.logs
             ]
     
     def get_logs_by_level(self, level: str) -> List[Dict[str, Any]]:
@@ -230,7 +253,8 @@ class EvalLogger:
     
     def get_request_id(self) -> Optional[str]:
         """Get the current request ID."""
-        return self._request_id
+        session = _current_session.get()
+        return session.request_id if session is not None else None
 
 
 # Global logger instance
@@ -1,16 +1,32 @@
 from models import Prompt, Metric, ModelInfo
-from deepeval.test_case import LLMTestCase
-from metric_creator import MetricCreator
 from llmrequestor import LlmRequestor
 from eval_logger import eval_logger
-import json
+from eval_context import evaluation_context, current_context, report_progress, check_cancelled
+from usage_tracker import usage_phase, usage_totals
+from tracing import span, otlp_exporter
+from checkpoint_store import checkpoint_store
+from call_trace import call_trace_store
+from cancellation import CancellationToken, EvaluationCancelled
+from scheduler import INTERACTIVE
+from payloads import dumps_str
+from log_store import log_store
 
 class Evaluator:
-    def __init__(self, prompt: Prompt, metric: Metric, model: ModelInfo, system_prompt: str = ""):
+    def __init__(self, prompt: Prompt, metric: Metric, model: ModelInfo, system_prompt: str = "", stream: bool = False,
+                 run_index: int = 1, progress=None, cancellation: CancellationToken = None,
+                 priority: str = INTERACTIVE, log_format: str = "string"):
         self.prompt = prompt
         self.metric = metric
         self.model = model
         self.system_prompt = system_prompt
+        self.stream = stream
+        self.run_index = run_index
+        self.progress = progress
+        self.cancellation = cancellation or CancellationToken()
+        self.priority = priority
+        self.log_format = log_format
+        # What the evaluation completed so far, returned if it is cancelled
+        self.partial_result = {}
         
         # Reset logger for this evaluation
         eval_logger.reset()
@@ -19,16 +35,142 @@ class Evaluator:
             "metric_name": metric.name,
             "metric_type": metric.type,
             "model_name": model.name,
-            "has_system_prompt": bool(system_prompt)
+            "has_system_prompt": bool(system_prompt),
+            "stream": stream
         })
 
+    def _fingerprint(self) -> str:
+        """Identify the evaluation, so a retry of the same request resumes its checkpoint."""
+        return checkpoint_store.fingerprint(
+            prompt_input=self.prompt.input,
+            expected_output=self.prompt.expected_output,
+            prompt_context=self.prompt.context,
+            system_prompt=self.system_prompt,
+            model_name=self.model.name,
+            model_url=self.model.url,
+            metric_type=self.metric.type,
+            metric_name=self.metric.name,
+            metric_definition=self.metric.definition,
+            metric_param=self.metric.param,
+            judge_model_name=self.metric.model.name,
+            judge_model_url=self.metric.model.url,
+            run_index=self.run_index
+        )
+
     def evaluate(self):
+        with evaluation_context() as context:
+            fingerprint = self._fingerprint()
+            context.call_trace = call_trace_store.open(fingerprint)
+            # A recording starts over: calls a resumed checkpoint skipped would be missing from the trace
+            context.checkpoint = checkpoint_store.open(fingerprint, resume=not (
+                context.call_trace is not None and context.call_trace.recording), cancellation=self.cancellation)
+            context.progress = self.progress
+            context.cancellation = self.cancellation
+            context.priority = self.priority
+            try:
+                with context.tracer.start_span("evaluation",
+                                               metric_type=self.metric.type,
+                                               metric_name=self.metric.name,
+                                               model=self.model.name,
+                                               judge_model=self.metric.model.name,
+                                               deadline_seconds=self.cancellation.deadline_seconds,
+                                               priority=self.priority):
+                    result = self._evaluate()
+                context.checkpoint.discard()
+            except EvaluationCancelled as e:
+                # The checkpoint is kept, so a retry resumes where this attempt stopped
+                eval_logger.decision("evaluator", "Evaluation cancelled", {
+                    "reason": e.reason,
+                    "completed": list(self.partial_result.keys()),
+                    "deadline_seconds": self.cancellation.deadline_seconds
+                })
+                e.partial = self._account(context, {
+                    **self.partial_result,
+                    'partial': True,
+                    'cancellation': self.cancellation.to_dict(),
+                    **self._logs()
+                })
+                raise
+            finally:
+                # Released to a retry of this evaluation waiting for it
+                context.checkpoint.close()
+                otlp_exporter.export(context.tracer)
+                if context.call_trace is not None:
+                    context.call_trace.save()
+            
+            result = self._account(context, result)
+        
+        return result
+
+    def _logs(self):
+        """The logs of the evaluation for its result, in the requested log format."""
+        logs = eval_logger.get_logs()
+        if self.log_format == "structured":
+            return {'logs': logs}
+        if self.log_format == "reference":
+            try:
+                return {'logs': None, 'logs_id': log_store.put(logs)}
+            except OSError as e:
+                # The result is still useful with its logs inline
+                eval_logger.log_error("evaluator", f"Failed to store logs, returning them inline: {e}")
+                logs = eval_logger.get_logs()
+        # JSON encoded string, as stored by the site
+        return {'logs': dumps_str(logs)}
+
+    def _account(self, context, result):
+        """Add checkpoint, timing, usage and retry stats to a (partial) result and record the usage."""
+        result['checkpoint'] = context.checkpoint.summary()
+        if result['checkpoint']['resumed']:
+            eval_logger.info("evaluator", "Evaluation resumed from checkpoint", result['checkpoint'])
+        
+        result['timings'] = context.tracer.to_dict()
+        if context.call_trace is not None:
+            result['call_trace'] = context.call_trace.summary()
+        usage = context.usage.summary()
+        result['usage'] = usage
+        result['retries'] = context.retries.summary()
+        usage_totals.add(usage, model_name=self.model.name, judge_model_name=self.metric.model.name)
+        
+        eval_logger.info("evaluator", "Token usage of evaluation", {
+            "model_under_test_tokens": usage["model_under_test"]["total_tokens"],
+            "judge_tokens": usage["judge"]["total_tokens"],
+            "judge_calls": usage["judge"]["calls"],
+            "saved_calls": usage["savings"]["calls"]
+        })
+        return result
+
+    def _evaluate(self):
+        # DeepEval and the metric implementations are loaded by the first
+        # evaluation (or the warm-up), not when the service starts
+        from deepeval.test_case import LLMTestCase
+        from metric_creator import MetricCreator
+
         eval_logger.info("evaluator", "Starting evaluation process")
+        check_cancelled()
         
         # Generate actual output using the model
         eval_logger.info("evaluator", "Requesting LLM response for evaluation")
-        requestor = LlmRequestor(self.prompt, self.model, self.system_prompt)
-        actual_output = requestor.request()
+        checkpoint = current_context().checkpoint
+        generation = checkpoint.load_generation() if checkpoint is not None else None
+        if generation is not None:
+            actual_output = generation["actual_output"]
+            generation_stats = {**generation["generation_stats"], "resumed": True}
+            current_context().usage.record_saving("checkpoint", generation_stats.get("usage"), role="model_under_test")
+            eval_logger.info("evaluator", "Reusing generated output from checkpoint", {
+                "actual_output_length": len(actual_output)
+            })
+        else:
+            with span("generation", model=self.model.name, stream=self.stream):
+                requestor = LlmRequestor(self.prompt, self.model, self.system_prompt, stream=self.stream)
+                actual_output = requestor.request()
+                generation_stats = requestor.generation_stats
+            if checkpoint is not None:
+                checkpoint.save_generation(actual_output, generation_stats)
+        self.partial_result = {'actual_output': actual_output, 'generation': generation_stats}
+        report_progress("generation_completed", partial={
+            "actual_output": actual_output,
+            "generation": generation_stats
+        })
         
         eval_logger.info("evaluator", "Creating test case", {
             "has_expected_output": bool(self.prompt.expected_output),
@@ -47,27 +189,40 @@ class Evaluator:
         
         # Create metric instance and evaluate
         eval_logger.info("evaluator", "Creating metric instance")
-        metric_creator = MetricCreator(self.metric)
-        metric_instance = metric_creator.create_metric()
+        with span("metric_construction", metric_type=self.metric.type):
+            metric_creator = MetricCreator(self.metric)
+            metric_instance = metric_creator.create_metric()
         
+        check_cancelled()
         eval_logger.info("evaluator", "Starting metric measurement")
-        # Measure the test case
-        metric_instance.measure(test_case)
+        report_progress("measure_started", metric_type=self.metric.type)
+        # Measure the test case; judge calls are attributed to the metric type
+        with usage_phase(self.metric.type), span("measure", metric_type=self.metric.type):
+            metric_instance.measure(test_case)
         
+        self.partial_result.update(score=metric_instance.score, reason=metric_instance.reason)
+        report_progress("measure_completed", partial={
+            "score": metric_instance.score,
+            "reason": metric_instance.reason
+        })
         eval_logger.info("evaluator", "Evaluation completed", {
             "score": metric_instance.score,
             "reason_length": len(metric_instance.reason) if metric_instance.reason else 0
         })
         
+        eval_logger.info("evaluator", "Returning evaluation result with logs", {
+            "total_log_entries": len(eval_logger.get_logs())
+        })
+        
         result = {
             'actual_output': actual_output,
             'score': metric_instance.score,
             'reason': metric_instance.reason,
-            'logs': json.dumps(eval_logger.get_logs())  # Convert logs array to JSON string
+            'generation': generation_stats,
+            **self._logs()
         }
-        
-        eval_logger.info("evaluator", "Returning evaluation result with logs", {
-            "total_log_entries": len(eval_logger.get_logs())
-        })
+        if getattr(metric_instance, "evidence_truncated", False):
+            # Scored, but with less evidence than the metric would have collected without a deadline
+            result['evidence_truncated'] = True
         
         return result
\ No newline at end of file
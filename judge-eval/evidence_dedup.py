@@ -0,0 +1,169 @@
+"""
+Evidence de-duplication for TALE.
+
+Search results of later iterations frequently point to pages the evaluation
+already fetched, often with different tracking parameters or a "www." prefix,
+and syndicated or mirrored copies of one article show up under different
+URLs. The EvidenceDeduplicator remembers normalized URLs so pages are never
+fetched twice, and keeps bottom-k MinHash sketches of word shingles so near
+duplicate pages are skipped before the fetch (by their search snippet) or
+dropped after it (by their content).
+"""
+
+import re
+import heapq
+import hashlib
+from typing import List, Optional, Tuple
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+
+# Query parameters that only track the click and never change the page
+TRACKING_PARAMS = {
+    "fbclid", "gclid", "dclid", "msclkid", "mc_cid", "mc_eid", "igshid",
+    "ref", "ref_src", "_hsenc", "_hsmi", "yclid", "spm"
+}
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def normalize_url(url: str) -> str:
+    """
+    Normalize a URL for duplicate detection.
+
+    The scheme is ignored (http and https copies are the same page), host names
+    are lowercased without "www." and default ports, fragments and tracking
+    parameters are dropped, remaining query parameters are sorted and trailing
+    slashes are removed.
+    """
+    if not url:
+        return ""
+    try:
+        parts = urlsplit(url.strip())
+    except ValueError:
+        return url.strip()
+
+    host = (parts.hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    try:
+        port = parts.port
+    except ValueError:
+        port = None
+    if port and port not in (80, 443):
+        host = f"{host}:{port}"
+
+    query = [(key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+             if key.lower() not in TRACKING_PARAMS and not key.lower().startswith("utm_")]
+    path = re.sub(r"/{2,}", "/", parts.path).rstrip("/")
+
+    return urlunsplit(("", host, path, urlencode(sorted(query)), ""))
+
+
+class MinHashSketch:
+    """
+    Bottom-k MinHash sketch of the word shingles of a text.
+
+    Keeps the k smallest shingle hashes, which estimates the Jaccard similarity
+    of two shingle sets with a single hash function.
+    """
+
+    def __init__(self, text: str, shingle_size: int = 5, k: int = 128):
+        words = _WORD_RE.findall(text.lower())
+        if len(words) < shingle_size:
+            shingles = {" ".join(words)} if words else set()
+        else:
+            shingles = {" ".join(words[i:i + shingle_size]) for i in range(len(words) - shingle_size + 1)}
+
+        self.k = k
+        self.shingle_count = len(shingles)
+        self.hashes = frozenset(heapq.nsmallest(k, (
+            int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big")
+            for shingle in shingles
+        )))
+
+    def similarity(self, other: "MinHashSketch") -> float:
+        """Estimate the Jaccard similarity of the two shingle sets."""
+        if not self.hashes or not other.hashes:
+            return 0.0
+        k = min(self.k, other.k)
+        union_sketch = heapq.nsmallest(k, self.hashes | other.hashes)
+        shared = sum(1 for value in union_sketch if value in self.hashes and value in other.hashes)
+        return shared / len(union_sketch)
+
+
+class EvidenceDeduplicator:
+    """
+    Tracks the pages one TALE evaluation has already seen.
+
+    Args:
+        threshold: Estimated Jaccard similarity above which two texts count as near duplicates
+        min_snippet_shingles: Snippets with fewer shingles are too short to judge and never
+            count as duplicates
+    """
+
+    def __init__(self, threshold: float = 0.8, min_snippet_shingles: int = 8):
+        self.threshold = threshold
+        self.min_snippet_shingles = min_snippet_shingles
+        self._seen_urls = set()
+        self._snippets: List[Tuple[str, MinHashSketch]] = []
+        self._contents: List[Tuple[str, MinHashSketch]] = []
+
+    def check_url(self, url: str) -> bool:
+        """
+        Return True if the URL was not seen before.
+
+        URLs only count as seen once mark_seen() was called for them, so a page
+        that failed to fetch is tried again when a later search returns it.
+        """
+        return normalize_url(url) not in self._seen_urls
+
+    def mark_seen(self, url: str):
+        """Remember a fetched URL, so it is not fetched again."""
+        self._seen_urls.add(normalize_url(url))
+
+    def snippet_duplicate_of(self, snippet: Optional[str]) -> Optional[str]:
+        """
+        Compare a search result snippet with the snippets of accepted pages.
+
+        Returns:
+            The URL of the accepted page the snippet duplicates, or None
+        """
+        if not snippet or self.threshold >= 1.0:
+            return None
+        sketch = MinHashSketch(snippet, shingle_size=3)
+        if sketch.shingle_count < self.min_snippet_shingles:
+            return None
+        return self._find_similar(sketch, self._snippets)
+
+    def accept(self, url: str, snippet: Optional[str], content: str,
+               sketch: Optional[MinHashSketch] = None) -> Optional[str]:
+        """
+        Accept fetched page content as evidence unless it duplicates an accepted page.
+
+        Args:
+            sketch: Sketch of the content if it was computed already (see text_processing)
+
+        Returns:
+            The URL of the accepted page the content duplicates, or None if the
+            page was accepted (its snippet and content are then remembered)
+        """
+        if self.threshold >= 1.0:
+            return None
+        if sketch is None:
+            sketch = MinHashSketch(content)
+        duplicate_of = self._find_similar(sketch, self._contents)
+        if duplicate_of is not None:
+            return duplicate_of
+
+        self._contents.append((url, sketch))
+        if snippet:
+            snippet_sketch = MinHashSketch(snippet, shingle_size=3)
+            if snippet_sketch.shingle_count >= self.min_snippet_shingles:
+                self._snippets.append((url, snippet_sketch))
+        return None
+
+    def _find_similar(self, sketch: MinHashSketch, known: List[Tuple[str, MinHashSketch]]) -> Optional[str]:
+        for known_url, known_sketch in known:
+            if sketch.similarity(known_sketch) >= self.threshold:
+                return known_url
+        return None
@@ -0,0 +1,188 @@
+"""
+Local full-text index of TALE evidence.
+
+Pages fetched by TALE used to be discarded when an evaluation finished, so
+benchmarks with many prompts on the same topic searched and scraped the same
+knowledge over and over. Every fetched page is now stored in a SQLite FTS5
+index together with the time it was fetched. TALE consults the index before
+asking SearXNG and only falls back to the web when the local evidence for a
+query scores below its threshold.
+
+Scores are FTS5 BM25 ranks with the sign flipped, so higher is better. They
+depend on the size of the index and the number of query terms, which keeps
+the web the main source while the index is still small.
+
+The index is bounded by the background sweep of cache_maintenance: pages
+older than TALE_EVIDENCE_INDEX_MAX_AGE_HOURS are deleted, then the oldest
+pages beyond TALE_EVIDENCE_INDEX_MAX_PAGES, and the freed pages of the
+database file are returned to the file system (incremental vacuum), so
+neither the file nor the BM25 statistics keep growing.
+
+Configuration (environment variables):
+    TALE_EVIDENCE_INDEX_PATH            SQLite database file (default: /app/cache/evidence_index.sqlite3)
+    TALE_EVIDENCE_INDEX_MAX_AGE_HOURS   Age of pages to delete, 0 for none (default: 720)
+    TALE_EVIDENCE_INDEX_MAX_PAGES       Pages kept, the most recently fetched, 0 for no bound (default: 100000)
+"""
+
+import os
+import re
+import time
+import sqlite3
+import threading
+from typing import List, Dict, Any, Optional
+from eval_logger import eval_logger
+from evidence_dedup import normalize_url
+
+
+_TERM_RE = re.compile(r"\w+", re.UNICODE)
+
+
+class EvidenceIndex:
+    """
+    Persistent BM25 index of fetched page text, shared by all evaluations.
+
+    Each thread uses its own SQLite connection; the database runs in WAL mode
+    so concurrent readers never block the writer. If SQLite lacks FTS5 or the
+    database cannot be opened, the index disables itself and TALE behaves as
+    before.
+    """
+
+    def __init__(self, db_path: str = "/app/cache/evidence_index.sqlite3", max_age_hours: float = 720.0,
+                 max_pages: int = 100000):
+        self.db_path = db_path
+        self.max_age_seconds = max_age_hours * 3600 if max_age_hours > 0 else None
+        self.max_pages = max(0, max_pages)
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._initialized = False
+        self.enabled = True
+
+    def _connection(self) -> Optional[sqlite3.Connection]:
+        if not self.enabled:
+            return None
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            return connection
+
+        try:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            connection = sqlite3.connect(self.db_path, timeout=30)
+            with self._init_lock:
+                if not self._initialized:
+                    # Takes effect when the database is created; see purge()
+                    connection.execute("PRAGMA auto_vacuum=INCREMENTAL")
+                    connection.execute("PRAGMA journal_mode=WAL")
+                    connection.execute(
+                        "CREATE VIRTUAL TABLE IF NOT EXISTS pages USING fts5("
+                        "title, content, url UNINDEXED, url_key UNINDEXED, fetched_at UNINDEXED)"
+                    )
+                    connection.commit()
+                    self._initialized = True
+        except (sqlite3.Error, OSError) as e:
+            self.enabled = False
+            eval_logger.log_error("evidence_index", f"Evidence index disabled: {e}", {
+                "db_path": self.db_path
+            })
+            return None
+
+        self._local.connection = connection
+        return connection
+
+    def add(self, url: str, title: Optional[str], content: str):
+        """Store (or refresh) the text of a fetched page."""
+        connection = self._connection()
+        if connection is None or not content or not content.strip():
+            return
+        url_key = normalize_url(url)
+        try:
+            with connection:
+                connection.execute("DELETE FROM pages WHERE url_key = ?", (url_key,))
+                connection.execute(
+                    "INSERT INTO pages (title, content, url, url_key, fetched_at) VALUES (?, ?, ?, ?, ?)",
+                    (title or "", content, url, url_key, time.time())
+                )
+        except sqlite3.Error as e:
+            eval_logger.log_error("evidence_index", f"Failed to index page: {e}", {"url": url})
+
+    def search(self, query: str, limit: int = 5, max_age_seconds: Optional[float] = None,
+               min_score: float = 0.0) -> List[Dict[str, Any]]:
+        """
+        Return indexed pages matching a query, best first.
+
+        Args:
+            query: Free text search query (any term may match)
+            limit: Maximum number of pages to return
+            max_age_seconds: Ignore pages fetched longer ago than this
+            min_score: Ignore pages scoring below this value
+
+        Returns:
+            List of dicts with url, title, content, score and fetched_at
+        """
+        connection = self._connection()
+        terms = list(dict.fromkeys(term.lower() for term in _TERM_RE.findall(query or "")))
+        if connection is None or not terms:
+            return []
+
+        match = " OR ".join('"' + term.replace('"', '""') + '"' for term in terms)
+        oldest = time.time() - max_age_seconds if max_age_seconds else 0.0
+        try:
+            rows = connection.execute(
+                "SELECT url, title, content, fetched_at, -bm25(pages, 2.0, 1.0) AS score FROM pages "
+                "WHERE pages MATCH ? AND fetched_at >= ? ORDER BY score DESC LIMIT ?",
+                (match, oldest, limit)
+            ).fetchall()
+        except sqlite3.Error as e:
+            eval_logger.log_error("evidence_index", f"Evidence index search failed: {e}", {"query": query})
+            return []
+
+        return [
+            {"url": url, "title": title, "content": content, "fetched_at": fetched_at, "score": round(score, 3)}
+            for url, title, content, fetched_at, score in rows
+            if score >= min_score
+        ]
+
+    def purge(self) -> Dict[str, Any]:
+        """
+        Delete pages beyond the age and size bounds and shrink the database file.
+
+        Returns:
+            dict: Number of deleted ("removed") and remaining pages
+        """
+        connection = self._connection()
+        if connection is None:
+            return {"removed": 0, "enabled": False}
+        try:
+            removed = 0
+            with connection:
+                if self.max_age_seconds is not None:
+                    removed += connection.execute("DELETE FROM pages WHERE fetched_at < ?",
+                                                  (time.time() - self.max_age_seconds,)).rowcount
+                if self.max_pages:
+                    removed += connection.execute(
+                        "DELETE FROM pages WHERE rowid IN "
+                        "(SELECT rowid FROM pages ORDER BY fetched_at DESC LIMIT -1 OFFSET ?)",
+                        (self.max_pages,)).rowcount
+            pages = connection.execute("SELECT count(*) FROM pages").fetchone()[0]
+            if connection.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+                # Databases created before the purge existed: switching to incremental
+                # auto-vacuum takes a full VACUUM, once
+                connection.execute("PRAGMA auto_vacuum=INCREMENTAL")
+                connection.execute("VACUUM")
+            elif removed:
+                connection.execute("PRAGMA incremental_vacuum")
+            # The file only shrinks once the write-ahead log is written back
+            connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        except sqlite3.Error as e:
+            eval_logger.log_error("evidence_index", f"Failed to purge the evidence index: {e}")
+            return {"removed": 0, "error": str(e)}
+        if removed:
+            eval_logger.info("evidence_index", "Purged evidence index", {"removed": removed, "pages": pages})
+        return {"removed": removed, "pages": pages}
+
+
+# Global evidence index instance
+evidence_index = EvidenceIndex(
+    os.environ.get("TALE_EVIDENCE_INDEX_PATH", "/app/cache/evidence_index.sqlite3"),
+    max_age_hours=float(os.environ.get("TALE_EVIDENCE_INDEX_MAX_AGE_HOURS", "720")),
+    max_pages=int(os.environ.get("TALE_EVIDENCE_INDEX_MAX_PAGES", "100000"))
+)
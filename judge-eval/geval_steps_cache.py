@@ -0,0 +1,144 @@
+"""
+Persistent cache for G-Eval evaluation steps.
+
+When a G-Eval metric is defined by criteria only, DeepEval asks the judge to
+derive evaluation steps from that criteria before scoring. The derivation only
+depends on the criteria text, the evaluation params and the judge model, so it
+is stored on disk after the first measurement and handed to every later G-Eval
+instance with the same definition. This skips one judge round trip per test
+case and keeps criteria-based scores consistent across a benchmark.
+"""
+
+import os
+import json
+import hashlib
+from datetime import datetime
+from typing import List, Optional, Dict, Any
+from deepeval.metrics import GEval
+from models import ModelInfo
+from eval_logger import eval_logger
+from eval_context import current_context
+from usage_tracker import usage_phase, current_phase
+from tiered_cache import TieredCache, MEMORY_MAX_ENTRIES
+
+
+class GEvalStepsCache:
+    """
+    File based store of derived G-Eval evaluation steps, with a memory tier per worker.
+
+    Entries are write-once: the first derivation for a key is kept and reused,
+    later derivations for the same key (e.g. from concurrent workers that
+    missed the cache at the same time) never replace it.
+    """
+
+    def __init__(self, cache_dir: str = "/app/cache/geval_steps", memory_entries: int = 512):
+        self.cache_dir = cache_dir
+        self._store = TieredCache("geval_steps", cache_dir, memory_entries=memory_entries)
+
+    def make_key(self, criteria: str, evaluation_params: List[Any], judge_model: ModelInfo) -> str:
+        """Build the cache key from criteria text, evaluation params and judge model."""
+        key_data = {
+            "criteria": criteria,
+            "evaluation_params": [str(param) for param in evaluation_params],
+            "judge_model_name": judge_model.name,
+            "judge_model_url": judge_model.url
+        }
+        key_string = json.dumps(key_data, sort_keys=True)
+        return hashlib.md5(key_string.encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[List[str]]:
+        """Return the cached evaluation steps for a key, or None on a miss."""
+        entry = self.get_entry(key)
+        return entry['evaluation_steps'] if entry else None
+
+    def get_entry(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the full cache entry (steps and metadata) for a key, or None on a miss."""
+        entry = self._store.get(key)
+        steps = entry.get('evaluation_steps') if isinstance(entry, dict) else None
+        if not isinstance(steps, list) or not steps:
+            return None
+        return entry
+
+    def warm(self) -> int:
+        """Load the most recent entries into the memory tier; returns how many were loaded."""
+        return self._store.warm()
+
+    def put(self, key: str, steps: List[str], metadata: Optional[Dict[str, Any]] = None) -> bool:
+        """
+        Store derived evaluation steps unless an entry already exists.
+
+        Returns:
+            bool: True if the steps were written, False if the key was already cached
+        """
+        if os.path.exists(self._store.path(key)):
+            return False
+
+        cache_data = {
+            "evaluation_steps": list(steps),
+            "timestamp": datetime.now().isoformat(),
+            **(metadata or {})
+        }
+        try:
+            # Write-once, which keeps the first derivation authoritative
+            return self._store.put(key, cache_data, exclusive=True, indent=2)
+        except OSError as e:
+            eval_logger.log_error("geval_steps_cache", f"Failed to save evaluation steps: {e}", {
+                "cache_file": self._store.path(key)
+            })
+            return False
+
+
+class StepsCachingGEval(GEval):
+    """
+    GEval that stores the evaluation steps it derived from its criteria.
+
+    Instances created with cached steps behave exactly like a steps-based GEval;
+    instances created without them derive the steps during the first
+    measurement and persist them for later evaluations.
+    """
+
+    def __init__(self, steps_cache_key: str, steps_cache_metadata: Optional[Dict[str, Any]] = None, **kwargs):
+        super().__init__(**kwargs)
+        self.steps_cache_key = steps_cache_key
+        self.steps_cache_metadata = steps_cache_metadata or {}
+
+    def measure(self, test_case, *args, **kwargs) -> float:
+        score = super().measure(test_case, *args, **kwargs)
+        self._store_derived_steps()
+        return score
+
+    async def a_measure(self, test_case, *args, **kwargs) -> float:
+        score = await super().a_measure(test_case, *args, **kwargs)
+        self._store_derived_steps()
+        return score
+
+    def _generate_evaluation_steps(self, *args, **kwargs):
+        with usage_phase("steps"):
+            return super()._generate_evaluation_steps(*args, **kwargs)
+
+    async def _a_generate_evaluation_steps(self, *args, **kwargs):
+        with usage_phase("steps"):
+            return await super()._a_generate_evaluation_steps(*args, **kwargs)
+
+    def _store_derived_steps(self):
+        if not self.evaluation_steps:
+            return
+
+        # Keep what the derivation cost, so cache hits can report it as saved
+        metadata = dict(self.steps_cache_metadata)
+        context = current_context()
+        if context is not None:
+            steps_phase = f"{current_phase()}/steps" if current_phase() else "steps"
+            derivation_usage = context.usage.usage_for_phase(steps_phase)
+            if derivation_usage["calls"]:
+                metadata["derivation_usage"] = derivation_usage
+
+        if geval_steps_cache.put(self.steps_cache_key, self.evaluation_steps, metadata):
+            eval_logger.info("geval_steps_cache", "Cached derived evaluation steps", {
+                "cache_key": self.steps_cache_key,
+                "steps_count": len(self.evaluation_steps)
+            })
+
+
+# Global steps cache instance
+geval_steps_cache = GEvalStepsCache(memory_entries=MEMORY_MAX_ENTRIES)
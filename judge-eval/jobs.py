@@ -0,0 +1,295 @@
+"""
+Asynchronous evaluation jobs.
+
+POST / keeps the HTTP request open for the whole evaluation, pinning the
+calling worker and losing the result if the connection drops. The job API
+runs evaluations in a background pool instead: submitting returns a job id
+immediately, GET /jobs/{id} reports status, progress and partial results, and
+GET /jobs/{id}/events streams progress events (generation done, TALE
+iteration k, DAG node n, ...) as server-sent events. Finished jobs are kept
+for a configurable time. Jobs wait for admission by the evaluation scheduler
+like synchronous requests, with the same priority classes and fair sharing
+between benchmarks. POST /jobs/{id}/cancel stops a job; like a job running
+past its deadline it ends as "cancelled" with the partial result it reached.
+
+With several workers (see shared_state) every job publishes its state when it
+records an event, so GET /jobs/{id} and its event stream work on any worker;
+a cancellation received by another worker is left as a marker that the job's
+own worker applies within SHARED_STATE_POLL_SECONDS.
+
+Configuration (environment variables):
+    JOB_MAX_WORKERS          Worker threads of admitted jobs in each worker process; keep at
+                             least at its share of SCHEDULER_MAX_CONCURRENT (default: 32)
+    JOB_RETENTION_SECONDS    How long finished jobs are kept (default: 3600)
+"""
+
+import os
+import time
+import uuid
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Callable
+from eval_logger import eval_logger
+from cancellation import CancellationToken, EvaluationCancelled
+from scheduler import evaluation_scheduler, Ticket, INTERACTIVE
+from shared_state import SharedDirectory, Poller, shared_state, POLL_SECONDS
+
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+
+class Job:
+    """State, progress events and result of one evaluation job. Thread-safe."""
+
+    def __init__(self, metadata: Optional[Dict[str, Any]] = None,
+                 cancellation: Optional[CancellationToken] = None):
+        self.job_id = uuid.uuid4().hex
+        self.metadata = metadata or {}
+        self.cancellation = cancellation or CancellationToken()
+        self.status = QUEUED
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.partial: Dict[str, Any] = {}
+        # Called with the job after every event, to publish it to the other workers
+        self.publisher: Optional[Callable[["Job"], None]] = None
+        self._events: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (SUCCEEDED, FAILED, CANCELLED)
+
+    def add_event(self, event: str, data: Optional[Dict[str, Any]] = None):
+        """
+        Record a progress event.
+
+        A "partial" entry in the data is merged into the job's partial results
+        instead of being repeated in every event.
+        """
+        data = dict(data or {})
+        partial = data.pop("partial", None)
+        with self._lock:
+            if partial:
+                self.partial.update(partial)
+            self._events.append({
+                "seq": len(self._events) + 1,
+                "event": event,
+                "time": datetime.now().isoformat(),
+                "data": data
+            })
+        if self.publisher is not None:
+            self.publisher(self)
+
+    def events_since(self, seq: int) -> List[Dict[str, Any]]:
+        """Return the events recorded after the given sequence number."""
+        with self._lock:
+            return list(self._events[seq:])
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            last_event = self._events[-1] if self._events else None
+            return {
+                "job_id": self.job_id,
+                "status": self.status,
+                "metadata": dict(self.metadata),
+                "created_at": datetime.fromtimestamp(self.created_at).isoformat(),
+                "started_at": datetime.fromtimestamp(self.started_at).isoformat() if self.started_at else None,
+                "finished_at": datetime.fromtimestamp(self.finished_at).isoformat() if self.finished_at else None,
+                "progress": last_event,
+                "events_count": len(self._events),
+                "partial": dict(self.partial),
+                "result": self.result,
+                "error": self.error,
+                "cancellation": self.cancellation.to_dict()
+            }
+
+
+class StoredJob:
+    """
+    Read-only view of a job run by another worker, backed by the state the job
+    published. Every read picks up the latest published state.
+    """
+
+    def __init__(self, shared: SharedDirectory, job_id: str, state: Dict[str, Any]):
+        self.shared = shared
+        self.job_id = job_id
+        self._state = state
+
+    def _refresh(self):
+        state = self.shared.read_json(f"job-{self.job_id}.json")
+        if state is not None:
+            self._state = state
+
+    @property
+    def status(self) -> str:
+        return self._state["status"]
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (SUCCEEDED, FAILED, CANCELLED)
+
+    def events_since(self, seq: int) -> List[Dict[str, Any]]:
+        self._refresh()
+        return list(self._state.get("events", [])[seq:])
+
+    def to_dict(self) -> Dict[str, Any]:
+        self._refresh()
+        return {key: value for key, value in self._state.items() if key != "events"}
+
+
+class JobManager:
+    """
+    Runs evaluation jobs in a background pool and keeps their results for a while.
+
+    Args:
+        max_workers: Worker threads of admitted jobs
+        retention_seconds: How long finished jobs are kept
+        shared: Directory the jobs are published in for the other workers, None with one worker
+        poll_seconds: How often cancellations received by other workers are looked for
+    """
+
+    def __init__(self, max_workers: int = 32, retention_seconds: float = 3600.0,
+                 shared: Optional[SharedDirectory] = None, poll_seconds: float = 1.0):
+        self.retention_seconds = retention_seconds
+        self.shared = shared
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="eval-job")
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, Job] = {}
+        self._poller = Poller("jobs", poll_seconds, self._apply_shared_cancellations)
+
+    def submit(self, runner: Callable[[Callable[[str, Dict[str, Any]], None]], Dict[str, Any]],
+               metadata: Optional[Dict[str, Any]] = None,
+               cancellation: Optional[CancellationToken] = None,
+               priority: str = INTERACTIVE, flow: Optional[Any] = None) -> Job:
+        """
+        Queue a job.
+
+        Args:
+            runner: Runs the evaluation; receives the progress callback and returns the result
+            metadata: Shown with the job status (metric, model, ...)
+            cancellation: Token the evaluation run by the runner observes; cancel() cancels it
+            priority: Priority class of the evaluation
+            flow: Flow (benchmark id) the evaluation is fairly scheduled in
+        """
+        self._purge_expired()
+        job = Job(metadata, cancellation)
+        if self.shared is not None:
+            job.publisher = self._publish
+            self._poller.start()
+        with self._lock:
+            self._jobs[job.job_id] = job
+        job.add_event("queued")
+        ticket = evaluation_scheduler.submit(priority, flow, cancellation=job.cancellation)
+        # The job starts once admitted; a job withdrawn because it was cancelled
+        # while waiting still runs, so it ends as cancelled right away
+        ticket.future.add_done_callback(lambda _: self._start(job, runner, ticket))
+        eval_logger.info("jobs", "Evaluation job queued", {"job_id": job.job_id, "priority": priority,
+                                                            **job.metadata})
+        return job
+
+    def _start(self, job: Job, runner, ticket: Ticket):
+        # Every job runs in a fresh context, so per-evaluation state bound by one
+        # job (log session, evaluation context) never leaks into the next job
+        # served by the same pool thread
+        self._executor.submit(contextvars.Context().run, self._run, job, runner, ticket)
+
+    def _run(self, job: Job, runner, ticket: Ticket):
+        job.status = RUNNING
+        job.started_at = time.time()
+        job.add_event("started")
+        try:
+            # A job cancelled while queued stops at the evaluation's first cancellation check
+            job.result = runner(job.add_event)
+            job.status = SUCCEEDED
+        except EvaluationCancelled as e:
+            job.error = str(e)
+            job.result = e.partial or None
+            job.status = CANCELLED
+        except Exception as e:
+            job.error = str(e)
+            job.status = FAILED
+        finally:
+            evaluation_scheduler.release(ticket)
+            job.finished_at = time.time()
+            job.add_event(job.status, {"error": job.error} if job.error else {})
+
+    def _publish(self, job: Job):
+        self.shared.write_json(f"job-{job.job_id}.json", {**job.to_dict(), "events": job.events_since(0)})
+
+    def _load_stored(self, job_id: str) -> Optional[StoredJob]:
+        """Look up a job published by another worker."""
+        if self.shared is None:
+            return None
+        name = f"job-{job_id}.json"
+        state = self.shared.read_json(name)
+        if state is None or "status" not in state:
+            return None
+        job = StoredJob(self.shared, job_id, state)
+        # The last publication of a finished job is its final event
+        published_at = self.shared.mtime(name)
+        if job.finished and published_at is not None and time.time() - published_at > self.retention_seconds:
+            self.shared.remove(name)
+            return None
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """Return a job of this worker, or a read-only view of a job of another worker."""
+        self._purge_expired()
+        with self._lock:
+            job = self._jobs.get(job_id)
+        return job if job is not None else self._load_stored(job_id)
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """Cancel a queued or running job; returns None for unknown jobs."""
+        job = self.get(job_id)
+        if job is None or job.finished:
+            return job
+        if isinstance(job, StoredJob):
+            # The job's own worker applies the cancellation when it sees the marker
+            self.shared.touch(f"job-{job_id}.cancel")
+        else:
+            job.cancellation.cancel()
+            evaluation_scheduler.purge_cancelled()
+        eval_logger.info("jobs", "Evaluation job cancellation requested", {"job_id": job_id})
+        return job
+
+    def _apply_shared_cancellations(self):
+        """Cancel the jobs of this worker that another worker was asked to cancel."""
+        with self._lock:
+            jobs = [job for job in self._jobs.values() if not job.finished]
+        cancelled = [job for job in jobs if self.shared.mtime(f"job-{job.job_id}.cancel") is not None]
+        for job in cancelled:
+            job.cancellation.cancel()
+            self.shared.remove(f"job-{job.job_id}.cancel")
+        if cancelled:
+            evaluation_scheduler.purge_cancelled()
+
+    def _purge_expired(self):
+        now = time.time()
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job.finished and now - job.finished_at > self.retention_seconds]
+            for job_id in expired:
+                del self._jobs[job_id]
+        if self.shared is not None:
+            for job_id in expired:
+                self.shared.remove(f"job-{job_id}.json")
+                self.shared.remove(f"job-{job_id}.cancel")
+
+
+# Global job manager instance
+job_manager = JobManager(
+    max_workers=int(os.environ.get("JOB_MAX_WORKERS", "32")),
+    retention_seconds=float(os.environ.get("JOB_RETENTION_SECONDS", "3600")),
+    shared=shared_state,
+    poll_seconds=POLL_SECONDS
+)
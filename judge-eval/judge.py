@@ -1,12 +1,22 @@
 from deepeval.models.base_model import DeepEvalBaseLLM
+from typing import Optional, Dict
 import requests
+import time
 from eval_logger import eval_logger
+from eval_context import current_context
+from service_metrics import judge_call_duration, judge_calls
+from usage_tracker import current_phase
+from tracing import span
+from concurrency_limiter import provider_limiters
+from retry_policy import judge_retry_policy
+from call_trace import traced_call
 
 class Judge(DeepEvalBaseLLM):
-    def __init__(self, api_base: str, api_key: str, model_name: str):
+    def __init__(self, api_base: str, api_key: str, model_name: str, prices: Optional[Dict[str, Optional[float]]] = None):
         self.api_base = api_base
         self.api_key = api_key
         self.model_name = model_name
+        self.prices = prices
         
         eval_logger.info("judge", "Initialized judge", {
             "api_base": api_base,
@@ -24,6 +34,21 @@ class Judge(DeepEvalBaseLLM):
     def generate(self, prompt: str) -> str:
         eval_logger.info("judge", "Starting judge evaluation")
         
+        # A retried evaluation replays the judge calls its previous attempt completed
+        context = current_context()
+        checkpoint = context.checkpoint if context is not None else None
+        journal_slot = None
+        if checkpoint is not None:
+            journal_slot, replayed = checkpoint.replay_judge(prompt)
+            if replayed is not None:
+                eval_logger.decision("judge", "Replaying judge response from checkpoint", {
+                    "evaluation_prompt": prompt,
+                    "response": replayed["response"],
+                    "phase": current_phase()
+                })
+                context.usage.record_saving("checkpoint", replayed.get("usage"))
+                return replayed["response"]
+        
         payload = {
             "model": self.model_name,
             "messages": [{"role": "user", "content": prompt}]
@@ -39,39 +64,90 @@ class Judge(DeepEvalBaseLLM):
                                    })
         
         eval_logger.decision("judge", "Making evaluation request to judge model", {
-            "evaluation_prompt": prompt,
+            # The prompt itself is in the LLM Request entry above
+            "prompt_length": len(prompt),
             "model": self.model_name,
             "endpoint": f"{self.api_base}/chat/completions"
         })
         
+        started = time.perf_counter()
         try:
-            resp = requests.post(f"{self.api_base}/chat/completions", json=payload, headers=headers)
-            resp.raise_for_status()
+            with span("judge_call", judge_model=self.model_name, phase=current_phase()) as call_span:
+                cancellation = context.cancellation if context is not None else None
+                
+                def attempt(timeout):
+                    # Each attempt queues on the provider's adaptive concurrency limiter
+                    with provider_limiters.slot(self.api_base, self.model_name, cancellation,
+                                                priority=context.priority if context is not None else None) as slot:
+                        attempt_resp = requests.post(f"{self.api_base}/chat/completions", json=payload,
+                                                     headers=headers, timeout=timeout)
+                        slot.record(attempt_resp.status_code, attempt_resp.headers)
+                    attempt_resp.raise_for_status()
+                    return attempt_resp
+                
+                def exchange():
+                    resp = judge_retry_policy.run(attempt, stats=context.retries if context is not None else None,
+                                                  cancellation=cancellation)
+                    return {"status_code": resp.status_code, "body": resp.json()}
+                
+                # Recorded or replayed when calls are traced (see call_trace)
+                exchanged = traced_call("judge", {"model": self.model_name, "prompt": prompt}, exchange,
+                                        errors=(requests.exceptions.HTTPError, requests.exceptions.Timeout,
+                                                requests.exceptions.ConnectionError))
+                status_code = exchanged["status_code"]
+                call_span.set_attributes(status_code=status_code)
+            latency_ms = round((time.perf_counter() - started) * 1000, 1)
+            
+            try:
+                response_data = exchanged["body"]
+                response_content = response_data["choices"][0]["message"]["content"]
+                usage = response_data.get("usage") or {}
+            except (KeyError, IndexError, TypeError, AttributeError) as e:
+                judge_calls.inc(judge_model=self.model_name, outcome="error", reason="parse")
+                eval_logger.decision("judge", "Judge response could not be parsed", {
+                    "error": str(e),
+                    "error_type": type(e).__name__,
+                    "status_code": status_code
+                })
+                raise ValueError(f"Malformed judge response: {type(e).__name__}: {e}") from e
+            judge_calls.inc(judge_model=self.model_name, outcome="success")
+            call_span.set_attributes(prompt_tokens=usage.get("prompt_tokens"),
+                                     completion_tokens=usage.get("completion_tokens"))
             
-            response_data = resp.json()
-            response_content = response_data["choices"][0]["message"]["content"]
+            if context is not None:
+                context.usage.record_call("judge", self.model_name, usage, latency_ms=latency_ms, prices=self.prices)
+            if checkpoint is not None:
+                checkpoint.record_judge(journal_slot, response_content, usage)
             
             eval_logger.log_llm_response("judge", 
                                         response=response_content,
                                         metadata={
                                             "response_length": len(response_content),
-                                            "status_code": resp.status_code,
-                                            "finish_reason": response_data["choices"][0].get("finish_reason")
+                                            "status_code": status_code,
+                                            "finish_reason": response_data["choices"][0].get("finish_reason"),
+                                            "usage": usage,
+                                            "latency_ms": latency_ms
                                         })
             
             eval_logger.decision("judge", "Judge evaluation completed successfully", {
                 "response_length": len(response_content),
-                "status_code": resp.status_code
+                "status_code": status_code
             })
             
             return response_content
             
         except requests.exceptions.RequestException as e:
+            # Includes response bodies that are not JSON (requests' JSONDecodeError)
+            reason = "parse" if isinstance(e, ValueError) else "request"
+            judge_calls.inc(judge_model=self.model_name, outcome="error", reason=reason)
             eval_logger.decision("judge", "Judge evaluation failed", {
                 "error": str(e),
                 "error_type": type(e).__name__
             })
             raise
+        finally:
+            # Failed and cancelled calls take time too
+            judge_call_duration.observe(time.perf_counter() - started, judge_model=self.model_name)
 
     async def a_generate(self, prompt: str) -> str:
         eval_logger.info("judge", "Starting async judge evaluation")
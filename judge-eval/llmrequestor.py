@@ -1,22 +1,50 @@
 from models import Prompt, Metric, ModelInfo
-from openai import OpenAI
 import os
 import json
 import hashlib
 import fcntl
 import time
-from datetime import datetime, timedelta
+from contextlib import contextmanager, ExitStack
+from datetime import datetime
 from eval_logger import eval_logger
+from eval_context import current_context
+from service_metrics import response_cache_requests, response_cache_lock_wait, generation_duration
+from tracing import span, set_span_attributes
+from concurrency_limiter import provider_limiters
+from retry_policy import model_retry_policy
+from tiered_cache import TieredCache, MEMORY_MAX_ENTRIES
+from call_trace import traced_call
+from cache_maintenance import (
+    CacheMaintenance,
+    RESPONSE_CACHE_POLICY,
+    RESPONSE_CACHE_MAX_BYTES,
+    MAINTENANCE_INTERVAL_SECONDS,
+    LOCK_GRACE_SECONDS
+)
+
+def response_cache_key(prompt: Prompt, model: ModelInfo, system_prompt: str = "") -> str:
+    """Cache key of the response of a model to a prompt and system prompt."""
+    cache_data = {
+        "prompt_input": prompt.input,
+        "model_name": model.name,
+        "model_url": model.url,
+        "system_prompt": system_prompt
+    }
+    cache_string = json.dumps(cache_data, sort_keys=True)
+    return hashlib.md5(cache_string.encode()).hexdigest()
 
 class LlmRequestor:
-    def __init__(self, prompt: Prompt, model: ModelInfo, system_prompt: str = ""):
+    def __init__(self, prompt: Prompt, model: ModelInfo, system_prompt: str = "", stream: bool = False):
         self.prompt = prompt
         self.model = model
         self.system_prompt = system_prompt
+        self.stream = stream
+
+        # Timing and usage data of the last request, returned next to actual_output
+        self.generation_stats = {}
         
-        # Get cache directory relative to the project root
-        project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        self.cache_dir = os.path.join(project_root, "/app/cache")
+        # Responses are cached on disk shared by all workers, with a memory tier per worker
+        self.cache_dir = response_cache.directory
         
         # Ensure cache directory exists
         os.makedirs(self.cache_dir, exist_ok=True)
@@ -26,81 +54,309 @@ class LlmRequestor:
             "model_url": model.url,
             "has_system_prompt": bool(system_prompt),
             "prompt_length": len(prompt.input),
-            "cache_dir": self.cache_dir
+            "cache_dir": self.cache_dir,
+            "stream": stream
         })
 
     def _generate_cache_key(self):
         """Generate a unique cache key based on prompt, model, and system prompt (run_index excluded so repeated runs share the same model response)"""
-        cache_data = {
-            "prompt_input": self.prompt.input,
-            "model_name": self.model.name,
-            "model_url": self.model.url,
-            "system_prompt": self.system_prompt
-        }
-        cache_string = json.dumps(cache_data, sort_keys=True)
-        return hashlib.md5(cache_string.encode()).hexdigest()
+        return response_cache_key(self.prompt, self.model, self.system_prompt)
+
+    def is_cached(self) -> bool:
+        """Whether a valid response to this request is cached, without loading it."""
+        return self._is_cache_valid(self._get_cache_file_path(self._generate_cache_key()))
 
     def _get_cache_file_path(self, cache_key):
         """Get the file path for a cache key"""
-        return os.path.join(self.cache_dir, f"{cache_key}.json")
+        return response_cache.path(cache_key)
 
     def _is_cache_valid(self, cache_file_path):
-        """Check if cache file exists and is less than 24 hours old"""
-        if not os.path.exists(cache_file_path):
+        """Check if cache file exists and is younger than the time to live of the model (expired files are removed by cache_maintenance)"""
+        try:
+            age_seconds = time.time() - os.path.getmtime(cache_file_path)
+        except OSError:
             return False
         
-        # Get file modification time
-        file_mtime = datetime.fromtimestamp(os.path.getmtime(cache_file_path))
-        now = datetime.now()
-        
-        # Check if file is older than 24 hours
-        if now - file_mtime > timedelta(hours=24):
-            eval_logger.info("llm_requestor", "Cache expired, removing file", {
+        ttl_seconds = RESPONSE_CACHE_POLICY.ttl_seconds(self.model.name)
+        if ttl_seconds is not None and age_seconds > ttl_seconds:
+            eval_logger.info("llm_requestor", "Cache expired", {
                 "cache_file": cache_file_path,
-                "age_hours": (now - file_mtime).total_seconds() / 3600
+                "age_hours": age_seconds / 3600,
+                "ttl_hours": ttl_seconds / 3600
             })
-            try:
-                os.remove(cache_file_path)
-            except OSError as e:
-                eval_logger.log_error("llm_requestor", f"Failed to remove expired cache file: {e}")
             return False
         
         return True
 
-    def _load_from_cache(self, cache_file_path):
-        """Load response from cache file"""
+    def _load_from_cache(self, cache_key):
+        """Load response from the cache (memory tier of this worker, else the cache file)"""
+        cache_data = response_cache.get(cache_key)
+        if cache_data is None:
+            return None
         try:
-            with open(cache_file_path, 'r', encoding='utf-8') as f:
-                cache_data = json.load(f)
-                eval_logger.info("llm_requestor", "Loaded response from cache", {
-                    "cache_file": cache_file_path,
-                    "response_length": len(cache_data['response'])
-                })
-                return cache_data['response']
-        except (json.JSONDecodeError, KeyError, OSError) as e:
+            eval_logger.info("llm_requestor", "Loaded response from cache", {
+                "cache_file": response_cache.path(cache_key),
+                "response_length": len(cache_data['response'])
+            })
+            # Report the stats measured when the response was generated
+            self.generation_stats = {
+                **cache_data.get('generation_stats', {}),
+                "cached": True
+            }
+            context = current_context()
+            if context is not None:
+                context.usage.record_saving("response_cache", self.generation_stats.get("usage"),
+                                            role="model_under_test")
+            return cache_data['response']
+        except (KeyError, TypeError, AttributeError) as e:
             eval_logger.log_error("llm_requestor", f"Failed to load from cache: {e}")
             return None
 
-    def _save_to_cache(self, cache_file_path, response):
-        """Save response to cache file"""
+    def _save_to_cache(self, cache_key, response):
+        """Save response to the cache file (atomically) and the memory tier of this worker"""
         try:
             cache_data = {
                 "response": response,
                 "timestamp": datetime.now().isoformat(),
                 "prompt_input": self.prompt.input,
                 "model_name": self.model.name,
-                "system_prompt": self.system_prompt
+                "system_prompt": self.system_prompt,
+                "generation_stats": self.generation_stats
             }
-            with open(cache_file_path, 'w', encoding='utf-8') as f:
-                json.dump(cache_data, f, ensure_ascii=False, indent=2)
+            response_cache.put(cache_key, cache_data, indent=2)
             eval_logger.info("llm_requestor", "Saved response to cache", {
-                "cache_file": cache_file_path,
+                "cache_file": response_cache.path(cache_key),
                 "response_length": len(response)
             })
         except OSError as e:
             eval_logger.log_error("llm_requestor", f"Failed to save to cache: {e}")
 
+    @contextmanager
+    def _completion(self, client, **kwargs):
+        """
+        Create a chat completion while holding a slot of the provider's adaptive
+        concurrency limiter. The slot is held for the with block, so streamed
+        completions count against the limit until they are consumed.
+
+        Creating the completion is retried according to the model retry policy;
+        every attempt queues on the limiter again. Failures while a stream is
+        consumed are not retried, since part of the output was already read.
+        """
+        from openai import APIStatusError, Timeout
+
+        context = current_context()
+        cancellation = context.cancellation if context is not None else None
+        with ExitStack() as held_slot:
+            def attempt(timeout):
+                connect_timeout, read_timeout = timeout
+                with ExitStack() as attempt_slot:
+                    slot = attempt_slot.enter_context(
+                        provider_limiters.slot(self.model.url, self.model.name, cancellation,
+                                               priority=context.priority if context is not None else None))
+                    try:
+                        raw_response = client.chat.completions.with_raw_response.create(
+                            model=self.model.name,
+                            timeout=Timeout(read_timeout, connect=connect_timeout),
+                            **kwargs
+                        )
+                    except APIStatusError as e:
+                        slot.record(e.status_code, e.response.headers)
+                        raise
+                    slot.record(raw_response.status_code, raw_response.headers)
+                    # Keep the slot of the successful attempt until the completion was consumed
+                    held_slot.enter_context(attempt_slot.pop_all())
+                    return raw_response
+
+            raw_response = model_retry_policy.run(attempt, stats=context.retries if context is not None else None,
+                                                  cancellation=cancellation)
+            yield raw_response.parse()
+
+    def _request_live(self, messages):
+        """Request the completion from the provider; returns its content and generation stats."""
+        # Imported on the first cache miss; cached responses never need the client
+        from openai import OpenAI
+
+        # Retries are left to the concurrency limiter, which needs to see every 429
+        client = OpenAI(
+            base_url=self.model.url,
+            api_key=self.model.key,
+            max_retries=0
+        )
+        if self.stream:
+            content = self._request_streaming(client, messages)
+        else:
+            content = self._request_blocking(client, messages)
+        return {"content": content, "generation_stats": self.generation_stats}
+
+    def _request_blocking(self, client, messages):
+        """Request the full completion in one response and record latency and usage."""
+        started = time.perf_counter()
+        with self._completion(client, messages=messages) as completion:
+            latency = time.perf_counter() - started
+
+        usage = self._usage_to_dict(completion.usage)
+        completion_tokens = usage.get("completion_tokens")
+        self.generation_stats = {
+            "streamed": False,
+            "cached": False,
+            "latency_ms": round(latency * 1000, 1),
+            "time_to_first_token_ms": None,
+            "tokens_per_second": round(completion_tokens / latency, 2) if completion_tokens and latency > 0 else None,
+            "usage": usage,
+            "finish_reason": completion.choices[0].finish_reason if completion.choices else None
+        }
+        return completion.choices[0].message.content or ""
+
+    def _request_streaming(self, client, messages):
+        """
+        Consume the completion incrementally and record time-to-first-token,
+        total latency and throughput.
+
+        Throughput is measured over the decode phase (first token to last chunk)
+        so it is comparable across models with different prompt processing times.
+        """
+        from openai import BadRequestError
+
+        started = time.perf_counter()
+        try:
+            with self._completion(client, messages=messages, stream=True,
+                                  stream_options={"include_usage": True}) as stream:
+                return self._consume_stream(stream, started)
+        except BadRequestError as e:
+            # Some OpenAI compatible providers reject stream_options
+            eval_logger.debug("llm_requestor", "Provider rejected stream_options, streaming without usage", {
+                "error": str(e)
+            })
+            with self._completion(client, messages=messages, stream=True) as stream:
+                return self._consume_stream(stream, started)
+
+    def _consume_stream(self, stream, started):
+        """Read a streamed completion and record its timing and usage stats."""
+        first_token_at = None
+        content_parts = []
+        chunk_count = 0
+        usage = None
+        finish_reason = None
+        context = current_context()
+        cancellation = context.cancellation if context is not None else None
+        for chunk in stream:
+            if cancellation is not None and cancellation.cancelled:
+                # Nobody waits for the output any more; closing the connection
+                # also stops the provider from generating the rest
+                stream.close()
+                cancellation.check()
+            if getattr(chunk, "usage", None):
+                usage = chunk.usage
+            if not chunk.choices:
+                continue
+            choice = chunk.choices[0]
+            delta = choice.delta.content if choice.delta else None
+            if delta:
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                    eval_logger.debug("llm_requestor", "Received first token", {
+                        "time_to_first_token_ms": round((first_token_at - started) * 1000, 1)
+                    })
+                content_parts.append(delta)
+                chunk_count += 1
+            if choice.finish_reason:
+                finish_reason = choice.finish_reason
+        finished = time.perf_counter()
+
+        usage = self._usage_to_dict(usage)
+        # Without usage from the provider, each content chunk approximates one token
+        completion_tokens = usage.get("completion_tokens") or chunk_count
+        decode_time = finished - first_token_at if first_token_at is not None else 0
+        self.generation_stats = {
+            "streamed": True,
+            "cached": False,
+            "latency_ms": round((finished - started) * 1000, 1),
+            "time_to_first_token_ms": round((first_token_at - started) * 1000, 1) if first_token_at is not None else None,
+            "tokens_per_second": round(completion_tokens / decode_time, 2) if completion_tokens and decode_time > 0 else None,
+            "usage": usage,
+            "usage_source": "provider" if usage else "chunk_count",
+            "finish_reason": finish_reason
+        }
+        return "".join(content_parts)
+
+    def _prices(self):
+        return {
+            "input": self.model.input_price_per_million,
+            "output": self.model.output_price_per_million
+        }
+
+    @staticmethod
+    def _usage_to_dict(usage):
+        """Convert an OpenAI usage object to a plain dict (empty if the provider sent none)."""
+        if usage is None:
+            return {}
+        return {
+            "prompt_tokens": getattr(usage, "prompt_tokens", None),
+            "completion_tokens": getattr(usage, "completion_tokens", None),
+            "total_tokens": getattr(usage, "total_tokens", None)
+        }
+
+    def _generate(self, context) -> str:
+        """Request a completion of the prompt from the model and record its usage."""
+        messages = []
+
+        if self.system_prompt:
+            messages.append({"role": "system", "content": self.system_prompt})
+            eval_logger.debug("llm_requestor", "Added system prompt", {
+                "system_prompt_length": len(self.system_prompt)
+            })
+            
+        messages.append({"role": "user", "content": self.prompt.input})
+        
+        eval_logger.log_llm_request("llm_requestor", 
+                                   prompt=self.prompt.input,
+                                   model_info={
+                                       "name": self.model.name,
+                                       "url": self.model.url,
+                                       "total_messages": len(messages)
+                                   })
+
+        eval_logger.info("llm_requestor", "Making API request to model", {
+            "stream": self.stream
+        })
+        with span("completion", model=self.model.name, streamed=self.stream) as completion_span:
+            completion = traced_call("completion", {"model": self.model.name, "messages": messages},
+                                     lambda: self._request_live(messages))
+            response_content = completion["content"]
+            self.generation_stats = completion["generation_stats"]
+            completion_span.set_attributes(
+                time_to_first_token_ms=self.generation_stats.get("time_to_first_token_ms"),
+                tokens_per_second=self.generation_stats.get("tokens_per_second"),
+                completion_tokens=self.generation_stats.get("usage", {}).get("completion_tokens")
+            )
+        
+        if self.generation_stats.get("latency_ms") is not None:
+            generation_duration.observe(self.generation_stats["latency_ms"] / 1000, model=self.model.name)
+        
+        if context is not None:
+            context.usage.record_call("model_under_test", self.model.name,
+                                      self.generation_stats.get("usage"),
+                                      latency_ms=self.generation_stats.get("latency_ms"),
+                                      prices=self._prices())
+        
+        eval_logger.log_llm_response("llm_requestor", 
+                                    response=response_content,
+                                    metadata={
+                                        "response_length": len(response_content),
+                                        "finish_reason": self.generation_stats.get("finish_reason"),
+                                        "generation_stats": self.generation_stats
+                                    })
+        
+        return response_content
+
     def request(self):
+        # Traced evaluations record or replay every completion and never touch the
+        # shared response cache, which would otherwise serve replayed outputs once
+        # tracing is off (see call_trace)
+        context = current_context()
+        if context is not None and context.call_trace is not None:
+            return self._generate(context)
+        
         # Generate cache key
         cache_key = self._generate_cache_key()
         cache_file_path = self._get_cache_file_path(cache_key)
@@ -112,9 +368,11 @@ class LlmRequestor:
         
         # Fast path: check cache without acquiring lock
         if self._is_cache_valid(cache_file_path):
-            cached_response = self._load_from_cache(cache_file_path)
+            cached_response = self._load_from_cache(cache_key)
             if cached_response is not None:
                 eval_logger.info("llm_requestor", "Using cached response (fast path)")
+                response_cache_requests.inc(result="hit")
+                set_span_attributes(cache_hit=True, cache_path="fast")
                 return cached_response
         
         # Cache miss — acquire exclusive file lock to prevent parallel API calls
@@ -125,59 +383,45 @@ class LlmRequestor:
         })
         
         with open(lock_file_path, 'w') as lock_file:
-            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            lock_wait_started = time.perf_counter()
+            with span("cache_lock_wait"):
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            response_cache_lock_wait.observe(time.perf_counter() - lock_wait_started)
             try:
                 # Re-check cache after acquiring lock — another worker may have
                 # populated it while we were waiting
                 if self._is_cache_valid(cache_file_path):
-                    cached_response = self._load_from_cache(cache_file_path)
+                    cached_response = self._load_from_cache(cache_key)
                     if cached_response is not None:
                         eval_logger.info("llm_requestor", "Using cached response (populated by another worker)")
+                        response_cache_requests.inc(result="hit_after_lock")
+                        set_span_attributes(cache_hit=True, cache_path="after_lock")
                         return cached_response
                 
+                response_cache_requests.inc(result="miss")
+                set_span_attributes(cache_hit=False)
+                
                 # Still no cache — make API request (we hold the lock)
                 eval_logger.info("llm_requestor", "Making API request (holding lock)")
                 
-                client = OpenAI(
-                    base_url=self.model.url,
-                    api_key=self.model.key
-                )
-                messages = []
-
-                if self.system_prompt:
-                    messages.append({"role": "system", "content": self.system_prompt})
-                    eval_logger.debug("llm_requestor", "Added system prompt", {
-                        "system_prompt_length": len(self.system_prompt)
-                    })
-                    
-                messages.append({"role": "user", "content": self.prompt.input})
-                
-                eval_logger.log_llm_request("llm_requestor", 
-                                           prompt=self.prompt.input,
-                                           model_info={
-                                               "name": self.model.name,
-                                               "url": self.model.url,
-                                               "total_messages": len(messages)
-                                           })
-
-                eval_logger.info("llm_requestor", "Making API request to model")
-                completion = client.chat.completions.create(
-                    model=self.model.name,
-                    messages=messages
-                )
-                
-                response_content = completion.choices[0].message.content
-                
-                eval_logger.log_llm_response("llm_requestor", 
-                                            response=response_content,
-                                            metadata={
-                                                "response_length": len(response_content),
-                                                "finish_reason": completion.choices[0].finish_reason if completion.choices else None
-                                            })
+                response_content = self._generate(context)
                 
                 # Save response to cache (still under lock)
-                self._save_to_cache(cache_file_path, response_content)
+                self._save_to_cache(cache_key, response_content)
                 
                 return response_content
             finally:
-                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
\ No newline at end of file
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+# Global response cache instance
+response_cache = TieredCache("response", "/app/cache", memory_entries=MEMORY_MAX_ENTRIES, track_access=True)
+
+# Global response cache maintenance instance
+response_cache_maintenance = CacheMaintenance(
+    response_cache,
+    RESPONSE_CACHE_POLICY,
+    max_bytes=RESPONSE_CACHE_MAX_BYTES,
+    interval=MAINTENANCE_INTERVAL_SECONDS,
+    lock_grace=LOCK_GRACE_SECONDS
+)
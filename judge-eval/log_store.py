@@ -0,0 +1,166 @@
+"""
+Store of evaluation logs returned by reference.
+
+With log_format "reference" an evaluation result carries a logs_id instead of
+its logs, which keeps result payloads small for clients that only look at the
+logs of some results. The logs are kept as gzip compressed JSON files in a
+directory shared by all serving workers, so any worker can serve them with
+GET /logs/{logs_id}. Clients accepting gzip receive the stored bytes as they
+are, without decompressing them.
+
+Logs older than the retention are no longer served. The background sweep of
+cache_maintenance removes them, and temporary files of interrupted writes,
+whether or not anybody requested them.
+
+Configuration (environment variables):
+    LOG_STORE_DIR               Directory of the stored logs (default: /app/cache/logs)
+    LOG_STORE_RETENTION_HOURS   Hours stored logs are kept (default: 168)
+"""
+
+import os
+import re
+import gzip
+import json
+import time
+import uuid
+import threading
+from typing import Any, Dict, List, Optional
+from eval_logger import eval_logger
+from payloads import dumps
+from service_metrics import log_store_operations
+
+# Temporary files of writes older than this were left by interrupted writes
+TMP_MAX_AGE_SECONDS = 3600
+
+_LOGS_ID = re.compile(r"^[0-9a-f]{32}$")
+
+
+class LogStore:
+    """
+    Directory of gzip compressed evaluation logs shared by the serving workers.
+
+    Args:
+        directory: Directory of the stored logs
+        retention_hours: Hours stored logs are served
+        compression_level: gzip compression level of stored logs
+    """
+
+    def __init__(self, directory: str, retention_hours: float = 168, compression_level: int = 6):
+        self.directory = directory
+        self.retention_seconds = retention_hours * 3600
+        self.compression_level = compression_level
+
+    def _path(self, logs_id: str) -> Optional[str]:
+        if not _LOGS_ID.match(logs_id):
+            return None
+        return os.path.join(self.directory, f"{logs_id}.json.gz")
+
+    def put(self, logs: List[Any]) -> str:
+        """
+        Store the logs of an evaluation.
+
+        Returns:
+            str: Identifier to fetch the logs with
+
+        Raises:
+            OSError: The logs could not be written
+        """
+        logs_id = uuid.uuid4().hex
+        path = self._path(logs_id)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(tmp_path, "wb") as f:
+                f.write(gzip.compress(dumps(logs), compresslevel=self.compression_level, mtime=0))
+            os.replace(tmp_path, path)
+        except OSError:
+            log_store_operations.inc(operation="put", outcome="error")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+        log_store_operations.inc(operation="put", outcome="success")
+        return logs_id
+
+    def get_compressed(self, logs_id: str) -> Optional[bytes]:
+        """Return the gzip compressed JSON of stored logs, or None if they are unknown or expired."""
+        path = self._path(logs_id)
+        if path is None:
+            log_store_operations.inc(operation="get", outcome="invalid")
+            return None
+        try:
+            with open(path, "rb") as f:
+                if time.time() - os.fstat(f.fileno()).st_mtime > self.retention_seconds:
+                    expired = True
+                else:
+                    expired = False
+                    data = f.read()
+        except FileNotFoundError:
+            log_store_operations.inc(operation="get", outcome="missing")
+            return None
+        except OSError as e:
+            eval_logger.log_error("log_store", f"Failed to read stored logs: {e}", {"logs_id": logs_id})
+            log_store_operations.inc(operation="get", outcome="error")
+            return None
+
+        if expired:
+            self.remove(logs_id)
+            log_store_operations.inc(operation="get", outcome="expired")
+            return None
+        log_store_operations.inc(operation="get", outcome="success")
+        return data
+
+    def get(self, logs_id: str) -> Optional[List[Any]]:
+        """Return stored logs, or None if they are unknown or expired."""
+        data = self.get_compressed(logs_id)
+        return json.loads(gzip.decompress(data)) if data is not None else None
+
+    def sweep(self) -> Dict[str, Any]:
+        """
+        Remove logs older than the retention and temporary files of interrupted writes.
+
+        Returns:
+            dict: Number of removed files
+        """
+        oldest = time.time() - self.retention_seconds
+        removed = 0
+        try:
+            with os.scandir(self.directory) as scanned:
+                for item in scanned:
+                    try:
+                        if item.name.endswith(".json.gz"):
+                            expired = oldest
+                        elif item.name.endswith(".tmp"):
+                            # A write takes well under a minute
+                            expired = max(oldest, time.time() - TMP_MAX_AGE_SECONDS)
+                        else:
+                            continue
+                        if item.stat().st_mtime < expired:
+                            os.remove(item.path)
+                            removed += 1
+                    except OSError:
+                        # Removed while scanning
+                        continue
+        except FileNotFoundError:
+            pass
+        if removed:
+            log_store_operations.inc(removed, operation="sweep", outcome="removed")
+            eval_logger.info("log_store", "Removed expired logs", {"removed": removed})
+        return {"removed": removed}
+
+    def remove(self, logs_id: str):
+        path = self._path(logs_id)
+        if path is None:
+            return
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+# Global log store instance
+log_store = LogStore(
+    directory=os.environ.get("LOG_STORE_DIR", "/app/cache/logs"),
+    retention_hours=float(os.environ.get("LOG_STORE_RETENTION_HOURS", "168"))
+)
@@ -1,37 +1,125 @@
-from fastapi import FastAPI, HTTPException
+# Time the imports below for the startup report (GET /startup)
+from startup_profile import import_profiler
+import_profiler.install()
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse, JSONResponse, Response
+import anyio.to_thread
+import asyncio
+import functools
+import gzip
+import json
+import os
+import time
+from contextlib import ExitStack
 from evaluator import Evaluator
-from models import Prompt, ModelInfo, Metric, EvalRequest
+from models import Prompt, ModelInfo, Metric, EvalRequest, PregenerateRequest
 from eval_logger import eval_logger
+from usage_tracker import usage_totals
+from engine_health import engine_health
+from jobs import job_manager
+from benchmark_registry import benchmark_registry
+from scheduler import evaluation_scheduler, INTERACTIVE, BULK
+from admission import admission_controller, Overloaded
+from shared_state import worker_snapshots
+from processing_pool import processing_pool
+from warmup import warmup
+from log_store import log_store
+from pregeneration import pregenerator
+from llmrequestor import response_cache_maintenance
+from checkpoint_store import checkpoint_store
+from evidence_index import evidence_index
+from payloads import (
+    CompactJSONResponse,
+    CompressionMiddleware,
+    accepts,
+    COMPRESSION_ENABLED,
+    COMPRESSION_MIN_BYTES,
+    GZIP_LEVEL,
+    ZSTD_LEVEL
+)
+from cancellation import (
+    CancellationToken,
+    EvaluationCancelled,
+    DEADLINE_EXCEEDED,
+    CLIENT_DISCONNECTED,
+    CANCELLED,
+    DEFAULT_DEADLINE_SECONDS
+)
+from service_metrics import (
+    metrics_registry,
+    requests_in_flight,
+    evaluation_duration,
+    evaluations_total,
+    threadpool_tokens
+)
 import traceback
 
-app = FastAPI()
+app = FastAPI(default_response_class=CompactJSONResponse)
+if COMPRESSION_ENABLED:
+    app.add_middleware(CompressionMiddleware, min_bytes=COMPRESSION_MIN_BYTES, gzip_level=GZIP_LEVEL,
+                       zstd_level=ZSTD_LEVEL)
 
 @app.on_event("startup")
 async def startup_event():
-    eval_logger.info("main", "FastAPI application started successfully")
+    import_profiler.mark_started()
+    startup_report = import_profiler.report(top=10)
+    eval_logger.info("main", "FastAPI application started successfully", {
+        "started_seconds": startup_report["started_seconds"],
+        "import_ms": startup_report["phases"]["startup"]["import_ms"],
+        "import_ms_by_package": startup_report["phases"]["startup"]["by_package_ms"],
+        "warmup": warmup.state
+    })
+    warmup.start()
+    response_cache_maintenance.register("checkpoints", checkpoint_store.sweep)
+    response_cache_maintenance.register("evidence_index", evidence_index.purge)
+    response_cache_maintenance.register("logs", log_store.sweep)
+    response_cache_maintenance.start()
+    if worker_snapshots is not None:
+        worker_snapshots.start()
     print("FastAPI evaluation service is ready to receive requests", flush=True)
 
 @app.on_event("shutdown") 
 async def shutdown_event():
     eval_logger.info("main", "FastAPI application shutting down")
+    processing_pool.shutdown()
     print("FastAPI evaluation service is shutting down", flush=True)
 
-@app.post("/")
-def requestEval(eval_request: EvalRequest):
+def run_evaluation(eval_request: EvalRequest, progress=None, cancellation: CancellationToken = None):
+    """
+    Run one evaluation and record its service metrics.
+
+    Shared by the synchronous endpoint and the job API; raises if the
+    evaluation fails and EvaluationCancelled (carrying the partial result)
+    if it is cancelled or runs past its deadline.
+    """
+    started = time.perf_counter()
+    outcome = "error"
+    requests_in_flight.inc()
     try:
         eval_logger.info("main", "Received evaluation request", {
             "prompt_input_length": len(eval_request.prompt.input) if eval_request.prompt.input else 0,
             "metric_name": eval_request.metric.name,
             "metric_type": eval_request.metric.type,
             "model_name": eval_request.model.name,
-            "has_system_prompt": bool(eval_request.system_prompt)
+            "has_system_prompt": bool(eval_request.system_prompt),
+            "stream": bool(eval_request.stream),
+            "benchmark_id": eval_request.benchmark_id,
+            "priority": eval_request.priority,
+            "deadline_seconds": cancellation.deadline_seconds if cancellation is not None else None
         })
         
         evaluator = Evaluator(
             prompt=eval_request.prompt,
             metric=eval_request.metric,
             model=eval_request.model,
-            system_prompt=eval_request.system_prompt or ""
+            system_prompt=eval_request.system_prompt or "",
+            stream=bool(eval_request.stream),
+            run_index=eval_request.run_index or 1,
+            progress=progress,
+            cancellation=cancellation,
+            priority=eval_request.priority or INTERACTIVE,
+            log_format=eval_request.log_format or "string"
         )
         
         eval_logger.info("main", "Starting evaluation")
@@ -42,8 +130,17 @@ def requestEval(eval_request: EvalRequest):
             "actual_output_length": len(result.get("actual_output", ""))
         })
         
+        outcome = "success"
         return result
         
+    except EvaluationCancelled as e:
+        outcome = e.reason
+        eval_logger.info("main", "Evaluation cancelled", {
+            "reason": e.reason,
+            "partial_result": sorted(key for key in e.partial if key not in ("logs", "logs_id"))
+        })
+        raise
+        
     except Exception as e:
         # Log the full error with traceback for debugging
         error_traceback = traceback.format_exc()
@@ -56,17 +153,302 @@ def requestEval(eval_request: EvalRequest):
         # Also print to stderr for immediate visibility
         print(f"ERROR in main: {str(e)}", flush=True)
         print(f"TRACEBACK: {error_traceback}", flush=True)
-        
-        raise HTTPException(status_code=500, detail=str(e))
+        raise
+    finally:
+        requests_in_flight.dec()
+        duration = time.perf_counter() - started
+        evaluation_duration.observe(duration, metric_type=eval_request.metric.type)
+        if outcome in ("success", "error"):
+            admission_controller.record_duration(eval_request.metric.type, duration)
+        evaluations_total.inc(metric_type=eval_request.metric.type, outcome=outcome)
+
+def admit_or_shed(eval_request: EvalRequest) -> ExitStack:
+    """
+    Admit a request, returning an ExitStack that holds the admission until it
+    is closed, or shed it with 503 and a Retry-After estimate.
+    """
+    admission = ExitStack()
+    try:
+        admission.enter_context(admission_controller.admit(eval_request.metric.type,
+                                                           eval_request.priority or INTERACTIVE))
+    except Overloaded as e:
+        raise HTTPException(status_code=503, detail={
+            "error": str(e),
+            "reason": e.reason,
+            "retry_after": e.retry_after
+        }, headers={"Retry-After": str(e.retry_after)})
+    return admission
+
+def request_cancellation(eval_request: EvalRequest) -> CancellationToken:
+    """
+    Start the deadline of a request (requests without one get the configured
+    default) and register it with its benchmark, if any.
+    """
+    cancellation = CancellationToken(eval_request.deadline_seconds or DEFAULT_DEADLINE_SECONDS)
+    if eval_request.benchmark_id is not None:
+        benchmark_registry.register(eval_request.benchmark_id, cancellation)
+    return cancellation
 
-if __name__ == "__main__":
-    import uvicorn
+def release_cancellation(eval_request: EvalRequest, cancellation: CancellationToken):
+    """Unregister a finished request from its benchmark."""
+    if eval_request.benchmark_id is not None:
+        benchmark_registry.unregister(eval_request.benchmark_id, cancellation)
+
+# Status codes of stopped evaluations: the deadline passed (504), the benchmark
+# was cancelled (409) or the client went away and nobody reads the answer (499)
+CANCELLATION_STATUS_CODES = {DEADLINE_EXCEEDED: 504, CANCELLED: 409, CLIENT_DISCONNECTED: 499}
+
+async def cancel_on_disconnect(request: Request, cancellation: CancellationToken):
+    """Cancel the evaluation as soon as the client that waits for it goes away."""
+    while not cancellation.cancelled:
+        if await request.is_disconnected():
+            cancellation.cancel(CLIENT_DISCONNECTED)
+            return
+        await asyncio.sleep(0.5)
+
+@app.post("/")
+async def requestEval(eval_request: EvalRequest, request: Request):
+    # The evaluation waits for the scheduler in the event loop, then runs in
+    # the worker threadpool like a sync endpoint would, while the event loop
+    # watches the connection for a disconnect
+    with admit_or_shed(eval_request):
+        cancellation = request_cancellation(eval_request)
+        watcher = asyncio.create_task(cancel_on_disconnect(request, cancellation))
+        ticket = evaluation_scheduler.submit(eval_request.priority, flow=eval_request.benchmark_id,
+                                             cancellation=cancellation)
+        try:
+            await evaluation_scheduler.wait(ticket)
+            result = await anyio.to_thread.run_sync(
+                functools.partial(run_evaluation, eval_request, cancellation=cancellation))
+            # Returned as a response, so the result is encoded once instead of
+            # being copied by FastAPI's jsonable_encoder first
+            return CompactJSONResponse(result)
+        except EvaluationCancelled as e:
+            raise HTTPException(status_code=CANCELLATION_STATUS_CODES.get(e.reason, 409), detail={
+                "error": str(e),
+                "reason": e.reason,
+                "partial_result": e.partial
+            })
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+        finally:
+            watcher.cancel()
+            evaluation_scheduler.release(ticket)
+            release_cancellation(eval_request, cancellation)
+
+@app.post("/jobs", status_code=202)
+def submitJob(eval_request: EvalRequest):
+    """Queue an evaluation and return its job id immediately."""
+    admission = admit_or_shed(eval_request)
+    cancellation = None
     
-    eval_logger.info("main", "Starting evaluation server", {
-        "host": "0.0.0.0",
-        "port": 5000
-    })
+    def runner(progress):
+        try:
+            return run_evaluation(eval_request, progress=progress, cancellation=cancellation)
+        finally:
+            release_cancellation(eval_request, cancellation)
+            admission.close()
+    
+    # Once submitted, the job releases the admission when it ends; until then this does
+    try:
+        cancellation = request_cancellation(eval_request)
+        job = job_manager.submit(
+            runner,
+            metadata={
+                "metric_name": eval_request.metric.name,
+                "metric_type": eval_request.metric.type,
+                "model_name": eval_request.model.name,
+                "run_index": eval_request.run_index,
+                "benchmark_id": eval_request.benchmark_id,
+                "priority": eval_request.priority
+            },
+            cancellation=cancellation,
+            priority=eval_request.priority or INTERACTIVE,
+            flow=eval_request.benchmark_id
+        )
+    except BaseException:
+        if cancellation is not None:
+            release_cancellation(eval_request, cancellation)
+        admission.close()
+        raise
+    return {"job_id": job.job_id, "status": job.status}
+
+@app.post("/pregenerate", status_code=202)
+def pregenerate(pregenerate_request: PregenerateRequest):
+    """
+    Fill the response cache with the outputs of a benchmark before it is judged.
+    Runs as a job; submitting the same combinations again resumes an interrupted run.
+    """
+    if not pregenerate_request.items:
+        raise HTTPException(status_code=400, detail="No items to pre-generate")
+    cancellation = CancellationToken(pregenerate_request.deadline_seconds)
+    benchmark_id = pregenerate_request.benchmark_id
+    if benchmark_id is not None:
+        benchmark_registry.register(benchmark_id, cancellation)
     
-    print("Starting evaluation server on 0.0.0.0:5000", flush=True)
+    def runner(progress):
+        eval_logger.reset()
+        try:
+            return pregenerator.run(pregenerate_request.items, concurrency=pregenerate_request.concurrency,
+                                    progress=progress, cancellation=cancellation)
+        finally:
+            if benchmark_id is not None:
+                benchmark_registry.unregister(benchmark_id, cancellation)
     
-    uvicorn.run(app, host="0.0.0.0", port=5000)
+    batch_id = pregenerator.batch_id(pregenerate_request.items)
+    job = job_manager.submit(
+        runner,
+        metadata={
+            "kind": "pregeneration",
+            "pregeneration_id": batch_id,
+            "items": len(pregenerate_request.items),
+            "benchmark_id": benchmark_id,
+            "priority": BULK
+        },
+        cancellation=cancellation,
+        priority=BULK,
+        flow=benchmark_id
+    )
+    return {"job_id": job.job_id, "status": job.status, "pregeneration_id": batch_id,
+            "items": len(pregenerate_request.items)}
+
+@app.post("/jobs/{job_id}/cancel")
+def cancelJob(job_id: str):
+    """Cancel a queued or running job; it ends as "cancelled" with its partial result."""
+    job = job_manager.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown or expired job: {job_id}")
+    return {"job_id": job.job_id, "status": job.status, "cancellation": job.to_dict()["cancellation"]}
+
+@app.get("/jobs/{job_id}")
+def getJob(job_id: str):
+    """Status, progress, partial results and (once finished) the result of a job."""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown or expired job: {job_id}")
+    return CompactJSONResponse(job.to_dict())
+
+@app.get("/jobs/{job_id}/events")
+async def streamJobEvents(job_id: str, request: Request):
+    """Server-sent events with the progress of a job, ending with its final status."""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown or expired job: {job_id}")
+    # Parsed before the response starts; a malformed id replays all events
+    try:
+        last_event_id = int(request.headers.get("last-event-id", 0) or 0)
+    except ValueError:
+        last_event_id = 0
+    
+    async def event_stream():
+        last_seq = last_event_id
+        while True:
+            for event in job.events_since(last_seq):
+                last_seq = event["seq"]
+                yield f"id: {event['seq']}\nevent: {event['event']}\ndata: {json.dumps(event, default=str)}\n\n"
+            if job.finished and not job.events_since(last_seq):
+                yield f"event: end\ndata: {json.dumps({'job_id': job.job_id, 'status': job.status})}\n\n"
+                return
+            if await request.is_disconnected():
+                return
+            await asyncio.sleep(0.5)
+    
+    return StreamingResponse(event_stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/logs/{logs_id}")
+def getLogs(logs_id: str, request: Request):
+    """Logs of an evaluation requested with log_format "reference", as a JSON list."""
+    data = log_store.get_compressed(logs_id)
+    if data is None:
+        raise HTTPException(status_code=404, detail=f"Unknown or expired logs: {logs_id}")
+    if accepts(request.headers.get("accept-encoding", ""), "gzip"):
+        # Stored gzip compressed; sent as stored to clients accepting gzip
+        return Response(data, media_type="application/json",
+                        headers={"Content-Encoding": "gzip", "Vary": "Accept-Encoding"})
+    return Response(gzip.decompress(data), media_type="application/json", headers={"Vary": "Accept-Encoding"})
+
+@app.post("/benchmarks/{benchmark_id}/cancel")
+def cancelBenchmark(benchmark_id: str):
+    """
+    Cancel all queued and running evaluations of a benchmark, and the requests
+    of the benchmark still arriving from the queue.
+    """
+    cancelled = benchmark_registry.cancel(benchmark_id)
+    evaluation_scheduler.purge_cancelled()
+    return {**benchmark_registry.status(benchmark_id), "cancelled_evaluations": cancelled}
+
+@app.delete("/benchmarks/{benchmark_id}/cancel")
+def liftBenchmarkCancellation(benchmark_id: str):
+    """Accept requests of a cancelled benchmark again, e.g. to re-run it."""
+    benchmark_registry.lift(benchmark_id)
+    return benchmark_registry.status(benchmark_id)
+
+@app.get("/benchmarks/{benchmark_id}")
+def benchmarkStatus(benchmark_id: str):
+    """Evaluations of a benchmark in flight in this worker and its cancellation state."""
+    return benchmark_registry.status(benchmark_id)
+
+@app.get("/scheduler")
+def scheduler():
+    """Running and waiting evaluations by priority class and flow."""
+    return evaluation_scheduler.snapshot()
+
+@app.get("/healthz")
+def healthz():
+    """Liveness: the process serves requests. Includes the current saturation for information."""
+    return {"status": "ok", "worker": os.getpid(), **admission_controller.readiness()}
+
+@app.get("/readyz")
+def readyz():
+    """
+    Readiness: 200 once the warm-up finished and while new bulk requests would
+    be admitted, 503 otherwise. Describes the worker that answers.
+    """
+    readiness = admission_controller.readiness()
+    readiness["ready"] = readiness["ready"] and warmup.ready
+    readiness["warmup"] = warmup.state
+    readiness["worker"] = os.getpid()
+    return JSONResponse(readiness, status_code=200 if readiness["ready"] else 503)
+
+@app.get("/startup")
+def startup():
+    """Import time per module and package at startup and of lazy loads since, and the warm-up steps."""
+    return {**import_profiler.report(), "warmup": warmup.snapshot()}
+
+@app.get("/metrics")
+async def metrics():
+    """Service metrics in the Prometheus text exposition format."""
+    # Sync endpoints run on anyio's default thread limiter, so its tokens
+    # show how saturated the worker threadpool is
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    threadpool_tokens.set(limiter.total_tokens, state="total")
+    threadpool_tokens.set(limiter.borrowed_tokens, state="borrowed")
+    if worker_snapshots is not None:
+        # Merged with the other workers' published metrics (see shared_state)
+        return PlainTextResponse(await anyio.to_thread.run_sync(worker_snapshots.render_metrics),
+                                 media_type="text/plain; version=0.0.4")
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/cache/stats")
+def cacheStats():
+    """Entries, bytes and age histogram of the response cache, and the hit ratio of this worker."""
+    return {**response_cache_maintenance.stats(), "hit_ratio": response_cache_maintenance.hit_ratio(),
+            "worker": os.getpid()}
+
+@app.post("/cache/sweep")
+def sweepCache():
+    """Remove expired entries and unused lock files, enforce the size bound and run the other sweeps now."""
+    return response_cache_maintenance.sweep_all()
+
+@app.get("/usage")
+def usage():
+    """Token usage aggregated over all evaluations served by the service (all workers)."""
+    if worker_snapshots is not None:
+        return worker_snapshots.usage()
+    return usage_totals.snapshot()
+
+@app.get("/engines")
+def engines():
+    """Health and circuit state of the TALE search engines as seen by this process."""
+    return engine_health.snapshot()
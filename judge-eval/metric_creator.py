@@ -9,11 +9,14 @@ from deepeval.metrics.dag import (
     VerdictNode,
 )
 from deepeval.test_case import LLMTestCaseParams
-from talemetric import TALEMetric
 import json
 import os
 from eval_logger import eval_logger
 from judge import Judge
+from geval_steps_cache import geval_steps_cache, StepsCachingGEval
+from eval_context import current_context, report_progress
+from usage_tracker import usage_phase
+from tracing import set_span_attributes
 
 class MetricCreator:
     """
@@ -52,7 +55,11 @@ class MetricCreator:
         judge_model = Judge(
             api_base=self.metric.model.url,
             api_key=self.metric.model.key,
-            model_name=self.metric.model.name
+            model_name=self.metric.model.name,
+            prices={
+                "input": self.metric.model.input_price_per_million,
+                "output": self.metric.model.output_price_per_million
+            }
         )
         eval_logger.info("metric_creator", "Created custom judge model", {
             "judge_model_name": self.metric.model.name,
@@ -92,7 +99,7 @@ class MetricCreator:
                         "criteria": metric_definition.get('criteria', ''),
                         "criteria_length": len(metric_definition.get('criteria', ''))
                     })
-                    return GEval(**geval_kwargs)
+                    return self._create_criteria_geval(geval_kwargs, evaluation_params)
                 else:
                     # Default to criteria if no type specified
                     default_criteria = 'Evaluate the response quality'
@@ -101,13 +108,17 @@ class MetricCreator:
                         "criteria": geval_kwargs['criteria'],
                         "reason": "No type specified in metric definition"
                     })
-                    return GEval(**geval_kwargs)
+                    return self._create_criteria_geval(geval_kwargs, evaluation_params)
 
             case "tale":
                 eval_logger.decision("metric_creator", "Creating TALE metric", {
                     "metric_type": "tale"
                 })
                 
+                # TALE and its search, scraping and parsing dependencies are
+                # only loaded once a TALE metric is used
+                from talemetric import TALEMetric
+
                 # TALE metric configuration from definition
                 task = metric_definition.get('task')
                 if task is None:
@@ -135,6 +146,30 @@ class MetricCreator:
                 
                 if metric_definition.get('time_range') is not None:
                     tale_kwargs['time_range'] = metric_definition.get('time_range')
+                
+                if metric_definition.get('fused_reflection') is not None:
+                    tale_kwargs['fused_reflection'] = bool(metric_definition.get('fused_reflection'))
+                
+                if metric_definition.get('max_queries_per_iteration') is not None:
+                    tale_kwargs['max_queries_per_iteration'] = metric_definition.get('max_queries_per_iteration')
+                
+                if metric_definition.get('near_duplicate_threshold') is not None:
+                    tale_kwargs['near_duplicate_threshold'] = float(metric_definition.get('near_duplicate_threshold'))
+                
+                if metric_definition.get('use_local_index') is not None:
+                    tale_kwargs['use_local_index'] = bool(metric_definition.get('use_local_index'))
+                
+                if metric_definition.get('local_index_min_score') is not None:
+                    tale_kwargs['local_index_min_score'] = float(metric_definition.get('local_index_min_score'))
+                
+                if metric_definition.get('local_index_min_results') is not None:
+                    tale_kwargs['local_index_min_results'] = int(metric_definition.get('local_index_min_results'))
+                
+                if metric_definition.get('local_index_max_age_hours') is not None:
+                    tale_kwargs['local_index_max_age_hours'] = float(metric_definition.get('local_index_max_age_hours'))
+                
+                if metric_definition.get('deadline_reserve_seconds') is not None:
+                    tale_kwargs['deadline_reserve_seconds'] = float(metric_definition.get('deadline_reserve_seconds'))
 
                 eval_logger.info("metric_creator", "TALE metric configuration", {
                     "provided_params": list(tale_kwargs.keys()),
@@ -192,6 +227,8 @@ class MetricCreator:
                     threshold=getattr(self.metric, 'threshold', 0.5)  # Use metric threshold or default
                 )
                 
+                self._track_dag_usage(dag_metric)
+                
                 eval_logger.decision("metric_creator", "DAG metric created successfully", {
                     "metric_name": self.metric.name,
                     "threshold": getattr(self.metric, 'threshold', 0.5)
@@ -206,6 +243,46 @@ class MetricCreator:
                 })
                 raise ValueError(f"Unknown metric type: {self.metric.type}")
 
+    def _create_criteria_geval(self, geval_kwargs, evaluation_params):
+        """
+        Create a criteria-based G-Eval that reuses previously derived evaluation steps.
+
+        DeepEval derives evaluation steps from the criteria on every measure. The
+        derivation is cached per (criteria, evaluation params, judge model), so only
+        the first evaluation pays the extra judge round trip; later ones receive the
+        cached steps and score against exactly the same steps.
+        """
+        criteria = geval_kwargs['criteria']
+        steps_cache_key = geval_steps_cache.make_key(criteria, evaluation_params, self.metric.model)
+        cached_entry = geval_steps_cache.get_entry(steps_cache_key)
+        cached_steps = cached_entry['evaluation_steps'] if cached_entry else None
+
+        set_span_attributes(steps_cache_hit=bool(cached_steps))
+        if cached_steps:
+            geval_kwargs['evaluation_steps'] = cached_steps
+            context = current_context()
+            if context is not None:
+                context.usage.record_saving("geval_steps_cache", cached_entry.get('derivation_usage'))
+            eval_logger.decision("metric_creator", "Using cached evaluation steps for criteria", {
+                "cache_key": steps_cache_key,
+                "steps": cached_steps,
+                "steps_count": len(cached_steps)
+            })
+        else:
+            eval_logger.info("metric_creator", "No cached evaluation steps, judge will derive them", {
+                "cache_key": steps_cache_key
+            })
+
+        return StepsCachingGEval(
+            steps_cache_key=steps_cache_key,
+            steps_cache_metadata={
+                "criteria": criteria,
+                "evaluation_params": [str(param) for param in evaluation_params],
+                "judge_model_name": self.metric.model.name
+            },
+            **geval_kwargs
+        )
+
     def _get_metric_params(self):
         eval_logger.info("metric_creator", "Determining metric parameters")
         evaluation_params = []
@@ -234,6 +311,83 @@ class MetricCreator:
         
         return evaluation_params
 
+    # Frontend node type names of the DeepEval node classes
+    DAG_NODE_TYPES = {
+        "TaskNode": "tasknode",
+        "BinaryJudgementNode": "binaryjudge",
+        "NonBinaryJudgementNode": "nonbinaryjudge",
+        "VerdictNode": "verdict"
+    }
+
+    def _track_dag_usage(self, dag_metric):
+        """
+        Attribute the judge calls of every DAG node to a usage phase of its own.
+
+        DAGMetric copies the graph it is given, so the nodes are instrumented on
+        the metric's copy. Phases are named "<node type>#<n>[:<label>]" with n
+        numbering the nodes in depth-first order starting at the root.
+        """
+        visited = set()
+        counter = 0
+
+        def visit(node):
+            nonlocal counter
+            if node is None or id(node) in visited:
+                return
+            visited.add(id(node))
+            counter += 1
+
+            node_type = self.DAG_NODE_TYPES.get(type(node).__name__, type(node).__name__.lower())
+            phase = f"{node_type}#{counter}"
+            label = getattr(node, 'label', None)
+            if label:
+                phase += f":{label}"
+            self._track_node_usage(node, phase)
+
+            for child in getattr(node, 'children', None) or []:
+                visit(child)
+            child = getattr(node, 'child', None)
+            if child is not None and hasattr(child, '_execute'):
+                visit(child)
+
+        for root in getattr(dag_metric.dag, 'root_nodes', []):
+            visit(root)
+
+    def _track_node_usage(self, node, phase):
+        """Wrap the hooks through which a DAG node calls the judge so the calls run inside the node's phase."""
+        def tracked(method, report):
+            def tracked_method(*args, **kwargs):
+                with usage_phase(phase):
+                    result = method(*args, **kwargs)
+                if report:
+                    report_progress("dag_node_completed", node=phase)
+                return result
+            return tracked_method
+
+        def a_tracked(method, report):
+            async def tracked_method(*args, **kwargs):
+                with usage_phase(phase):
+                    result = await method(*args, **kwargs)
+                if report:
+                    report_progress("dag_node_completed", node=phase)
+                return result
+            return tracked_method
+
+        for name, wrap, report in (('_execute', tracked, True), ('_a_execute', a_tracked, True),
+                                   ('_generate_reason', tracked, False), ('_a_generate_reason', a_tracked, False)):
+            method = getattr(node, name, None)
+            if method is None:
+                continue
+            try:
+                setattr(node, name, wrap(method, report))
+            except (AttributeError, TypeError) as e:
+                # Usage is then attributed to the enclosing "dag" phase
+                eval_logger.debug("metric_creator", "Could not track usage of DAG node", {
+                    "node_type": type(node).__name__,
+                    "hook": name,
+                    "error": str(e)
+                })
+
     def _create_dag_node(self, node_definition, evaluation_params):
         """
         Recursively create DAG nodes from frontend definition.
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Optional, List, Union, Literal
 
 class Prompt(BaseModel):
     input: str
@@ -11,6 +11,9 @@ class ModelInfo(BaseModel):
     name: str
     url: str
     key: str
+    # Optional prices per million tokens, used for cost accounting
+    input_price_per_million: Optional[float] = None
+    output_price_per_million: Optional[float] = None
 
 class Metric(BaseModel):
     type: str
@@ -25,3 +28,29 @@ class EvalRequest(BaseModel):
     metric: Metric
     system_prompt: Optional[str] = ""
     run_index: Optional[int] = 1
+    stream: Optional[bool] = False
+    # Seconds the caller waits for the result; work is cancelled after that
+    deadline_seconds: Optional[float] = None
+    # Benchmark (or other correlation id) the request belongs to, used to cancel all its evaluations
+    benchmark_id: Optional[Union[int, str]] = None
+    # Scheduling class: interactive evaluations are admitted before bulk benchmark runs
+    priority: Optional[Literal["interactive", "bulk"]] = "interactive"
+    # How the logs are returned: as a JSON encoded string ("string"), as a list of
+    # entries ("structured") or stored server side and fetched with GET /logs/{logs_id}
+    # using the logs_id of the result ("reference")
+    log_format: Optional[Literal["string", "structured", "reference"]] = "string"
+
+class PregenerateItem(BaseModel):
+    prompt: Prompt
+    model: ModelInfo
+    system_prompt: Optional[str] = ""
+
+class PregenerateRequest(BaseModel):
+    # All (prompt, model, system prompt) combinations of a benchmark
+    items: List[PregenerateItem]
+    # Benchmark the outputs are generated for; cancelling it stops the pre-generation
+    benchmark_id: Optional[Union[int, str]] = None
+    # Concurrent generations per provider; defaults to PREGENERATION_CONCURRENCY
+    concurrency: Optional[int] = None
+    # Seconds after which the pre-generation stops; none by default
+    deadline_seconds: Optional[float] = None
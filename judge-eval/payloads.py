@@ -0,0 +1,180 @@
+"""
+Compact encoding and compression of response payloads.
+
+Result payloads dominate the traffic to the PHP site and the size of its
+result rows: the logs of an evaluation hold every judge prompt and response,
+and used to be JSON encoded into a string and then encoded again as part of
+the response, with ASCII escapes for every non-ASCII character. Payloads are
+now
+
+    - encoded once, with orjson when it is installed (the json module
+      otherwise), without whitespace and without escaping non-ASCII text,
+    - compressed with zstd (when the zstandard module is installed) or gzip if
+      the client accepts it (Accept-Encoding, honouring q-values); streamed
+      responses such as server-sent events are passed through unchanged.
+
+How the logs are returned is chosen per request (see EvalRequest.log_format
+and log_store).
+
+Configuration (environment variables):
+    RESPONSE_COMPRESSION             Set to "false" to never compress responses (default: true)
+    RESPONSE_COMPRESSION_MIN_BYTES   Smaller bodies are sent uncompressed (default: 1024)
+    RESPONSE_GZIP_LEVEL              gzip compression level (default: 6)
+    RESPONSE_ZSTD_LEVEL              zstd compression level (default: 3)
+"""
+
+import os
+import json
+import gzip
+from typing import Any, Dict, Optional
+import anyio.to_thread
+from fastapi.responses import JSONResponse
+from starlette.datastructures import Headers, MutableHeaders
+from service_metrics import response_bytes
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# Bodies above this size are compressed in a worker thread instead of the event loop
+_THREAD_COMPRESSION_BYTES = 256 * 1024
+
+
+def dumps(value: Any) -> bytes:
+    """Encode a value as compact UTF-8 JSON; values JSON cannot represent are converted with str()."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(value, default=str, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            # e.g. integers beyond 64 bits, which the json module handles
+            pass
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+
+
+def dumps_str(value: Any) -> str:
+    """Like dumps(), as a str."""
+    return dumps(value).decode("utf-8")
+
+
+class CompactJSONResponse(JSONResponse):
+    """JSONResponse encoded with dumps()."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def supported_encodings():
+    return ("zstd", "gzip") if zstandard is not None else ("gzip",)
+
+
+def _preferences(accept_encoding: str) -> Dict[str, float]:
+    """Quality value by content coding of an Accept-Encoding header."""
+    preferences = {}
+    for part in accept_encoding.split(","):
+        coding, _, parameters = part.strip().partition(";")
+        coding = coding.strip().lower()
+        quality = 1.0
+        parameter = parameters.strip()
+        if parameter.startswith("q="):
+            try:
+                quality = float(parameter[2:])
+            except ValueError:
+                quality = 0.0
+        if coding:
+            preferences[coding] = quality
+    return preferences
+
+
+def accepts(accept_encoding: str, coding: str) -> bool:
+    """Whether an Accept-Encoding header accepts a content coding."""
+    preferences = _preferences(accept_encoding)
+    return preferences.get(coding, preferences.get("*", 0.0)) > 0
+
+
+def negotiate(accept_encoding: str) -> Optional[str]:
+    """Pick the supported content coding the client prefers, zstd over gzip on equal preference."""
+    preferences = _preferences(accept_encoding)
+    candidates = [(preferences.get(coding, preferences.get("*", 0.0)), -rank, coding)
+                  for rank, coding in enumerate(supported_encodings())]
+    quality, _, coding = max(candidates)
+    return coding if quality > 0 else None
+
+
+def compress(body: bytes, encoding: str, gzip_level: int = 6, zstd_level: int = 3) -> bytes:
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=zstd_level).compress(body)
+    return gzip.compress(body, compresslevel=gzip_level, mtime=0)
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing complete response bodies for clients that accept it.
+
+    Responses sent in several chunks (streaming, server-sent events), responses
+    already carrying a Content-Encoding and small bodies are passed through.
+    """
+
+    def __init__(self, app, min_bytes: int = 1024, gzip_level: int = 6, zstd_level: int = 3):
+        self.app = app
+        self.min_bytes = min_bytes
+        self.gzip_level = gzip_level
+        self.zstd_level = zstd_level
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+
+        async def send_compressed(message):
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                # Held back until the body shows whether it is worth compressing
+                start_message = message
+                return
+            if message["type"] != "http.response.body" or start_message is None:
+                await send(message)
+                return
+
+            start, start_message = start_message, None
+            body = message.get("body", b"")
+            headers = MutableHeaders(raw=start["headers"])
+            if (message.get("more_body", False) or len(body) < self.min_bytes or "content-encoding" in headers
+                    or headers.get("content-type", "").startswith("text/event-stream")):
+                await send(start)
+                await send(message)
+                return
+
+            if len(body) > _THREAD_COMPRESSION_BYTES:
+                compressed = await anyio.to_thread.run_sync(compress, body, encoding, self.gzip_level,
+                                                            self.zstd_level)
+            else:
+                compressed = compress(body, encoding, self.gzip_level, self.zstd_level)
+            response_bytes.inc(len(body), encoding=encoding, stage="uncompressed")
+            response_bytes.inc(len(compressed), encoding=encoding, stage="sent")
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(compressed))
+            headers.add_vary_header("Accept-Encoding")
+            await send(start)
+            await send({**message, "body": compressed})
+
+        await self.app(scope, receive, send_compressed)
+
+
+# Response compression settings
+COMPRESSION_ENABLED = os.environ.get("RESPONSE_COMPRESSION", "true").lower() != "false"
+COMPRESSION_MIN_BYTES = int(os.environ.get("RESPONSE_COMPRESSION_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.environ.get("RESPONSE_GZIP_LEVEL", "6"))
+ZSTD_LEVEL = int(os.environ.get("RESPONSE_ZSTD_LEVEL", "3"))
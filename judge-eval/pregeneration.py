@@ -0,0 +1,230 @@
+"""
+Pre-generation of the model outputs of a benchmark.
+
+Each evaluation generates its output and then judges it, so during a
+benchmark the model under test and the judge take turns: judge capacity sits
+idle while outputs are generated and neither provider is driven at the
+concurrency it handles best. POST /pregenerate takes all (prompt, model,
+system prompt) combinations of a benchmark and fills the LlmRequestor
+response cache ahead of the evaluations, which then only judge:
+
+    - combinations sharing a cache entry (e.g. several runs of one prompt)
+      are generated once,
+    - every provider (model URL) gets its own pool of `concurrency` threads,
+      so a slow provider does not hold back the others; the adaptive provider
+      limiter (see concurrency_limiter) still lowers the rate on overload,
+    - combinations already in the cache are skipped, so submitting the same
+      benchmark again after a failure, a cancellation or a restart resumes
+      where the previous run stopped,
+    - a failed generation is counted and reported, the others carry on.
+
+The pre-generation runs as a job (see jobs) in the bulk priority class:
+GET /jobs/{id} and its event stream report its progress, POST
+/jobs/{id}/cancel or cancelling its benchmark stops it.
+
+Configuration (environment variables):
+    PREGENERATION_CONCURRENCY        Concurrent generations per provider (default: 8)
+    PREGENERATION_PROGRESS_SECONDS   Least interval between progress events (default: 2)
+"""
+
+import os
+import time
+import hashlib
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+from eval_logger import eval_logger
+from eval_context import EvaluationContext, evaluation_context
+from cancellation import CancellationToken, EvaluationCancelled
+from llmrequestor import LlmRequestor, response_cache_key
+from models import PregenerateItem
+from scheduler import BULK
+from service_metrics import pregenerations
+
+GENERATED = "generated"
+CACHED = "cached"
+FAILED = "failed"
+SKIPPED = "skipped"
+
+# Errors listed in the result; the others are only counted
+_MAX_REPORTED_ERRORS = 20
+
+
+def _provider(item: PregenerateItem) -> str:
+    return item.model.url.rstrip("/").lower()
+
+
+class PregenerationRun:
+    """Progress of one pre-generation. Thread-safe."""
+
+    def __init__(self, total: int, unique: int, progress: Optional[Callable[[str, Dict[str, Any]], None]],
+                 progress_seconds: float):
+        self.total = total
+        self.unique = unique
+        self.progress = progress
+        self.progress_seconds = progress_seconds
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+        self._counts = {GENERATED: 0, CACHED: 0, FAILED: 0, SKIPPED: 0}
+        self._providers: Dict[str, Dict[str, int]] = {}
+        self._errors: List[Dict[str, Any]] = []
+        self._tokens = 0
+        self._last_report = 0.0
+
+    def record(self, provider: str, outcome: str, tokens: int = 0, error: Optional[Dict[str, Any]] = None):
+        pregenerations.inc(outcome=outcome)
+        with self._lock:
+            self._counts[outcome] += 1
+            counts = self._providers.setdefault(provider, {GENERATED: 0, CACHED: 0, FAILED: 0, SKIPPED: 0})
+            counts[outcome] += 1
+            self._tokens += tokens
+            if error is not None and len(self._errors) < _MAX_REPORTED_ERRORS:
+                self._errors.append(error)
+            now = time.perf_counter()
+            due = now - self._last_report >= self.progress_seconds
+            if due:
+                self._last_report = now
+        if due:
+            self.report()
+
+    def report(self):
+        if self.progress is None:
+            return
+        summary = self.summary()
+        self.progress("pregeneration_progress", {key: summary[key] for key in
+                                                 ("unique", "done", GENERATED, CACHED, FAILED, SKIPPED)})
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            done = sum(self._counts.values())
+            return {
+                "items": self.total,
+                "unique": self.unique,
+                "done": done,
+                **self._counts,
+                "completion_tokens": self._tokens,
+                "duration_seconds": round(time.perf_counter() - self.started, 3),
+                "providers": {provider: dict(counts) for provider, counts in self._providers.items()},
+                "errors": list(self._errors)
+            }
+
+
+class Pregenerator:
+    """
+    Fills the response cache with the outputs of a benchmark.
+
+    Args:
+        concurrency: Concurrent generations per provider
+        progress_seconds: Least interval between progress events
+    """
+
+    def __init__(self, concurrency: int = 8, progress_seconds: float = 2.0):
+        self.concurrency = max(1, concurrency)
+        self.progress_seconds = progress_seconds
+
+    @staticmethod
+    def batch_id(items: List[PregenerateItem]) -> str:
+        """Identify a list of combinations, so resubmissions of one benchmark can be recognised."""
+        digest = hashlib.sha256()
+        for item in items:
+            digest.update(response_cache_key(item.prompt, item.model, item.system_prompt or "").encode())
+        return digest.hexdigest()[:16]
+
+    def run(self, items: List[PregenerateItem], concurrency: Optional[int] = None,
+            progress: Optional[Callable[[str, Dict[str, Any]], None]] = None,
+            cancellation: Optional[CancellationToken] = None) -> Dict[str, Any]:
+        """
+        Generate the outputs missing from the cache.
+
+        Returns:
+            dict: Counts of generated, cached (skipped as already cached), failed and
+                  skipped (not started because of a cancellation) combinations, per
+                  provider and in total, with the first errors
+
+        Raises:
+            EvaluationCancelled: The pre-generation was cancelled; its partial holds the summary
+        """
+        cancellation = cancellation or CancellationToken()
+        concurrency = max(1, concurrency or self.concurrency)
+
+        unique: Dict[str, PregenerateItem] = {}
+        for item in items:
+            unique.setdefault(response_cache_key(item.prompt, item.model, item.system_prompt or ""), item)
+        by_provider: Dict[str, List[PregenerateItem]] = {}
+        for item in unique.values():
+            by_provider.setdefault(_provider(item), []).append(item)
+
+        run = PregenerationRun(len(items), len(unique), progress, self.progress_seconds)
+        eval_logger.info("pregeneration", "Pre-generation started", {
+            "items": len(items),
+            "unique": len(unique),
+            "providers": {provider: len(provider_items) for provider, provider_items in by_provider.items()},
+            "concurrency": concurrency
+        })
+
+        executors = [ThreadPoolExecutor(max_workers=min(concurrency, len(provider_items)),
+                                        thread_name_prefix="pregenerate")
+                     for provider_items in by_provider.values()]
+        try:
+            futures = [
+                executor.submit(contextvars.Context().run, self._generate, provider, item, run, cancellation)
+                for executor, (provider, provider_items) in zip(executors, by_provider.items())
+                for item in provider_items
+            ]
+            for future in futures:
+                future.result()
+        finally:
+            for executor in executors:
+                executor.shutdown(wait=True)
+
+        run.report()
+        summary = run.summary()
+        eval_logger.info("pregeneration", "Pre-generation finished", {
+            key: value for key, value in summary.items() if key != "errors"
+        })
+        if cancellation.cancelled:
+            stopped = EvaluationCancelled(cancellation.reason)
+            stopped.partial = summary
+            raise stopped
+        return summary
+
+    def _generate(self, provider: str, item: PregenerateItem, run: PregenerationRun,
+                  cancellation: CancellationToken):
+        """Generate one output in a context of its own (log session, usage, cancellation)."""
+        if cancellation.cancelled:
+            run.record(provider, SKIPPED)
+            return
+        eval_logger.reset()
+        context = EvaluationContext(cancellation=cancellation, priority=BULK)
+        with evaluation_context(context):
+            requestor = LlmRequestor(item.prompt, item.model, item.system_prompt or "")
+            try:
+                if requestor.is_cached():
+                    run.record(provider, CACHED)
+                    return
+                requestor.request()
+            except EvaluationCancelled:
+                run.record(provider, SKIPPED)
+                return
+            except Exception as e:
+                run.record(provider, FAILED, error={
+                    "model": item.model.name,
+                    "prompt_input": item.prompt.input[:100],
+                    "error": str(e),
+                    "error_type": type(e).__name__
+                })
+                return
+        # Served from the cache: another worker filled it while this one waited for its lock
+        if requestor.generation_stats.get("cached"):
+            run.record(provider, CACHED)
+            return
+        usage = requestor.generation_stats.get("usage") or {}
+        run.record(provider, GENERATED, tokens=usage.get("completion_tokens") or 0)
+
+
+# Global pregenerator instance
+pregenerator = Pregenerator(
+    concurrency=int(os.environ.get("PREGENERATION_CONCURRENCY", "8")),
+    progress_seconds=float(os.environ.get("PREGENERATION_PROGRESS_SECONDS", "2"))
+)
@@ -0,0 +1,168 @@
+"""
+Bounded process pool for CPU-bound evidence processing.
+
+Parsing a fetched page with BeautifulSoup, cleaning its text and shingling it
+for the near-duplicate check is pure Python CPU work. Run on the request
+threads it held the GIL for as long as a big page took to parse, stalling
+every other request of the process, including G-Eval requests that only wait
+for I/O. The work now runs in a pool of worker processes shared by all
+requests of the process:
+
+    - page bytes are handed to the pool as fetched, without decoding them in
+      the request thread; only the cleaned text and its sketch come back,
+    - at most `max_pending` pages are queued or processed at once, further
+      callers wait for a free place, which bounds the memory held by queued pages,
+    - waiting stops when the evaluation is cancelled or the timeout passes,
+    - a broken pool (e.g. a worker process killed by the OOM killer) is
+      replaced on the next call.
+
+The workers are started with "spawn", since forking a process that runs
+threads can copy locks held by other threads. Spawned processes import the
+__main__ module of the service again, which is why it is started with
+server.py rather than main.py. With TEXT_PROCESSING_WORKERS=0
+the work runs on the calling thread as before. Every serving worker (see
+shared_state) has its own pool.
+
+Configuration (environment variables):
+    TEXT_PROCESSING_WORKERS       Processes of the pool, 0 to process inline (default: CPU count, at most 4)
+    TEXT_PROCESSING_MAX_PENDING   Pages queued or processed at once (default: 4 per process)
+    TEXT_PROCESSING_TIMEOUT       Seconds a page may take, including the wait for a place (default: 30)
+"""
+
+import os
+import time
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Optional
+from eval_logger import eval_logger
+from cancellation import CancellationToken
+from service_metrics import text_processing_duration, text_processing_pending
+
+# Interval at which waiting callers look at their cancellation token
+_CANCELLATION_POLL_SECONDS = 0.5
+
+
+class ProcessingPool:
+    """
+    Process pool running functions of text_processing. Thread-safe.
+
+    Args:
+        workers: Worker processes, 0 to run the functions on the calling thread
+        max_pending: Calls queued or running at once
+        timeout: Longest time a call may take, including the wait for a place
+    """
+
+    def __init__(self, workers: int = 4, max_pending: int = 16, timeout: float = 30.0):
+        self.workers = max(0, workers)
+        self.max_pending = max(1, max_pending)
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._places = threading.BoundedSemaphore(self.max_pending)
+        self.pending = 0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                     mp_context=multiprocessing.get_context("spawn"))
+                eval_logger.info("processing_pool", "Started text processing pool", {
+                    "workers": self.workers,
+                    "max_pending": self.max_pending
+                })
+            return self._executor
+
+    def _discard_executor(self, executor: ProcessPoolExecutor):
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+        eval_logger.log_error("processing_pool", "Text processing pool broke, it is replaced on the next call")
+
+    def run(self, function: Callable[..., Any], *args: Any, timeout: Optional[float] = None,
+            cancellation: Optional[CancellationToken] = None) -> Any:
+        """
+        Run a function of text_processing in the pool and return its result.
+
+        Args:
+            timeout: Shorter timeout than the pool's, e.g. the time left before a deadline
+            cancellation: Token of the evaluation; waiting stops when it is cancelled
+
+        Raises:
+            TimeoutError: No place became free or the function did not finish in time
+            EvaluationCancelled: The evaluation was cancelled while waiting
+            BrokenProcessPool: A worker process died while running the function
+        """
+        if not self.workers:
+            return function(*args)
+
+        started = time.perf_counter()
+        deadline = time.monotonic() + (self.timeout if timeout is None else min(timeout, self.timeout))
+        self._wait_for_place(deadline, cancellation)
+        outcome = "error"
+        try:
+            executor = self._get_executor()
+            try:
+                future = executor.submit(function, *args)
+            except BrokenProcessPool:
+                self._discard_executor(executor)
+                executor = self._get_executor()
+                future = executor.submit(function, *args)
+
+            while True:
+                if cancellation is not None and cancellation.cancelled:
+                    future.cancel()
+                    outcome = "cancelled"
+                    cancellation.check()
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    # A started call keeps its process busy until it finishes
+                    future.cancel()
+                    outcome = "timeout"
+                    raise TimeoutError(f"Text processing did not finish within {self.timeout}s")
+                try:
+                    result = future.result(timeout=min(remaining, _CANCELLATION_POLL_SECONDS))
+                    outcome = "success"
+                    return result
+                except FutureTimeoutError:
+                    continue
+                except BrokenProcessPool:
+                    self._discard_executor(executor)
+                    raise
+        finally:
+            with self._lock:
+                self.pending -= 1
+            self._places.release()
+            text_processing_duration.observe(time.perf_counter() - started, function=function.__name__,
+                                             outcome=outcome)
+
+    def _wait_for_place(self, deadline: float, cancellation: Optional[CancellationToken]):
+        while not self._places.acquire(timeout=min(max(0.0, deadline - time.monotonic()),
+                                                   _CANCELLATION_POLL_SECONDS)):
+            if cancellation is not None:
+                cancellation.check()
+            if time.monotonic() >= deadline:
+                raise TimeoutError(f"No place in the text processing pool within {self.timeout}s")
+        with self._lock:
+            self.pending += 1
+
+    def shutdown(self):
+        """Stop the worker processes; a later call starts a new pool."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+_workers = int(os.environ.get("TEXT_PROCESSING_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+# Global processing pool instance
+processing_pool = ProcessingPool(
+    workers=_workers,
+    max_pending=int(os.environ.get("TEXT_PROCESSING_MAX_PENDING", str(4 * max(1, _workers)))),
+    timeout=float(os.environ.get("TEXT_PROCESSING_TIMEOUT", "30"))
+)
+
+text_processing_pending.set_callback(lambda: {(): processing_pool.pending})
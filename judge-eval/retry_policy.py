@@ -0,0 +1,239 @@
+"""
+Per-call retry policies for provider calls.
+
+A transient failure of a single judge or model call used to fail the whole
+evaluation, which the PHP side then re-ran from scratch. Calls are now retried
+individually:
+
+    - only retryable failures are retried: timeouts, connection errors and the
+      statuses in `retryable_statuses` (429, 5xx, ...),
+    - attempts are separated by exponential backoff with full jitter,
+    - every attempt has its own connect/read timeout, shortened to the time
+      left before the evaluation's deadline,
+    - retries draw from a retry budget that refills with successful traffic,
+      so an outage does not multiply the load on the provider.
+
+Retries are counted per evaluation and returned with the result.
+
+Configuration (environment variables):
+    RETRY_MAX_ATTEMPTS        Attempts per call including the first (default: 4)
+    RETRY_BASE_DELAY          Backoff base in seconds (default: 0.5)
+    RETRY_MAX_DELAY           Backoff cap in seconds (default: 20)
+    RETRY_BUDGET_RATIO        Retries earned per call (default: 0.2)
+    JUDGE_CONNECT_TIMEOUT     Judge connect timeout in seconds (default: 10)
+    JUDGE_READ_TIMEOUT        Judge read timeout in seconds (default: 120)
+    MODEL_CONNECT_TIMEOUT     Model under test connect timeout in seconds (default: 10)
+    MODEL_READ_TIMEOUT        Model under test read timeout in seconds (default: 300)
+"""
+
+import os
+import sys
+import time
+import random
+import threading
+from typing import Callable, Optional, Tuple, Any, Dict, FrozenSet
+from eval_logger import eval_logger
+from service_metrics import provider_retries
+from tracing import set_span_attributes
+from cancellation import CancellationToken, EvaluationCancelled
+
+
+RETRYABLE_STATUSES = frozenset({408, 409, 425, 429, 500, 502, 503, 504})
+
+
+def _client_errors():
+    """
+    The openai and requests modules if they are loaded. They are imported
+    lazily by the callers; an error of a module that was never loaded cannot
+    occur, so classifying errors must not import them.
+    """
+    return sys.modules.get("openai"), sys.modules.get("requests")
+
+
+def error_status(error: BaseException) -> Optional[int]:
+    """Return the HTTP status carried by an error, if any."""
+    openai, requests = _client_errors()
+    if openai is not None and isinstance(error, openai.APIStatusError):
+        return error.status_code
+    response = getattr(error, "response", None)
+    if requests is not None and isinstance(error, requests.exceptions.RequestException) and response is not None:
+        return response.status_code
+    return None
+
+
+class RetryBudget:
+    """
+    Token bucket limiting retries to a fraction of the traffic. Thread-safe.
+
+    Every call deposits `ratio` tokens and every retry withdraws one, so at
+    most about `ratio` retries are made per call in the long run. The bucket
+    starts full so a quiet service can still retry a few isolated failures.
+    """
+
+    def __init__(self, ratio: float = 0.2, max_tokens: float = 20.0):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self._tokens = max_tokens
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        with self._lock:
+            if self._tokens < 1.0:
+                return False
+            self._tokens -= 1.0
+            return True
+
+
+class RetryStats:
+    """Retries made during one evaluation, by component. Thread-safe."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_component: Dict[str, Dict[str, int]] = {}
+
+    def record(self, component: str, retries: int, exhausted: bool):
+        with self._lock:
+            stats = self._by_component.setdefault(component, {"retries": 0, "calls_retried": 0, "calls_failed": 0})
+            stats["retries"] += retries
+            stats["calls_retried"] += 1 if retries else 0
+            stats["calls_failed"] += 1 if exhausted else 0
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            by_component = {component: dict(stats) for component, stats in self._by_component.items()}
+        return {
+            "total_retries": sum(stats["retries"] for stats in by_component.values()),
+            "by_component": by_component
+        }
+
+
+class RetryPolicy:
+    """
+    Retry behaviour of one kind of provider call.
+
+    Args:
+        component: Name used in logs, metrics and retry stats ("judge", "model_under_test")
+        max_attempts: Attempts per call including the first
+        base_delay: Backoff base in seconds
+        max_delay: Backoff cap in seconds
+        timeout: (connect, read) timeout of each attempt in seconds
+        retryable_statuses: HTTP statuses worth retrying
+        budget: Retry budget shared by all calls using this policy
+    """
+
+    def __init__(self, component: str, max_attempts: int = 4, base_delay: float = 0.5, max_delay: float = 20.0,
+                 timeout: Tuple[float, float] = (10.0, 120.0),
+                 retryable_statuses: FrozenSet[int] = RETRYABLE_STATUSES,
+                 budget: Optional[RetryBudget] = None):
+        self.component = component
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self.retryable_statuses = retryable_statuses
+        self.budget = budget or RetryBudget()
+
+    def is_retryable(self, error: BaseException) -> bool:
+        openai, requests = _client_errors()
+        if openai is not None and isinstance(error, (openai.APITimeoutError, openai.APIConnectionError)):
+            return True
+        if requests is not None and isinstance(error, (requests.exceptions.Timeout,
+                                                       requests.exceptions.ConnectionError)):
+            return True
+        status = error_status(error)
+        return status is not None and status in self.retryable_statuses
+
+    def backoff(self, retry: int) -> float:
+        """Full jitter: a random delay up to base_delay * 2^retry, capped at max_delay."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** retry)))
+
+    def run(self, operation: Callable[[Tuple[float, float]], Any], stats: Optional[RetryStats] = None,
+            cancellation: Optional[CancellationToken] = None) -> Any:
+        """
+        Run operation(timeout) until it succeeds, fails permanently or runs out of attempts.
+
+        Args:
+            operation: Performs one attempt with the given (connect, read) timeout and
+                returns its result; raises on failure
+            stats: Retry stats of the running evaluation
+            cancellation: Token of the running evaluation; attempts are not started
+                and backoff is not slept past its deadline
+
+        Returns:
+            The result of the first successful attempt
+
+        Raises:
+            EvaluationCancelled: The evaluation was cancelled or its deadline passed
+        """
+        self.budget.deposit()
+        retries = 0
+        try:
+            while True:
+                timeout = cancellation.clamp_timeout(self.timeout) if cancellation is not None else self.timeout
+                try:
+                    result = operation(timeout)
+                except Exception as e:
+                    if cancellation is not None:
+                        # A timeout shortened by the deadline is not a provider failure
+                        cancellation.check()
+                    retryable = self.is_retryable(e)
+                    if not retryable or retries + 1 >= self.max_attempts or not self.budget.withdraw():
+                        if retryable:
+                            provider_retries.inc(component=self.component, outcome="exhausted")
+                        set_span_attributes(retries=retries)
+                        if stats is not None:
+                            stats.record(self.component, retries, exhausted=True)
+                        raise
+
+                    delay = self.backoff(retries)
+                    retries += 1
+                    provider_retries.inc(component=self.component, outcome="retry")
+                    eval_logger.info("retry_policy", f"Retrying {self.component} call after transient failure", {
+                        "attempt": retries,
+                        "max_attempts": self.max_attempts,
+                        "status": error_status(e),
+                        "error": f"{type(e).__name__}: {e}",
+                        "delay_seconds": round(delay, 2)
+                    })
+                    if cancellation is not None:
+                        cancellation.sleep(delay)
+                    else:
+                        time.sleep(delay)
+                    continue
+
+                set_span_attributes(retries=retries)
+                if stats is not None:
+                    stats.record(self.component, retries, exhausted=False)
+                return result
+        except EvaluationCancelled:
+            set_span_attributes(retries=retries)
+            if stats is not None:
+                stats.record(self.component, retries, exhausted=False)
+            raise
+
+_max_attempts = int(os.environ.get("RETRY_MAX_ATTEMPTS", "4"))
+_base_delay = float(os.environ.get("RETRY_BASE_DELAY", "0.5"))
+_max_delay = float(os.environ.get("RETRY_MAX_DELAY", "20"))
+_budget_ratio = float(os.environ.get("RETRY_BUDGET_RATIO", "0.2"))
+
+# Global retry policy instances
+judge_retry_policy = RetryPolicy(
+    "judge",
+    max_attempts=_max_attempts,
+    base_delay=_base_delay,
+    max_delay=_max_delay,
+    timeout=(float(os.environ.get("JUDGE_CONNECT_TIMEOUT", "10")), float(os.environ.get("JUDGE_READ_TIMEOUT", "120"))),
+    budget=RetryBudget(_budget_ratio)
+)
+model_retry_policy = RetryPolicy(
+    "model_under_test",
+    max_attempts=_max_attempts,
+    base_delay=_base_delay,
+    max_delay=_max_delay,
+    timeout=(float(os.environ.get("MODEL_CONNECT_TIMEOUT", "10")), float(os.environ.get("MODEL_READ_TIMEOUT", "300"))),
+    budget=RetryBudget(_budget_ratio)
+)
@@ -0,0 +1,233 @@
+"""
+Priority classes and fair scheduling of evaluations.
+
+Interactive checks and bulk benchmark runs used to compete equally for the
+worker threadpool and provider capacity, so a one-off interactive evaluation
+queued behind thousands of benchmark requests. Every evaluation now declares
+a priority class and is admitted by the EvaluationScheduler before it starts:
+
+    - at most `max_concurrent` evaluations run at once; the rest wait in the
+      scheduler (not in the threadpool, whose queue is first come first served),
+    - a waiting interactive evaluation is always admitted before any bulk one,
+    - within a class, flows (benchmark ids) share the slots by weighted fair
+      queuing, so one large benchmark cannot starve the others.
+
+Inside a running evaluation the priority class also orders the calls waiting
+for a provider concurrency slot (see concurrency_limiter), so interactive
+judge and model calls are not queued behind bulk ones either.
+
+Configuration (environment variables):
+    SCHEDULER_MAX_CONCURRENT    Evaluations running at once in the whole service, divided among
+                                the workers (see shared_state.per_worker) (default: 32)
+"""
+
+import os
+import time
+import asyncio
+import threading
+import itertools
+from concurrent.futures import Future
+from typing import Dict, Any, List, Optional, Tuple
+from cancellation import CancellationToken
+from service_metrics import scheduler_queue_depth, scheduler_wait_duration, scheduler_running
+from shared_state import per_worker
+
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+# Classes in priority order: a class is only served while no earlier class is waiting
+PRIORITY_CLASSES = (INTERACTIVE, BULK)
+
+
+def priority_rank(priority: Optional[str]) -> int:
+    """Position of a priority class, 0 being the most urgent; unknown classes count as bulk."""
+    try:
+        return PRIORITY_CLASSES.index(priority)
+    except ValueError:
+        return PRIORITY_CLASSES.index(BULK)
+
+
+class Ticket:
+    """
+    A place in the scheduler's queue.
+
+    `future` completes when the evaluation is admitted, or is cancelled when
+    the ticket is withdrawn because its evaluation was cancelled. Admitted
+    tickets must be released with EvaluationScheduler.release() when the
+    evaluation ends.
+    """
+
+    def __init__(self, priority: str, flow: str, weight: float, cancellation: Optional[CancellationToken]):
+        self.priority = priority
+        self.flow = flow
+        self.weight = weight
+        self.cancellation = cancellation
+        self.future: Future = Future()
+        self.enqueued_at = time.monotonic()
+        self.start_tag = 0.0
+        self.admitted = False
+        self.released = False
+
+
+class _PriorityClass:
+    """Waiting tickets of one priority class, ordered by start-time fair queuing."""
+
+    def __init__(self):
+        self.virtual_time = 0.0
+        self.finish_tags: Dict[str, float] = {}
+        self.waiting: List[Tuple[float, int, Ticket]] = []
+
+    def push(self, ticket: Ticket, sequence: int):
+        # A flow's next ticket starts where its previous one finished, or at the
+        # current virtual time if the flow was idle; heavier flows advance slower
+        ticket.start_tag = max(self.virtual_time, self.finish_tags.get(ticket.flow, 0.0))
+        self.finish_tags[ticket.flow] = ticket.start_tag + 1.0 / ticket.weight
+        self.waiting.append((ticket.start_tag, sequence, ticket))
+
+    def pop(self) -> Ticket:
+        entry = min(self.waiting, key=lambda item: (item[0], item[1]))
+        self.waiting.remove(entry)
+        self.virtual_time = entry[0]
+        if not self.waiting:
+            # Idle again: forget the tags so returning flows start on equal terms
+            self.finish_tags.clear()
+        return entry[2]
+
+    def remove(self, ticket: Ticket) -> bool:
+        for entry in self.waiting:
+            if entry[2] is ticket:
+                self.waiting.remove(entry)
+                return True
+        return False
+
+
+class EvaluationScheduler:
+    """Admits evaluations by priority class and fair share of their flow. Thread-safe."""
+
+    def __init__(self, max_concurrent: int = 32):
+        self.max_concurrent = max(1, max_concurrent)
+        self.running = 0
+        self._lock = threading.Lock()
+        self._classes = {priority: _PriorityClass() for priority in PRIORITY_CLASSES}
+        self._sequence = itertools.count()
+
+    def submit(self, priority: Optional[str] = INTERACTIVE, flow: Optional[Any] = None, weight: float = 1.0,
+               cancellation: Optional[CancellationToken] = None) -> Ticket:
+        """
+        Queue an evaluation for admission.
+
+        Args:
+            priority: Priority class, see PRIORITY_CLASSES
+            flow: Flow the evaluation belongs to (benchmark id); evaluations without one share a flow
+            weight: Share of the flow relative to the other flows of its class
+            cancellation: Token of the evaluation, used to leave the queue when it is cancelled
+        """
+        priority = PRIORITY_CLASSES[priority_rank(priority)]
+        ticket = Ticket(priority, "" if flow is None else str(flow), max(weight, 0.01), cancellation)
+        with self._lock:
+            self._classes[priority].push(ticket, next(self._sequence))
+        self._dispatch()
+        return ticket
+
+    def release(self, ticket: Ticket):
+        """Free the slot of an admitted evaluation, or withdraw a waiting one. Idempotent."""
+        with self._lock:
+            if ticket.released:
+                return
+            ticket.released = True
+            if ticket.admitted:
+                self.running -= 1
+            else:
+                self._classes[ticket.priority].remove(ticket)
+                ticket.future.cancel()
+        self._dispatch()
+
+    def purge_cancelled(self) -> int:
+        """
+        Withdraw all waiting tickets whose evaluation was cancelled, e.g. after a
+        benchmark was cancelled. Their futures are cancelled, so their owners can
+        finish them without waiting for a slot.
+
+        Returns:
+            int: Number of tickets withdrawn
+        """
+        withdrawn = []
+        with self._lock:
+            for priority_class in self._classes.values():
+                for _, _, ticket in list(priority_class.waiting):
+                    if ticket.cancellation is not None and ticket.cancellation.cancelled:
+                        priority_class.remove(ticket)
+                        ticket.released = True
+                        withdrawn.append(ticket)
+        for ticket in withdrawn:
+            ticket.future.cancel()
+        return len(withdrawn)
+
+    def _dispatch(self):
+        admitted = []
+        withdrawn = []
+        with self._lock:
+            while self.running < self.max_concurrent:
+                waiting_class = next((self._classes[priority] for priority in PRIORITY_CLASSES
+                                      if self._classes[priority].waiting), None)
+                if waiting_class is None:
+                    break
+                ticket = waiting_class.pop()
+                if ticket.cancellation is not None and ticket.cancellation.cancelled:
+                    # Cancelled while waiting; it must not take a slot
+                    ticket.released = True
+                    withdrawn.append(ticket)
+                    continue
+                ticket.admitted = True
+                self.running += 1
+                admitted.append(ticket)
+        # Complete futures outside the lock: their callbacks may submit work
+        for ticket in withdrawn:
+            ticket.future.cancel()
+        for ticket in admitted:
+            scheduler_wait_duration.observe(time.monotonic() - ticket.enqueued_at, priority=ticket.priority)
+            ticket.future.set_result(True)
+
+    async def wait(self, ticket: Ticket):
+        """
+        Wait (in the event loop) until the ticket is admitted.
+
+        Raises:
+            EvaluationCancelled: The evaluation was cancelled while waiting; the ticket is withdrawn
+        """
+        admitted = asyncio.wrap_future(ticket.future)
+        while True:
+            if ticket.cancellation is not None and ticket.cancellation.cancelled:
+                self.release(ticket)
+                ticket.cancellation.check()
+            done, _ = await asyncio.wait({admitted}, timeout=0.5)
+            if done and not ticket.future.cancelled():
+                return
+
+    def waiting_ahead(self, priority: Optional[str]) -> int:
+        """Number of waiting evaluations a new evaluation of the priority class would wait behind."""
+        rank = priority_rank(priority)
+        with self._lock:
+            return sum(len(self._classes[waiting_priority].waiting)
+                       for waiting_priority in PRIORITY_CLASSES[:rank + 1])
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            waiting = {}
+            for priority, priority_class in self._classes.items():
+                flows: Dict[str, int] = {}
+                for _, _, ticket in priority_class.waiting:
+                    flows[ticket.flow] = flows.get(ticket.flow, 0) + 1
+                waiting[priority] = {"total": len(priority_class.waiting), "by_flow": flows}
+            return {"max_concurrent": self.max_concurrent, "running": self.running, "waiting": waiting}
+
+
+# Global evaluation scheduler instance
+evaluation_scheduler = EvaluationScheduler(
+    max_concurrent=int(per_worker(int(os.environ.get("SCHEDULER_MAX_CONCURRENT", "32"))))
+)
+
+scheduler_queue_depth.set_callback(lambda: {
+    (priority,): state["total"] for priority, state in evaluation_scheduler.snapshot()["waiting"].items()
+})
+scheduler_running.set_callback(lambda: {(): evaluation_scheduler.snapshot()["running"]})
@@ -0,0 +1,259 @@
+"""
+Shared, polite HTTP client for TALE evidence scraping.
+
+Concurrent TALE evaluations tend to fetch pages from the same few domains.
+Opening a fresh connection per page, without any per-domain limits, gets the
+service rate limited or blocked, which silently turns into empty evidence.
+All page fetches therefore go through one ScrapingClient that
+
+    - reuses connections (one requests.Session with per-host pools),
+    - limits concurrent requests and request rate per host,
+    - honours robots.txt (disallowed paths and Crawl-delay),
+    - backs off from hosts answering 429/503, honouring Retry-After,
+    - identifies itself with an honest, configurable User-Agent.
+
+Waiting for a host (its concurrency limit, request interval or back-off)
+stops with EvaluationCancelled when the evaluation's CancellationToken is
+cancelled.
+
+Configuration (environment variables):
+    TALE_SCRAPER_USER_AGENT          User-Agent header and robots.txt agent
+                                     (default: judge-eval-tale/1.0)
+    TALE_SCRAPER_TIMEOUT             Connect/read timeout per request in seconds (default: 10)
+    TALE_SCRAPER_MAX_PER_HOST        Concurrent requests per host (default: 2)
+    TALE_SCRAPER_MIN_INTERVAL        Minimum seconds between requests to one host (default: 1.0)
+    TALE_SCRAPER_MAX_RETRY_WAIT      Longest Retry-After the fetch waits for before giving up (default: 10)
+    TALE_SCRAPER_MAX_BYTES           Maximum page size downloaded (default: 5000000)
+    TALE_SCRAPER_RESPECT_ROBOTS      Set to "false" to ignore robots.txt (default: true)
+"""
+
+import os
+import time
+import threading
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+from urllib.robotparser import RobotFileParser
+import requests
+from requests.adapters import HTTPAdapter
+from eval_logger import eval_logger
+from cancellation import CancellationToken
+
+
+# Longest a wait for a host's concurrency slot goes without checking for a cancellation
+_CANCELLATION_POLL_SECONDS = 0.5
+
+
+class ScrapeSkipped(Exception):
+    """The page was not fetched on purpose (robots.txt, host backing off, ...)."""
+
+
+class _HostState:
+    """Politeness state of one host."""
+
+    def __init__(self, max_concurrency: int, min_interval: float):
+        self.semaphore = threading.BoundedSemaphore(max_concurrency)
+        self.lock = threading.Lock()
+        self.min_interval = min_interval
+        self.next_request_at = 0.0
+        self.blocked_until = 0.0
+        self.robots: Optional[RobotFileParser] = None
+        self.robots_fetched_at = 0.0
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header (delay in seconds or an HTTP date) into seconds from now."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class ScrapingClient:
+    """
+    Process-wide page fetcher with per-host politeness. Thread-safe.
+
+    Args:
+        user_agent: User-Agent sent with every request and used for robots.txt
+        timeout: Connect/read timeout per request in seconds
+        max_per_host: Concurrent requests per host
+        min_interval: Minimum seconds between two requests to the same host
+        max_retry_wait: Longest Retry-After (seconds) a fetch waits for before giving up
+        max_bytes: Maximum number of bytes downloaded per page
+        respect_robots: Whether robots.txt rules are honoured
+        robots_ttl: Seconds a fetched robots.txt is reused
+    """
+
+    def __init__(self, user_agent: str = "judge-eval-tale/1.0", timeout: float = 10.0,
+                 max_per_host: int = 2, min_interval: float = 1.0, max_retry_wait: float = 10.0,
+                 max_bytes: int = 5_000_000, respect_robots: bool = True, robots_ttl: float = 3600.0):
+        self.user_agent = user_agent
+        self.timeout = timeout
+        self.max_per_host = max_per_host
+        self.min_interval = min_interval
+        self.max_retry_wait = max_retry_wait
+        self.max_bytes = max_bytes
+        self.respect_robots = respect_robots
+        self.robots_ttl = robots_ttl
+
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=64, pool_maxsize=max(max_per_host, 1))
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        self._session.headers.update({
+            "User-Agent": user_agent,
+            "Accept": "text/html,application/xhtml+xml;q=0.9,*/*;q=0.5"
+        })
+
+        self._hosts_lock = threading.Lock()
+        self._hosts: Dict[str, _HostState] = {}
+
+    def _host_state(self, host: str) -> _HostState:
+        with self._hosts_lock:
+            state = self._hosts.get(host)
+            if state is None:
+                state = _HostState(self.max_per_host, self.min_interval)
+                self._hosts[host] = state
+            return state
+
+    def fetch(self, url: str, timeout: Optional[float] = None,
+              cancellation: Optional[CancellationToken] = None) -> bytes:
+        """
+        Fetch a page, waiting for the host's politeness limits.
+
+        Args:
+            url: Page to fetch
+            timeout: Connect/read timeout overriding the client's default, e.g. to
+                stay within an evaluation's deadline
+            cancellation: Token of the evaluation; waiting for the host stops when it is cancelled
+
+        Raises:
+            ScrapeSkipped: robots.txt disallows the URL or the host asked us to back off
+            requests.RequestException: The request failed
+            EvaluationCancelled: The evaluation was cancelled while waiting for the host
+        """
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https") or not parts.hostname:
+            raise ScrapeSkipped(f"Unsupported URL: {url}")
+        host = f"{parts.scheme}://{parts.netloc.lower()}"
+        state = self._host_state(host)
+
+        if self.respect_robots and not self._allowed_by_robots(host, state, url):
+            raise ScrapeSkipped(f"Disallowed by robots.txt: {url}")
+
+        for attempt in range(2):
+            self._acquire(state, cancellation)
+            try:
+                self._wait_for_turn(host, state, cancellation)
+                response = self._session.get(url, timeout=timeout or self.timeout, stream=True)
+                try:
+                    if response.status_code in (429, 503):
+                        retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                        delay = retry_after if retry_after is not None else max(state.min_interval * 10, 30.0)
+                        with state.lock:
+                            state.blocked_until = max(state.blocked_until, time.monotonic() + delay)
+                        eval_logger.info("scraper", "Host asked to back off", {
+                            "host": host,
+                            "status_code": response.status_code,
+                            "retry_after_seconds": round(delay, 1)
+                        })
+                        if attempt == 0 and delay <= self.max_retry_wait:
+                            continue
+                        raise ScrapeSkipped(f"{host} is rate limiting (retry after {delay:.0f}s)")
+
+                    response.raise_for_status()
+                    return self._read_body(response)
+                finally:
+                    response.close()
+            finally:
+                state.semaphore.release()
+
+        raise ScrapeSkipped(f"{host} is rate limiting")
+
+    @staticmethod
+    def _acquire(state: _HostState, cancellation: Optional[CancellationToken]):
+        """Take one of the host's concurrency slots."""
+        if cancellation is None:
+            state.semaphore.acquire()
+            return
+        cancellation.check()
+        while not state.semaphore.acquire(timeout=_CANCELLATION_POLL_SECONDS):
+            cancellation.check()
+
+    def _wait_for_turn(self, host: str, state: _HostState, cancellation: Optional[CancellationToken] = None):
+        """Reserve the next request slot of the host and sleep until it starts."""
+        with state.lock:
+            now = time.monotonic()
+            if state.blocked_until - now > self.max_retry_wait:
+                raise ScrapeSkipped(f"{host} is backing off for another {state.blocked_until - now:.0f}s")
+            start_at = max(now, state.next_request_at, state.blocked_until)
+            state.next_request_at = start_at + state.min_interval
+        if start_at > now:
+            if cancellation is not None:
+                cancellation.sleep(start_at - now)
+            else:
+                time.sleep(start_at - now)
+
+    def _read_body(self, response: requests.Response) -> bytes:
+        chunks = []
+        size = 0
+        for chunk in response.iter_content(chunk_size=65536):
+            chunks.append(chunk)
+            size += len(chunk)
+            if size >= self.max_bytes:
+                eval_logger.debug("scraper", "Page truncated at size limit", {
+                    "url": response.url,
+                    "max_bytes": self.max_bytes
+                })
+                break
+        return b"".join(chunks)[:self.max_bytes]
+
+    def _allowed_by_robots(self, host: str, state: _HostState, url: str) -> bool:
+        with state.lock:
+            robots = state.robots
+            stale = time.monotonic() - state.robots_fetched_at > self.robots_ttl
+
+        if robots is None or stale:
+            robots = self._fetch_robots(host)
+            with state.lock:
+                state.robots = robots
+                state.robots_fetched_at = time.monotonic()
+                crawl_delay = robots.crawl_delay(self.user_agent)
+                if crawl_delay:
+                    state.min_interval = max(self.min_interval, float(crawl_delay))
+
+        return robots.can_fetch(self.user_agent, url)
+
+    def _fetch_robots(self, host: str) -> RobotFileParser:
+        robots = RobotFileParser(f"{host}/robots.txt")
+        try:
+            response = self._session.get(f"{host}/robots.txt", timeout=min(self.timeout, 5.0))
+            if response.status_code in (401, 403):
+                robots.disallow_all = True
+            elif response.status_code >= 400:
+                robots.allow_all = True
+            else:
+                robots.parse(response.text.splitlines())
+        except requests.RequestException:
+            # An unreachable robots.txt does not forbid crawling
+            robots.allow_all = True
+        return robots
+
+
+# Global scraping client instance
+scraping_client = ScrapingClient(
+    user_agent=os.environ.get("TALE_SCRAPER_USER_AGENT", "judge-eval-tale/1.0"),
+    timeout=float(os.environ.get("TALE_SCRAPER_TIMEOUT", "10")),
+    max_per_host=int(os.environ.get("TALE_SCRAPER_MAX_PER_HOST", "2")),
+    min_interval=float(os.environ.get("TALE_SCRAPER_MIN_INTERVAL", "1.0")),
+    max_retry_wait=float(os.environ.get("TALE_SCRAPER_MAX_RETRY_WAIT", "10")),
+    max_bytes=int(os.environ.get("TALE_SCRAPER_MAX_BYTES", "5000000")),
+    respect_robots=os.environ.get("TALE_SCRAPER_RESPECT_ROBOTS", "true").lower() != "false"
+)
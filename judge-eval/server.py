@@ -0,0 +1,35 @@
+"""
+Entry point of the evaluation service: `python server.py`.
+
+Processes started with "spawn" (the text processing pool, see
+processing_pool, and uvicorn's worker processes) import the __main__ module
+of their parent again before they run anything. With main.py as the entry
+point every such process imported the whole service: FastAPI, the job
+manager, the import profiler, and through them DeepEval and the clients. This
+module is the __main__ module instead and imports nothing at its top level, so
+those processes only import what they run; the app is imported by uvicorn as
+"main:app".
+"""
+
+if __name__ == "__main__":
+    import uvicorn
+    from eval_logger import eval_logger
+    from shared_state import WORKERS, WorkerSnapshots, shared_state
+
+    eval_logger.info("main", "Starting evaluation server", {
+        "host": "0.0.0.0",
+        "port": 5000,
+        "workers": WORKERS
+    })
+
+    print(f"Starting evaluation server on 0.0.0.0:5000 with {WORKERS} worker(s)", flush=True)
+
+    if WORKERS > 1:
+        # Totals of the previous run would otherwise be added to this run's
+        WorkerSnapshots.clear(shared_state)
+        # Every worker process imports the app, and with it DeepEval, the
+        # metrics and their templates, before it accepts connections, so no
+        # request pays for imports; the caches are shared through /app/cache
+        uvicorn.run("main:app", host="0.0.0.0", port=5000, workers=WORKERS)
+    else:
+        uvicorn.run("main:app", host="0.0.0.0", port=5000)
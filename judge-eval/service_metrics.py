@@ -0,0 +1,378 @@
+"""
+Prometheus-style service metrics.
+
+A small, dependency-free registry of counters, gauges and histograms that is
+rendered in the Prometheus text exposition format by the /metrics endpoint.
+All metric types are thread-safe, since evaluations run concurrently in
+FastAPI's threadpool.
+
+With several worker processes each worker has its own registry. Their
+snapshots are merged on /metrics (see shared_state.WorkerSnapshots): counters
+and histograms are summed over the workers, gauges are rendered per worker
+with a "worker" label.
+"""
+
+import math
+import threading
+from typing import Any, Dict, Tuple, List, Optional, Callable
+
+
+# Buckets in seconds, covering fast cache hits up to long TALE evaluations
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape_label_value(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(label_names: Tuple[str, ...], label_values: Tuple[str, ...], extra: Optional[Dict[str, str]] = None) -> str:
+    pairs = list(zip(label_names, label_values)) + list((extra or {}).items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape_label_value(value)}"' for name, value in pairs) + "}"
+
+
+class _Metric:
+    """Base class holding one series per combination of label values."""
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, label_names: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+
+    def render(self) -> List[str]:
+        return self._header() + self._render_samples()
+
+    def _render_samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def snapshot(self) -> Dict[str, Any]:
+        """JSON serializable values of the metric, for merging with other workers."""
+        raise NotImplementedError
+
+    def render_merged(self, snapshots: Dict[str, Dict[str, Any]]) -> List[str]:
+        """Render the snapshots of this metric taken by several workers, by worker."""
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Monotonically increasing value."""
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, label_names: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, label_names)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def values(self) -> Dict[Tuple[str, ...], float]:
+        with self._lock:
+            return dict(self._values)
+
+    def _render_samples(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+                for key, value in sorted(self.values().items())]
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"type": self.type_name, "values": [[list(key), value] for key, value in self.values().items()]}
+
+    def render_merged(self, snapshots: Dict[str, Dict[str, Any]]) -> List[str]:
+        totals: Dict[Tuple[str, ...], float] = {}
+        for snapshot in snapshots.values():
+            for key, value in snapshot["values"]:
+                totals[tuple(key)] = totals.get(tuple(key), 0.0) + value
+        return self._header() + [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+                                 for key, value in sorted(totals.items())]
+
+
+class Gauge(_Metric):
+    """Value that can go up and down, or be computed on scrape by a callback."""
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, label_names: Tuple[str, ...] = (),
+                 callback: Optional[Callable[[], Dict[Tuple[str, ...], float]]] = None):
+        super().__init__(name, documentation, label_names)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._callback = callback
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def set_callback(self, callback: Callable[[], Dict[Tuple[str, ...], float]]):
+        """Compute the gauge values on every scrape instead of storing them."""
+        self._callback = callback
+
+    def values(self) -> Dict[Tuple[str, ...], float]:
+        if self._callback is not None:
+            try:
+                return dict(self._callback())
+            except Exception:
+                return {}
+        with self._lock:
+            return dict(self._values)
+
+    def _render_samples(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+                for key, value in sorted(self.values().items())]
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"type": self.type_name, "values": [[list(key), value] for key, value in self.values().items()]}
+
+    def render_merged(self, snapshots: Dict[str, Dict[str, Any]]) -> List[str]:
+        # The state of each worker (in flight, limits, ...) does not add up
+        lines = self._header()
+        for worker, snapshot in sorted(snapshots.items()):
+            lines.extend(f"{self.name}{_format_labels(self.label_names, tuple(key), {'worker': worker})} "
+                         f"{_format_value(value)}" for key, value in sorted(snapshot["values"]))
+        return lines
+
+
+class Histogram(_Metric):
+    """Distribution of observed values (durations in seconds unless stated otherwise)."""
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, label_names: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._series: Dict[Tuple[str, ...], Dict[str, object]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+                self._series[key] = series
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["counts"][i] += 1
+                    break
+            series["sum"] += value
+            series["count"] += 1
+
+    def series(self) -> Dict[Tuple[str, ...], Dict[str, object]]:
+        with self._lock:
+            return {key: {"counts": list(s["counts"]), "sum": s["sum"], "count": s["count"]}
+                    for key, s in self._series.items()}
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"type": self.type_name, "series": [[list(key), series] for key, series in self.series().items()]}
+
+    def render_merged(self, snapshots: Dict[str, Dict[str, Any]]) -> List[str]:
+        totals: Dict[Tuple[str, ...], Dict[str, object]] = {}
+        for snapshot in snapshots.values():
+            for key, series in snapshot["series"]:
+                total = totals.setdefault(tuple(key), {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0})
+                total["counts"] = [a + b for a, b in zip(total["counts"], series["counts"])]
+                total["sum"] += series["sum"]
+                total["count"] += series["count"]
+        return self._header() + self._render_series(totals)
+
+    def _render_samples(self) -> List[str]:
+        return self._render_series(self.series())
+
+    def _render_series(self, all_series: Dict[Tuple[str, ...], Dict[str, object]]) -> List[str]:
+        lines = []
+        for key, series in sorted(all_series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, series["counts"]):
+                cumulative += count
+                labels = _format_labels(self.label_names, key, {"le": _format_value(bound)})
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(series['sum'])}")
+            lines.append(f"{self.name}_count{labels} {series['count']}")
+        return lines
+
+
+class MetricsRegistry:
+    """Collection of all service metrics, rendered together on /metrics."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, label_names: Tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, documentation, label_names))
+
+    def gauge(self, name: str, documentation: str, label_names: Tuple[str, ...] = (),
+              callback: Optional[Callable[[], Dict[Tuple[str, ...], float]]] = None) -> Gauge:
+        return self._register(Gauge(name, documentation, label_names, callback))
+
+    def histogram(self, name: str, documentation: str, label_names: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, label_names, buckets))
+
+    def render(self) -> str:
+        """Render all metrics in the Prometheus text exposition format."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """JSON serializable values of all metrics, by metric name."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {metric.name: metric.snapshot() for metric in metrics}
+
+    def render_merged(self, snapshots: Dict[str, Dict[str, Dict[str, Any]]]) -> str:
+        """Render the registry snapshots of several workers, by worker, as one exposition."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render_merged({
+                worker: snapshot[metric.name] for worker, snapshot in snapshots.items()
+                if snapshot.get(metric.name, {}).get("type") == metric.type_name
+            }))
+        return "\n".join(lines) + "\n"
+
+
+# Global metrics registry instance
+metrics_registry = MetricsRegistry()
+
+# --- Service level -----------------------------------------------------------
+requests_in_flight = metrics_registry.gauge(
+    "judge_eval_requests_in_flight", "Evaluation requests currently being processed")
+requests_in_flight.set(0)
+evaluation_duration = metrics_registry.histogram(
+    "judge_eval_evaluation_duration_seconds", "End-to-end evaluation latency", ("metric_type",))
+evaluations_total = metrics_registry.counter(
+    "judge_eval_evaluations_total", "Finished evaluations by outcome", ("metric_type", "outcome"))
+threadpool_tokens = metrics_registry.gauge(
+    "judge_eval_threadpool_tokens", "Worker threadpool capacity and tokens in use", ("state",))
+
+# --- Scheduler ----------------------------------------------------------------
+scheduler_queue_depth = metrics_registry.gauge(
+    "judge_eval_scheduler_queue_depth", "Evaluations waiting for admission by priority class", ("priority",))
+scheduler_running = metrics_registry.gauge(
+    "judge_eval_scheduler_running", "Evaluations admitted by the scheduler and running")
+scheduler_wait_duration = metrics_registry.histogram(
+    "judge_eval_scheduler_wait_seconds", "Time evaluations waited for admission", ("priority",))
+
+# --- Admission control --------------------------------------------------------
+admission_in_flight = metrics_registry.gauge(
+    "judge_eval_admission_in_flight", "Admitted (queued or running) evaluations by metric type", ("metric_type",))
+admission_rejections = metrics_registry.counter(
+    "judge_eval_admission_rejections_total", "Requests shed with 503 by metric type, priority and reason",
+    ("metric_type", "priority", "reason"))
+
+# --- Text processing pool ----------------------------------------------------
+text_processing_duration = metrics_registry.histogram(
+    "judge_eval_text_processing_duration_seconds",
+    "Time of text processing pool calls, including the wait for a place, by function and outcome",
+    ("function", "outcome"))
+text_processing_pending = metrics_registry.gauge(
+    "judge_eval_text_processing_pending", "Text processing pool calls queued or running")
+
+# --- Tiered caches -----------------------------------------------------------
+cache_lookups = metrics_registry.counter(
+    "judge_eval_cache_lookups_total", "Tiered cache lookups by cache and the tier that answered (memory, disk or miss)",
+    ("cache", "tier"))
+
+# --- Result payloads ---------------------------------------------------------
+response_bytes = metrics_registry.counter(
+    "judge_eval_response_bytes_total", "Bytes of compressed responses before compression and as sent", ("encoding", "stage"))
+log_store_operations = metrics_registry.counter(
+    "judge_eval_log_store_operations_total", "Evaluation logs stored and read by reference", ("operation", "outcome"))
+
+# --- Call traces -------------------------------------------------------------
+call_trace_calls = metrics_registry.counter(
+    "judge_eval_call_trace_calls_total", "External calls recorded or replayed by kind and outcome", ("kind", "mode", "outcome"))
+
+# --- Model under test (LlmRequestor) -----------------------------------------
+response_cache_requests = metrics_registry.counter(
+    "judge_eval_response_cache_requests_total", "Response cache lookups by result", ("result",))
+response_cache_lock_wait = metrics_registry.histogram(
+    "judge_eval_response_cache_lock_wait_seconds", "Time spent waiting for the response cache lock")
+response_cache_size = metrics_registry.gauge(
+    "judge_eval_response_cache_size", "Response cache entries and bytes at the last report", ("unit",))
+cache_maintenance_removed = metrics_registry.counter(
+    "judge_eval_cache_maintenance_removed_total", "Files removed by cache sweeps by reason (or swept store)", ("reason",))
+cache_maintenance_duration = metrics_registry.histogram(
+    "judge_eval_cache_maintenance_duration_seconds", "Duration of response cache sweeps")
+pregenerations = metrics_registry.counter(
+    "judge_eval_pregenerations_total", "Outputs handled by pre-generation by outcome", ("outcome",))
+generation_duration = metrics_registry.histogram(
+    "judge_eval_generation_duration_seconds", "Latency of model under test completions", ("model",))
+
+# --- Judge --------------------------------------------------------------------
+judge_call_duration = metrics_registry.histogram(
+    "judge_eval_judge_call_duration_seconds", "Latency of judge calls", ("judge_model",))
+judge_calls = metrics_registry.counter(
+    "judge_eval_judge_calls_total", "Judge calls by outcome and reason of errors", ("judge_model", "outcome", "reason"))
+
+# --- Provider concurrency ----------------------------------------------------
+provider_concurrency_limit = metrics_registry.gauge(
+    "judge_eval_provider_concurrency_limit", "Adaptive concurrency limit per provider and model", ("provider", "model"))
+provider_in_flight = metrics_registry.gauge(
+    "judge_eval_provider_in_flight", "Provider calls currently in flight", ("provider", "model"))
+provider_throttled = metrics_registry.counter(
+    "judge_eval_provider_throttled_total", "Overload signals received from providers", ("provider", "model", "signal"))
+
+provider_retries = metrics_registry.counter(
+    "judge_eval_provider_retries_total", "Provider call retries by component and outcome", ("component", "outcome"))
+
+# --- Tokens -------------------------------------------------------------------
+tokens_total = metrics_registry.counter(
+    "judge_eval_tokens_total", "Tokens used by role, model and token type", ("role", "model", "type"))
+judge_phase_tokens_total = metrics_registry.counter(
+    "judge_eval_judge_phase_tokens_total", "Judge tokens by evaluation phase and token type", ("phase", "type"))
+
+# --- TALE ---------------------------------------------------------------------
+tale_search_duration = metrics_registry.histogram(
+    "judge_eval_tale_search_duration_seconds", "Latency of TALE search engine requests", ("outcome",))
+tale_scrape_duration = metrics_registry.histogram(
+    "judge_eval_tale_scrape_duration_seconds", "Latency of TALE page fetches", ("outcome",))
+tale_bytes_fetched = metrics_registry.counter(
+    "judge_eval_tale_bytes_fetched_total", "Bytes downloaded by TALE page fetches")
+tale_duplicates_skipped = metrics_registry.counter(
+    "judge_eval_tale_duplicates_skipped_total", "TALE search results skipped as duplicates by reason", ("reason",))
+tale_engine_state = metrics_registry.gauge(
+    "judge_eval_tale_engine_circuit_state", "Search engine circuit state (0 closed, 1 half open, 2 open)", ("engine",))
+tale_engine_success_rate = metrics_registry.gauge(
+    "judge_eval_tale_engine_success_rate", "Rolling success rate of search engines", ("engine",))
+tale_local_index_lookups = metrics_registry.counter(
+    "judge_eval_tale_local_index_lookups_total", "TALE queries answered by the local evidence index (hit) or the web (miss)", ("result",))
+tale_unresponsive_engines = metrics_registry.counter(
+    "judge_eval_tale_unresponsive_engines_total", "Engines reported unresponsive by SearXNG", ("engine",))
@@ -0,0 +1,224 @@
+"""
+State shared by the serving workers.
+
+A single uvicorn process runs all CPU work of the service (request parsing,
+prompt templating, HTML parsing, log serialization) under one GIL. With
+JUDGE_EVAL_WORKERS > 1 the service runs that many worker processes on the
+same port instead (see main), and the kernel spreads connections over them.
+
+Most state stays per worker: the scheduler, admission limits, provider
+concurrency limits and engine health of a worker cover the requests that
+worker serves. Their limits are configured for the whole service and divided
+by the number of workers (see per_worker), so each worker enforces its share;
+as the kernel spreads connections unevenly, one worker may shed or queue
+requests while another still has room. The caches are tiered (see
+tiered_cache), and the evidence index is a SQLite database in WAL mode that
+all workers share. What must be visible to whichever worker the next request
+lands on is published as small files in SHARED_STATE_DIR:
+
+    benchmark-<id>.cancelled   A benchmark was cancelled; its mtime is the time of the cancellation
+    job-<id>.json              Status, progress events and result of a job
+    job-<id>.cancel            A worker other than the job's own was asked to cancel it
+    worker-<pid>.json          Metrics and usage totals of a worker, every SHARED_METRICS_SECONDS
+
+Workers watch the files that concern their evaluations every
+SHARED_STATE_POLL_SECONDS. /metrics and /usage merge the published totals of
+all workers of the service, so counters never jump between workers (see
+WorkerSnapshots). /readyz and the hit ratio of /cache/stats describe the
+worker that answers, identified by "worker" (its pid), as do /engines and
+/startup. With a single worker no files are used.
+
+Configuration (environment variables):
+    JUDGE_EVAL_WORKERS           Worker processes serving the API (default: 1)
+    SHARED_STATE_DIR             Directory of the shared state (default: /app/cache/shared)
+    SHARED_STATE_POLL_SECONDS    How often workers look for changes made by other workers (default: 1)
+    SHARED_METRICS_SECONDS       How often workers publish their metrics and usage totals (default: 5)
+"""
+
+import os
+import json
+import time
+import threading
+from urllib.parse import quote
+from typing import Dict, Any, Callable, List, Optional
+from eval_logger import eval_logger
+from service_metrics import MetricsRegistry, metrics_registry
+from usage_tracker import UsageTotals, usage_totals
+
+
+class SharedDirectory:
+    """Named JSON documents and markers in a directory shared by the workers."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def _path(self, name: str) -> str:
+        # Names embed client supplied ids, which must not escape the directory
+        return os.path.join(self.directory, quote(name, safe=".-_"))
+
+    def write_json(self, name: str, data: Dict[str, Any]):
+        """Replace a document atomically; failures are logged, not raised."""
+        path = self._path(name)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, default=str)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            eval_logger.log_error("shared_state", f"Failed to write shared state: {e}", {"file": path})
+
+    def read_json(self, name: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._path(name), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+
+    def touch(self, name: str):
+        """Set a marker, or move its time to now."""
+        path = self._path(name)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(path, "a"):
+                pass
+            os.utime(path)
+        except OSError as e:
+            eval_logger.log_error("shared_state", f"Failed to set shared marker: {e}", {"file": path})
+
+    def mtime(self, name: str) -> Optional[float]:
+        """Time a marker or document was last set, None if it does not exist."""
+        try:
+            return os.path.getmtime(self._path(name))
+        except OSError:
+            return None
+
+    def remove(self, name: str):
+        try:
+            os.remove(self._path(name))
+        except OSError:
+            pass
+
+    def names(self, prefix: str, suffix: str) -> List[str]:
+        """Names of the documents and markers starting with prefix and ending with suffix."""
+        try:
+            return sorted(name for name in os.listdir(self.directory)
+                          if name.startswith(prefix) and name.endswith(suffix))
+        except OSError:
+            return []
+
+
+class Poller:
+    """
+    Calls a function every `interval` seconds in a daemon thread. The thread is
+    started by the first call to start(); errors are logged and polling goes on.
+    """
+
+    def __init__(self, name: str, interval: float, poll: Callable[[], None]):
+        self.name = name
+        self.interval = interval
+        self.poll = poll
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._loop, name=f"poll-{self.name}", daemon=True)
+            self._thread.start()
+
+    def _loop(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.poll()
+            except Exception as e:
+                eval_logger.log_error("shared_state", f"Polling {self.name} failed: {e}")
+
+
+class WorkerSnapshots:
+    """
+    Publishes the metrics and usage totals of this worker and merges those of
+    all workers.
+
+    Counters, histograms and usage totals of workers that exited stay in the
+    sums, so they never go down while the service runs; their gauges are left
+    out once they stopped publishing. The files of a previous run of the
+    service are removed by clear() before the workers start.
+    """
+
+    PREFIX = "worker-"
+
+    def __init__(self, directory: SharedDirectory, registry: MetricsRegistry, totals: UsageTotals,
+                 interval: float = 5.0):
+        self.directory = directory
+        self.registry = registry
+        self.totals = totals
+        self.interval = interval
+        self.worker = str(os.getpid())
+        self._poller = Poller("worker-snapshots", interval, self.publish)
+
+    def start(self):
+        self._poller.start()
+
+    def publish(self):
+        self.directory.write_json(f"{self.PREFIX}{self.worker}.json", {
+            "worker": self.worker,
+            "published_at": time.time(),
+            "metrics": self.registry.snapshot(),
+            "usage": self.totals.snapshot()
+        })
+
+    def _snapshots(self) -> List[Dict[str, Any]]:
+        # This worker's own totals are current, the others' up to an interval old
+        self.publish()
+        snapshots = []
+        for name in self.directory.names(self.PREFIX, ".json"):
+            snapshot = self.directory.read_json(name)
+            if snapshot is not None:
+                snapshots.append(snapshot)
+        return snapshots
+
+    def render_metrics(self) -> str:
+        """Metrics of all workers in the Prometheus text exposition format."""
+        now = time.time()
+        merged = {}
+        for snapshot in self._snapshots():
+            metrics = snapshot["metrics"]
+            if now - snapshot["published_at"] > 3 * self.interval:
+                metrics = {name: metric for name, metric in metrics.items() if metric["type"] != "gauge"}
+            merged[snapshot["worker"]] = metrics
+        return self.registry.render_merged(merged)
+
+    def usage(self) -> Dict[str, Any]:
+        """Usage totals of all workers."""
+        snapshots = self._snapshots()
+        return {**UsageTotals.merge(snapshot["usage"] for snapshot in snapshots), "workers": len(snapshots)}
+
+    @classmethod
+    def clear(cls, directory: SharedDirectory):
+        """Remove the snapshots of a previous run of the service."""
+        for name in directory.names(cls.PREFIX, ".json"):
+            directory.remove(name)
+
+
+def per_worker(limit: float, minimum: float = 1) -> float:
+    """Share of a limit configured for the whole service that each worker enforces."""
+    return max(minimum, limit / WORKERS)
+
+
+# Worker processes serving the API
+WORKERS = max(1, int(os.environ.get("JUDGE_EVAL_WORKERS", "1")))
+
+# How often workers look for changes made by other workers
+POLL_SECONDS = float(os.environ.get("SHARED_STATE_POLL_SECONDS", "1"))
+
+# Global shared state directory instance, only used with several workers
+shared_state = SharedDirectory(os.environ.get("SHARED_STATE_DIR", "/app/cache/shared")) if WORKERS > 1 else None
+
+# Global worker snapshots instance, only used with several workers
+worker_snapshots = WorkerSnapshots(
+    shared_state, metrics_registry, usage_totals,
+    interval=float(os.environ.get("SHARED_METRICS_SECONDS", "5"))
+) if shared_state is not None else None
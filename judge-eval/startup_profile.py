@@ -0,0 +1,133 @@
+"""
+Import timing of the service.
+
+Container restarts and scale-ups wait for the service to import its
+dependencies before the first request is served. To see where that time
+goes, main installs the ImportProfiler before its other imports. It wraps
+builtins.__import__ and records, for every module loaded from then on, the
+time its import took with (cumulative) and without (self) the modules it
+imported in turn.
+
+Imports recorded before the application finished starting count as
+"startup", later ones as "lazy": DeepEval, the metric implementations and the
+provider clients are loaded by the warm-up (see warmup) or the first
+evaluation that needs them. GET /startup returns the report and it is logged
+once the application started.
+
+Modules loaded through importlib.import_module() and submodules only named in
+a `from package import submodule` statement are not seen separately; their
+time counts towards the importing module.
+"""
+
+import sys
+import time
+import builtins
+import threading
+import importlib.util
+from typing import Dict, Any, List, Optional
+
+
+STARTUP = "startup"
+LAZY = "lazy"
+
+
+class ImportProfiler:
+    """Times module imports by wrapping builtins.__import__. Thread-safe."""
+
+    def __init__(self):
+        self._original_import = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._modules: Dict[str, Dict[str, Any]] = {}
+        self.installed_at: Optional[float] = None
+        self.started_seconds: Optional[float] = None
+        self.phase = STARTUP
+
+    def install(self):
+        """Start timing imports; idempotent."""
+        if self._original_import is not None:
+            return
+        self.installed_at = time.perf_counter()
+        self._original_import = builtins.__import__
+        builtins.__import__ = self._import
+
+    def mark_started(self):
+        """The application started; later imports count as lazy."""
+        if self.installed_at is not None and self.started_seconds is None:
+            self.started_seconds = time.perf_counter() - self.installed_at
+        self.phase = LAZY
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        if level == 0 and name in sys.modules:
+            # Already loaded: nothing to time
+            return self._original_import(name, globals, locals, fromlist, level)
+
+        module_name = name
+        if level:
+            try:
+                module_name = importlib.util.resolve_name("." * level + name, (globals or {}).get("__package__"))
+            except (ImportError, ValueError):
+                pass
+        newly_loaded = module_name not in sys.modules
+
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        stack.append(0.0)
+        started = time.perf_counter()
+        try:
+            return self._original_import(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.perf_counter() - started
+            nested = stack.pop()
+            if stack:
+                stack[-1] += elapsed
+            if newly_loaded and module_name in sys.modules:
+                with self._lock:
+                    self._modules.setdefault(module_name, {
+                        "module": module_name,
+                        "cumulative_ms": round(elapsed * 1000, 1),
+                        "self_ms": round(max(0.0, elapsed - nested) * 1000, 1),
+                        "phase": self.phase,
+                        "thread": threading.current_thread().name
+                    })
+
+    def report(self, top: int = 25) -> Dict[str, Any]:
+        """
+        Import timing report.
+
+        Args:
+            top: Number of modules listed per phase, slowest (cumulative) first
+
+        Returns:
+            dict: Seconds until the application started, import time per phase
+                  and top level package (self time, so nothing is counted twice),
+                  and the slowest modules of each phase
+        """
+        with self._lock:
+            modules = list(self._modules.values())
+
+        phases = {}
+        for phase in (STARTUP, LAZY):
+            phase_modules = [module for module in modules if module["phase"] == phase]
+            by_package: Dict[str, float] = {}
+            for module in phase_modules:
+                package = module["module"].split(".")[0]
+                by_package[package] = by_package.get(package, 0.0) + module["self_ms"]
+            slowest: List[Dict[str, Any]] = sorted(phase_modules, key=lambda module: module["cumulative_ms"],
+                                                   reverse=True)[:top]
+            phases[phase] = {
+                "modules_loaded": len(phase_modules),
+                "import_ms": round(sum(module["self_ms"] for module in phase_modules), 1),
+                "by_package_ms": dict(sorted(((package, round(ms, 1)) for package, ms in by_package.items()),
+                                             key=lambda item: item[1], reverse=True)[:top]),
+                "slowest_modules": slowest
+            }
+        return {
+            "started_seconds": round(self.started_seconds, 3) if self.started_seconds is not None else None,
+            "phases": phases
+        }
+
+
+# Global import profiler instance
+import_profiler = ImportProfiler()
@@ -1,7 +1,33 @@
 from deepeval.metrics import BaseMetric
 from deepeval.test_case import LLMTestCase
 from typing import Optional
+import json
 from eval_logger import eval_logger
+from usage_tracker import usage_phase
+from service_metrics import (
+    tale_search_duration,
+    tale_scrape_duration,
+    tale_bytes_fetched,
+    tale_unresponsive_engines,
+    tale_duplicates_skipped,
+    tale_local_index_lookups
+)
+from evidence_dedup import EvidenceDeduplicator
+from engine_health import engine_health
+from evidence_index import evidence_index
+from scraper import scraping_client, ScrapeSkipped
+from eval_context import current_context, report_progress
+from tracing import span
+from processing_pool import processing_pool
+from text_processing import extract_page
+from call_trace import traced_call
+import base64
+import time
+import re
+
+# Verdict at the start of a classic reflection response, behind any markdown
+# ("**INSUFFICIENT**: ...", "- Sufficient.")
+_REFLECTION_VERDICT = re.compile(r"^[\W_]*(IN)?SUFFICIENT(?![A-Za-z0-9])", re.IGNORECASE)
 
 class TALEMetric(BaseMetric):
     def __init__(
@@ -17,7 +43,15 @@ class TALEMetric(BaseMetric):
         max_iterations: int = 3,
         search_engines: list = ["google", "bing", "duckduckgo"],
         search_engine_url: str = "http://judge_searxng:80",
-        time_range: str = "all"
+        time_range: str = "all",
+        fused_reflection: bool = True,
+        max_queries_per_iteration: int = 2,
+        near_duplicate_threshold: float = 0.8,
+        use_local_index: bool = True,
+        local_index_min_score: float = 5.0,
+        local_index_min_results: int = 2,
+        local_index_max_age_hours: float = 168.0,
+        deadline_reserve_seconds: float = 60.0
     ):
         self.model = model
         self.threshold = threshold
@@ -33,16 +67,34 @@ class TALEMetric(BaseMetric):
         self.search_engines = search_engines
         self.search_engine_url = search_engine_url
         self.time_range = time_range
+        # Fused mode: one judge call returns the sufficiency verdict and the next queries
+        self.fused_reflection = fused_reflection
+        self.max_queries_per_iteration = max(1, max_queries_per_iteration)
+        # Pages whose estimated shingle similarity reaches this value count as duplicates (1.0 disables)
+        self.near_duplicate_threshold = near_duplicate_threshold
+        # Local evidence index: queries with enough pages scoring at least
+        # local_index_min_score are answered without SearXNG
+        self.use_local_index = use_local_index
+        self.local_index_min_score = local_index_min_score
+        self.local_index_min_results = max(1, local_index_min_results)
+        self.local_index_max_age_hours = local_index_max_age_hours
+        # Evidence collection stops when less than this is left before the
+        # evaluation's deadline, so the final judgment still fits
+        self.deadline_reserve_seconds = deadline_reserve_seconds
 
         # Initialize state variables
         self.collected_evidence = {}
+        # Set when evidence collection was cut short by the deadline
+        self.evidence_truncated = False
         self._last_search_query = ""
+        self._current_iteration = 0
         
         eval_logger.info("tale_metric", "Initialized TALE metric", {
             "task": task,
             "threshold": threshold,
             "max_search_results": max_search_results,
-            "max_iterations": max_iterations
+            "max_iterations": max_iterations,
+            "fused_reflection": fused_reflection
         })
 
     def measure(self, test_case: LLMTestCase) -> float:
@@ -71,12 +123,44 @@ class TALEMetric(BaseMetric):
             # enter the evaluation loop
             reflection = {}
             memory = {}
+            deduplicator = EvidenceDeduplicator(self.near_duplicate_threshold)
             total_search_attempts = 0
             successful_searches = 0
             search_engine_failures = 0
             all_unresponsive_engines = []  # Track unresponsive engines across iterations
+            start_iteration = 0
+            
+            # Resume after the last iteration a previous attempt of this evaluation completed
+            context = current_context()
+            checkpoint = context.checkpoint if context is not None else None
+            saved_state = checkpoint.load_tale() if checkpoint is not None else None
+            if saved_state:
+                start_iteration = saved_state["iteration"]
+                reflection = saved_state["reflection"]
+                memory = saved_state["memory"]
+                total_search_attempts = saved_state["total_search_attempts"]
+                successful_searches = saved_state["successful_searches"]
+                search_engine_failures = saved_state["search_engine_failures"]
+                all_unresponsive_engines = saved_state["all_unresponsive_engines"]
+                self._last_search_query = saved_state.get("last_search_query", "")
+                for url, content in memory.items():
+                    deduplicator.mark_seen(url)
+                    deduplicator.accept(url, None, content)
+                if not reflection.get("continue_iterate", True):
+                    self.collected_evidence = memory
+                    start_iteration = self.max_iterations
+                eval_logger.info("tale_metric", "Resuming TALE evaluation from checkpoint", {
+                    "completed_iterations": saved_state["iteration"],
+                    "evidence_sources": len(memory),
+                    "evidence_complete": not reflection.get("continue_iterate", True)
+                })
             
-            for i in range(self.max_iterations):
+            for i in range(start_iteration, self.max_iterations):
+                if self._out_of_time(memory):
+                    self._truncate_evidence(memory, i)
+                    break
+                self._current_iteration = i + 1
+                report_progress("tale_iteration_started", iteration=i + 1, max_iterations=self.max_iterations)
                 eval_logger.info("tale_metric", f"Starting evaluation iteration {i + 1}", {
                     "input": test_case.input,
                     "actual_output": test_case.actual_output,
@@ -84,25 +168,37 @@ class TALEMetric(BaseMetric):
                     "context": test_case.context
                 })
 
-                # Generate search query with error handling
-                try:
-                    search_query = self._generate_search_query(test_case.input, test_case.actual_output, test_case.context, self.task, reflection)
-                    self._last_search_query = search_query  # Store for reflection
-                    
-                    if not search_query or search_query.strip() == "":
-                        error_msg = f"Failed to generate valid search query at iteration {i + 1}"
+                # A fused reflection already proposed the next queries, which saves
+                # the separate query generation round trip
+                search_queries = reflection.get("next_queries") or []
+                if search_queries:
+                    eval_logger.decision("tale_metric", "Using next queries proposed by reflection", {
+                        "queries": search_queries,
+                        "iteration": i + 1
+                    })
+                else:
+                    # Generate search query with error handling
+                    try:
+                        search_query = self._generate_search_query(test_case.input, test_case.actual_output, test_case.context, self.task, reflection)
+                        
+                        if not search_query or search_query.strip() == "":
+                            error_msg = f"Failed to generate valid search query at iteration {i + 1}"
+                            eval_logger.decision("tale_metric", "Search query generation failed", {"error": error_msg})
+                            raise ValueError(error_msg)
+                            
+                    except Exception as e:
+                        error_msg = f"Failed to generate search query at iteration {i + 1}: {str(e)}"
                         eval_logger.decision("tale_metric", "Search query generation failed", {"error": error_msg})
                         raise ValueError(error_msg)
-                        
-                except Exception as e:
-                    error_msg = f"Failed to generate search query at iteration {i + 1}: {str(e)}"
-                    eval_logger.decision("tale_metric", "Search query generation failed", {"error": error_msg})
-                    raise ValueError(error_msg)
+                    search_queries = [search_query]
 
-                # Perform web search using the generated query
+                search_query = " | ".join(search_queries)
+                self._last_search_query = search_query  # Store for reflection
+
+                # Perform web search using the generated queries
                 total_search_attempts += 1
                 try:
-                    search_results, unresponsive_engines = self._search_engine(search_query, self.search_engines, self.time_range)
+                    search_results, unresponsive_engines = self._search_queries(search_queries, self.search_engines, self.time_range)
                     successful_searches += 1
                     
                     # Track unresponsive engines across iterations
@@ -151,17 +247,56 @@ class TALEMetric(BaseMetric):
                 # Process search results
                 iteration_evidence_count = 0
                 for result in search_results:
+                    if self._out_of_time(memory):
+                        break
+                    # SearXNG results carry their snippet as "content"; local index results carry
+                    # the page content instead and have no snippet
+                    from_index = result.get("source") == "local_index"
+                    snippet = None if from_index else result.get("content")
                     eval_logger.info("tale_metric", "Processing search result", {
                         "title": result.get("title"),
                         "url": result.get("url"),
-                        "snippet": result.get("snippet")
+                        "snippet": snippet
                     })
                     
-                    # Extract website content with error handling
-                    website_content = self._extract_website_content(result.get("url"))
+                    # Skip pages already fetched (in any iteration) and copies of accepted pages
+                    if not deduplicator.check_url(result.get("url")):
+                        tale_duplicates_skipped.inc(reason="seen_url")
+                        eval_logger.debug("tale_metric", "Skipping already seen URL", {
+                            "url": result.get("url")
+                        })
+                        continue
+                    
+                    duplicate_of = deduplicator.snippet_duplicate_of(snippet)
+                    if duplicate_of:
+                        tale_duplicates_skipped.inc(reason="near_duplicate_snippet")
+                        eval_logger.debug("tale_metric", "Skipping near-duplicate search result", {
+                            "url": result.get("url"),
+                            "duplicate_of": duplicate_of
+                        })
+                        continue
+                    
+                    # Local index results carry their content, web results are fetched
+                    if from_index:
+                        website_content, sketch = result["content"], None
+                    else:
+                        page = self._extract_website_content(result.get("url"))
+                        website_content, sketch = page["content"], page["sketch"]
                     if website_content and website_content.strip():
+                        deduplicator.mark_seen(result.get("url"))
+                        duplicate_of = deduplicator.accept(result.get("url"), snippet, website_content,
+                                                           sketch=sketch)
+                        if duplicate_of:
+                            tale_duplicates_skipped.inc(reason="near_duplicate_content")
+                            eval_logger.debug("tale_metric", "Dropping near-duplicate page content", {
+                                "url": result.get("url"),
+                                "duplicate_of": duplicate_of
+                            })
+                            continue
                         memory[result.get("url")] = website_content
                         iteration_evidence_count += 1
+                        if self.use_local_index and not from_index:
+                            evidence_index.add(result.get("url"), result.get("title"), website_content)
                     else:
                         eval_logger.debug("tale_metric", "Failed to extract content from URL", {
                             "url": result.get("url")
@@ -172,9 +307,27 @@ class TALEMetric(BaseMetric):
                     "total_evidence_sources": len(memory)
                 })
 
+                if self._out_of_time(memory):
+                    self._truncate_evidence(memory, i + 1)
+                    break
+
                 # Reflect on the collected evidence to determine if more search is needed
                 try:
                     reflection = self._reflect_on_evidence(memory, test_case, i + 1)
+                    if checkpoint is not None:
+                        checkpoint.save_tale({
+                            "iteration": i + 1,
+                            "reflection": reflection,
+                            "memory": memory,
+                            "last_search_query": self._last_search_query,
+                            "total_search_attempts": total_search_attempts,
+                            "successful_searches": successful_searches,
+                            "search_engine_failures": search_engine_failures,
+                            "all_unresponsive_engines": all_unresponsive_engines
+                        })
+                    report_progress("tale_iteration_completed", iteration=i + 1,
+                                    evidence_sources=len(memory),
+                                    continue_iterate=reflection.get("continue_iterate", False))
                     if not reflection.get("continue_iterate", False):
                         self.collected_evidence = memory
                         break
@@ -228,6 +381,7 @@ class TALEMetric(BaseMetric):
             
             # finally judge the result with error handling
             try:
+                report_progress("tale_judgment_started", evidence_sources=len(self.collected_evidence))
                 judgement = self._judge_result(test_case, self.collected_evidence)
                 self.score = judgement.get("score", 0.0)
                 self.reason = judgement.get("reason", "")
@@ -267,6 +421,39 @@ class TALEMetric(BaseMetric):
             })
             raise
 
+    def _out_of_time(self, memory: dict) -> bool:
+        """
+        Whether evidence collection has to stop to leave time for the final judgment.
+
+        Raises EvaluationCancelled if the evaluation was cancelled. Without any
+        evidence there is nothing to judge, so collection goes on until the
+        deadline itself stops it.
+        """
+        context = current_context()
+        if context is None:
+            return False
+        context.cancellation.check()
+        remaining = context.cancellation.remaining()
+        return bool(memory) and remaining is not None and remaining < self.deadline_reserve_seconds
+
+    def _truncate_evidence(self, memory: dict, completed_iterations: int):
+        """Stop collecting evidence and judge with what was collected so far."""
+        self.collected_evidence = memory
+        self.evidence_truncated = True
+        eval_logger.decision("tale_metric", "Deadline approaching, judging with the evidence collected so far", {
+            "completed_iterations": completed_iterations,
+            "evidence_sources": len(memory),
+            "remaining_seconds": round(current_context().cancellation.remaining(), 1),
+            "deadline_reserve_seconds": self.deadline_reserve_seconds
+        })
+
+    def _call_timeout(self, timeout: float):
+        """Shorten a timeout to the time left before the evaluation's deadline."""
+        context = current_context()
+        if context is None:
+            return timeout
+        return context.cancellation.clamp_timeout((timeout, timeout))
+
     async def a_measure(self, test_case: LLMTestCase) -> float:
         """
         Asynchronous implementation of measure().
@@ -335,7 +522,8 @@ class TALEMetric(BaseMetric):
                 "has_reflection": bool(reflection and reflection.get('previous_query'))
             })
             
-            query = self.model.generate(prompt)
+            with usage_phase("search_query"), span("tale.search_query", iteration=self._current_iteration):
+                query = self.model.generate(prompt)
             
             eval_logger.conversation("tale_metric", "Search query generated", {
                 "query": query,
@@ -355,6 +543,100 @@ class TALEMetric(BaseMetric):
             eval_logger.debug("tale_metric", f"Search query generation failed: {str(e)}")
             raise ValueError(f"Failed to generate search query: {str(e)}")
 
+    def _search_queries(self, queries: list, engines: list, time_range: str) -> tuple:
+        """
+        Run one or more search queries and merge their results.
+
+        Each query is answered from the local evidence index when it holds
+        enough good matches, and from the search engine otherwise. Results are
+        merged in query order, keeping the first occurrence of a URL.
+        Raises only if every query failed.
+
+        Returns:
+            tuple: (results, unresponsive_engines) as returned by _search_engine
+        """
+        results = []
+        unresponsive_engines = []
+        seen_urls = set()
+        errors = []
+        for query in queries:
+            query_results = self._search_local_index(query)
+            query_unresponsive = []
+            try:
+                if not query_results:
+                    query_results, query_unresponsive = self._search_engine(query, engines, time_range)
+            except Exception as e:
+                if len(queries) == 1:
+                    raise
+                errors.append(str(e))
+                eval_logger.decision("tale_metric", "Search query failed", {
+                    "query": query,
+                    "error": str(e)
+                })
+                continue
+
+            unresponsive_engines.extend(query_unresponsive or [])
+            for result in query_results:
+                if result.get("url") not in seen_urls:
+                    seen_urls.add(result.get("url"))
+                    results.append(result)
+
+        if len(errors) == len(queries):
+            raise ValueError(f"All {len(queries)} search queries failed. Last error: {errors[-1]}")
+
+        return results, unresponsive_engines
+
+    def _search_local_index(self, query: str) -> list:
+        """
+        Look up a query in the local evidence index.
+
+        Returns:
+            list: Search results with their page content (source "local_index"), or an
+                  empty list if the index holds too few pages scoring above the threshold
+        """
+        if not self.use_local_index:
+            return []
+        context = current_context()
+        if context is not None and context.call_trace is not None:
+            # Traced evaluations record or replay every search (see call_trace)
+            return []
+
+        with span("tale.local_index", iteration=self._current_iteration) as index_span:
+            hits = evidence_index.search(
+                query,
+                limit=self.max_search_results,
+                max_age_seconds=self.local_index_max_age_hours * 3600 if self.local_index_max_age_hours else None,
+                min_score=self.local_index_min_score
+            )
+            index_span.set_attributes(hits=len(hits))
+
+        if len(hits) < self.local_index_min_results:
+            tale_local_index_lookups.inc(result="miss")
+            eval_logger.debug("tale_metric", "Local evidence index insufficient, searching the web", {
+                "query": query,
+                "local_hits": len(hits),
+                "min_results": self.local_index_min_results
+            })
+            return []
+
+        tale_local_index_lookups.inc(result="hit")
+        eval_logger.info("tale_metric", "Query answered from local evidence index", {
+            "query": query,
+            "results_count": len(hits),
+            "scores": [hit["score"] for hit in hits]
+        })
+        return [
+            {
+                "title": hit["title"],
+                "url": hit["url"],
+                "snippet": None,
+                "content": hit["content"],
+                "source": "local_index",
+                "score": hit["score"]
+            }
+            for hit in hits
+        ]
+
     def _search_engine(self, query: str, engines: list, time_range: str) -> tuple:
         """Search using SearXNG search engine for relevant web pages.
         
@@ -373,25 +655,49 @@ class TALEMetric(BaseMetric):
         if time_range == 'all':
             time_range = ''  # Reset to empty string for all time
 
+        # Leave out engines whose circuit is open, they would only add their timeout
+        routed_engines, skipped_engines = engine_health.route(list(engines) if engines else ["google"])
+        
         # Join engines as a comma-separated string for the API
-        engines_param = ",".join(engines) if engines else "google"
+        engines_param = ",".join(routed_engines)
         
         eval_logger.info("tale_metric", "Making search request", {
             "query": query,
             "engines": engines_param,
+            "skipped_engines": skipped_engines,
             "time_range": time_range,
             "url": self.search_engine_url
         })
         
+        timeout = self._call_timeout(10)
+        search_started = time.perf_counter()
         try:
-            response = requests.get(
-                f"{self.search_engine_url}/search",
-                params={"q": query, "format": "json", "engines": engines_param, "time_range": time_range},
-                timeout=10
-            )
-            response.raise_for_status()
+            with span("tale.search", iteration=self._current_iteration, engines=engines_param,
+                      skipped_engines=",".join(skipped_engines)):
+                def search():
+                    response = requests.get(
+                        f"{self.search_engine_url}/search",
+                        params={"q": query, "format": "json", "engines": engines_param, "time_range": time_range},
+                        timeout=timeout
+                    )
+                    response.raise_for_status()
+                    return {"status_code": response.status_code, "text": response.text}
+                
+                # Recorded or replayed when calls are traced (see call_trace); keyed by the
+                # requested engines, since the routing depends on the engines' health
+                response = traced_call(
+                    "search", {"query": query, "engines": list(engines) if engines else ["google"],
+                               "time_range": time_range},
+                    search,
+                    errors=(requests.exceptions.ConnectTimeout, requests.exceptions.ReadTimeout,
+                            requests.exceptions.Timeout, requests.exceptions.ConnectionError,
+                            requests.exceptions.HTTPError)
+                )
+            search_latency = time.perf_counter() - search_started
+            tale_search_duration.observe(search_latency, outcome="success")
             
         except requests.exceptions.Timeout as e:
+            tale_search_duration.observe(time.perf_counter() - search_started, outcome="timeout")
             error_msg = f"Search engine request timed out after 10 seconds: {str(e)}"
             eval_logger.debug("tale_metric", error_msg, {
                 "query": query,
@@ -401,6 +707,7 @@ class TALEMetric(BaseMetric):
             raise ValueError(error_msg)
             
         except requests.exceptions.ConnectionError as e:
+            tale_search_duration.observe(time.perf_counter() - search_started, outcome="connection_error")
             error_msg = f"Search engine connection failed: {str(e)}"
             eval_logger.debug("tale_metric", error_msg, {
                 "query": query,
@@ -409,6 +716,7 @@ class TALEMetric(BaseMetric):
             raise ValueError(error_msg)
             
         except requests.exceptions.HTTPError as e:
+            tale_search_duration.observe(time.perf_counter() - search_started, outcome="http_error")
             status_code = getattr(e.response, 'status_code', 'unknown') if hasattr(e, 'response') else 'unknown'
             error_msg = f"Search engine HTTP error (status {status_code}): {str(e)}"
             eval_logger.debug("tale_metric", error_msg, {
@@ -419,6 +727,7 @@ class TALEMetric(BaseMetric):
             raise ValueError(error_msg)
             
         except Exception as e:
+            tale_search_duration.observe(time.perf_counter() - search_started, outcome="error")
             error_msg = f"Search engine request failed with unexpected error: {str(e)}"
             eval_logger.debug("tale_metric", error_msg, {
                 "query": query,
@@ -429,9 +738,10 @@ class TALEMetric(BaseMetric):
 
         # If we get here, the request was successful, now parse the response
         try:
-            results_data = response.json()
+            results_data = json.loads(response["text"])
             results = results_data.get("results", [])
             unresponsive_engines = results_data.get("unresponsive_engines", [])
+            engine_health.record_search(routed_engines, unresponsive_engines, search_latency * 1000)
             
             # Log unresponsive engines if any
             if unresponsive_engines:
@@ -442,10 +752,12 @@ class TALEMetric(BaseMetric):
                         engine_error = engine_info[1]
                         unresponsive_info.append(f"{engine_name}: {engine_error}")
                     else:
+                        engine_name = str(engine_info)
                         unresponsive_info.append(str(engine_info))
+                    tale_unresponsive_engines.inc(engine=engine_name)
                 
                 eval_logger.info("tale_metric", "Search completed with unresponsive engines", {
-                    "status_code": response.status_code,
+                    "status_code": response["status_code"],
                     "results_count": len(results),
                     "query": query,
                     "unresponsive_engines": unresponsive_engines,
@@ -453,7 +765,7 @@ class TALEMetric(BaseMetric):
                 })
             else:
                 eval_logger.info("tale_metric", "Search request completed successfully", {
-                    "status_code": response.status_code,
+                    "status_code": response["status_code"],
                     "results_count": len(results),
                     "query": query
                 })
@@ -489,19 +801,43 @@ class TALEMetric(BaseMetric):
             })
             raise ValueError(error_msg)
     
-    def _extract_website_content(self, url: str) -> str:
-        """Extract content from a web page URL."""
+    def _extract_website_content(self, url: str) -> dict:
+        """
+        Extract content from a web page URL.
+
+        The page is parsed, cleaned and sketched for the near-duplicate check in
+        the processing pool, so big pages do not hold the GIL of the request threads.
+
+        Returns:
+            dict: "content" (empty if the page could not be fetched) and its "sketch"
+        """
+        fetch_started = time.perf_counter()
+        context = current_context()
+        cancellation = context.cancellation if context is not None else None
         try:
-            from bs4 import BeautifulSoup
-            from urllib.request import Request, urlopen
-            
-            req = Request(url, headers={'User-Agent': 'Mozilla/5.0'})
-            html = urlopen(req)
-            soup = BeautifulSoup(html, "html.parser")
-            return soup.get_text()
+            # The shared client applies per-host connection reuse, rate limits and robots.txt
+            with span("tale.scrape", iteration=self._current_iteration, url=url) as scrape_span:
+                html = traced_call("page", {"url": url},
+                                   lambda: scraping_client.fetch(url, timeout=self._call_timeout(scraping_client.timeout),
+                                                                cancellation=cancellation),
+                                   encode=lambda page: base64.b64encode(page).decode("ascii"),
+                                   decode=base64.b64decode,
+                                   errors=(ScrapeSkipped,))
+                scrape_span.set_attributes(bytes=len(html))
+            tale_scrape_duration.observe(time.perf_counter() - fetch_started, outcome="success")
+            tale_bytes_fetched.inc(len(html))
+            with span("tale.parse", iteration=self._current_iteration, bytes=len(html)):
+                return processing_pool.run(extract_page, html, self.near_duplicate_threshold < 1.0,
+                                           timeout=cancellation.remaining() if cancellation is not None else None,
+                                           cancellation=cancellation)
+        except ScrapeSkipped as e:
+            tale_scrape_duration.observe(time.perf_counter() - fetch_started, outcome="skipped")
+            eval_logger.debug("tale_metric", f"Web scraping skipped: {str(e)}", {"url": url})
+            return {"content": "", "sketch": None}
         except Exception as e:
+            tale_scrape_duration.observe(time.perf_counter() - fetch_started, outcome="error")
             eval_logger.debug("tale_metric", f"Web scraping failed: {str(e)}")
-            return ""
+            return {"content": "", "sketch": None}
 
     def _reflect_on_evidence(self, memory: dict, test_case: LLMTestCase, iteration: int) -> dict:
         """
@@ -548,7 +884,10 @@ class TALEMetric(BaseMetric):
         evidence_summary = self._summarize_evidence(memory)
         
         # Build reflection prompt
-        reflection_prompt = self._build_reflection_prompt(test_case, evidence_summary, iteration)
+        if self.fused_reflection:
+            reflection_prompt = self._build_fused_reflection_prompt(test_case, evidence_summary, iteration)
+        else:
+            reflection_prompt = self._build_reflection_prompt(test_case, evidence_summary, iteration)
         
         # Get LLM reflection
         eval_logger.conversation("tale_metric", "Requesting reflection from LLM", {
@@ -557,7 +896,8 @@ class TALEMetric(BaseMetric):
         })
         
         try:
-            reflection_response = self.model.generate(reflection_prompt)
+            with usage_phase("reflection"), span("tale.reflection", iteration=iteration):
+                reflection_response = self.model.generate(reflection_prompt)
             
             if not reflection_response or not isinstance(reflection_response, str):
                 raise ValueError(f"Model returned invalid reflection response: {type(reflection_response)} - {reflection_response}")
@@ -576,20 +916,24 @@ class TALEMetric(BaseMetric):
         })
         
         # Parse reflection response to determine if more search is needed
-        should_continue = self._parse_reflection_response(reflection_response)
+        parsed_reflection = self._parse_reflection_response(reflection_response)
+        should_continue = parsed_reflection["continue_iterate"]
+        next_queries = parsed_reflection["next_queries"][:self.max_queries_per_iteration] if should_continue else []
         
         eval_logger.decision("tale_metric", "Reflection decision made", {
             "should_continue": should_continue,
             "iteration": iteration,
-            "evidence_sources": len(memory)
+            "evidence_sources": len(memory),
+            "next_queries": next_queries
         })
         
         return {
             "continue_iterate": should_continue,
-            "source_critique": reflection_response,
+            "source_critique": parsed_reflection["reason"] or reflection_response,
             "evidence_quality": "sufficient" if not should_continue else "needs_more",
             "previous_query": getattr(self, '_last_search_query', ''),
-            "reflection": reflection_response
+            "reflection": parsed_reflection["reason"] or reflection_response,
+            "next_queries": next_queries
         }
 
     def _judge_result(self, test_case: LLMTestCase, memory: dict) -> dict:
@@ -631,7 +975,8 @@ class TALEMetric(BaseMetric):
         
         # Get LLM judgment
         try:
-            judgment_response = self.model.generate(judgment_prompt)
+            with usage_phase("judgment"), span("tale.judgment", evidence_sources=len(memory)):
+                judgment_response = self.model.generate(judgment_prompt)
             
             if not judgment_response or not isinstance(judgment_response, str):
                 raise ValueError(f"Model returned invalid judgment response: {type(judgment_response)} - {judgment_response}")
@@ -733,6 +1078,49 @@ Respond with ONLY one of:
 - SUFFICIENT: If you have enough evidence to make a reliable evaluation
 - INSUFFICIENT: If you need more evidence (provide brief reason why)
 
+Your response:"""
+        
+        return prompt
+
+    def _build_fused_reflection_prompt(self, test_case: LLMTestCase, evidence_summary: str, iteration: int) -> str:
+        """
+        Build prompt for an LLM reflection that also proposes the next search queries.
+        
+        Args:
+            test_case: The test case being evaluated
+            evidence_summary: Summary of collected evidence
+            iteration: Current iteration number
+            
+        Returns:
+            Reflection prompt string asking for a JSON verdict
+        """
+        prompt = f"""You are evaluating whether sufficient evidence has been collected to assess an LLM's response.
+
+EVALUATION TASK: {self.task}
+
+ORIGINAL INPUT: {test_case.input}
+
+LLM RESPONSE TO EVALUATE: {test_case.actual_output}
+
+SEARCH QUERIES USED SO FAR: {getattr(self, '_last_search_query', '')}
+
+EVIDENCE COLLECTED (Iteration {iteration}):
+{evidence_summary}
+
+Based on the evidence collected so far, determine if you have enough information to reliably evaluate the LLM's response against the task requirements.
+
+Consider:
+1. Is the evidence relevant to the evaluation task?
+2. Is there sufficient information to make a confident judgment?
+3. Are there obvious gaps in the evidence that more searching could fill?
+
+If the evidence is insufficient, propose up to {self.max_queries_per_iteration} new web search engine queries that would fill the gaps. Do not repeat queries that were already used.
+
+Respond with ONLY a JSON object in this format:
+{{"verdict": "SUFFICIENT" or "INSUFFICIENT", "reason": "brief reason", "next_queries": ["query", ...]}}
+
+Use an empty "next_queries" list when the verdict is SUFFICIENT.
+
 Your response:"""
         
         return prompt
@@ -778,36 +1166,57 @@ Your evaluation:"""
         
         return prompt
 
-    def _parse_reflection_response(self, response: str) -> bool:
+    def _parse_reflection_response(self, response: str) -> dict:
         """
         Parse LLM reflection response to determine if more search is needed.
         
+        Accepts the structured JSON format of the fused reflection prompt and the
+        plain "SUFFICIENT" / "INSUFFICIENT: reason" format of the classic prompt.
+        Only the verdict token is interpreted, so words like "insufficient"
+        inside the reasoning cannot flip the decision.
+        
         Args:
             response: LLM reflection response
             
         Returns:
-            True if more search is needed, False if sufficient evidence
+            Dict with 'continue_iterate' (True if more search is needed),
+            'reason' and 'next_queries' (empty unless the response proposed any)
         """
-        response_lower = response.lower().strip()
-        
-        # Check for explicit sufficient/insufficient indicators
-        if "sufficient" in response_lower and "insufficient" not in response_lower:
-            return False
-        elif "insufficient" in response_lower:
-            return True
-        
-        # Fallback: look for other indicators
-        continue_indicators = ["need more", "not enough", "insufficient", "continue", "search more"]
-        stop_indicators = ["enough", "sufficient", "adequate", "complete"]
+        parsed = self._parse_json_object(response)
+        if parsed is not None and isinstance(parsed.get("verdict"), str):
+            verdict = parsed["verdict"].strip().upper()
+            next_queries = parsed.get("next_queries") or []
+            if isinstance(next_queries, str):
+                next_queries = [next_queries]
+            next_queries = [query.strip() for query in next_queries if isinstance(query, str) and query.strip()]
+            return {
+                "continue_iterate": verdict.startswith("INSUFFICIENT"),
+                "reason": str(parsed.get("reason", "")).strip(),
+                "next_queries": next_queries
+            }
         
-        has_continue = any(indicator in response_lower for indicator in continue_indicators)
-        has_stop = any(indicator in response_lower for indicator in stop_indicators)
+        # Classic format: the response starts with the verdict token
+        verdict = _REFLECTION_VERDICT.match(response.strip())
         
-        # If both or neither, default to sufficient (stop searching)
-        if has_continue and not has_stop:
-            return True
-        else:
-            return False
+        # If no verdict can be found, default to sufficient (stop searching)
+        return {
+            "continue_iterate": verdict is not None and verdict.group(1) is not None,
+            "reason": response.strip(),
+            "next_queries": []
+        }
+
+    @staticmethod
+    def _parse_json_object(response: str) -> Optional[dict]:
+        """Extract the first JSON object from an LLM response (tolerates code fences and surrounding text)."""
+        start = response.find("{")
+        end = response.rfind("}")
+        if start == -1 or end <= start:
+            return None
+        try:
+            parsed = json.loads(response[start:end + 1])
+        except ValueError:
+            return None
+        return parsed if isinstance(parsed, dict) else None
 
     def _parse_judgment_response(self, response: str) -> dict:
         """
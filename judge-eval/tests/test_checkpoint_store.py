@@ -0,0 +1,97 @@
+import json
+import os
+
+import pytest
+
+from checkpoint_store import CheckpointStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return CheckpointStore(str(tmp_path / "checkpoints"), ttl_hours=1.0)
+
+
+def _attempt(store, fingerprint, prompts, resume=True):
+    """Run the judge calls of one attempt; returns the responses replayed and closes the checkpoint."""
+    checkpoint = store.open(fingerprint, resume=resume)
+    replayed = []
+    try:
+        for index, prompt in enumerate(prompts):
+            slot, entry = checkpoint.replay_judge(prompt)
+            if entry is not None:
+                replayed.append(entry["response"])
+            else:
+                checkpoint.record_judge(slot, f"{prompt} #{index}", usage={"total_tokens": index})
+        return replayed, checkpoint.summary()
+    finally:
+        checkpoint.close()
+
+
+def test_repeated_prompts_replay_in_call_order(store):
+    fingerprint = store.fingerprint(prompt="question")
+    _attempt(store, fingerprint, ["same", "other", "same"])
+
+    replayed, summary = _attempt(store, fingerprint, ["same", "other", "same", "same"])
+
+    # Each occurrence replays its own answer; the fourth was never made
+    assert replayed == ["same #0", "other #1", "same #2"]
+    assert summary["replayed_judge_calls"] == 3
+    assert summary["resumed"] is True
+
+
+def test_replay_records_usage(store):
+    fingerprint = store.fingerprint(prompt="question")
+    _attempt(store, fingerprint, ["a", "b"])
+
+    checkpoint = store.open(fingerprint)
+    checkpoint.replay_judge("a")
+    _, entry = checkpoint.replay_judge("b")
+    checkpoint.close()
+
+    assert entry == {"response": "b #1", "usage": {"total_tokens": 1}}
+
+
+def test_torn_journal_line_ends_the_replay(store):
+    fingerprint = store.fingerprint(prompt="question")
+    _attempt(store, fingerprint, ["a", "b"])
+    journal = os.path.join(store.checkpoint_dir, fingerprint, "judge_journal.jsonl")
+    with open(journal, "r+", encoding="utf-8") as f:
+        lines = f.readlines()
+        f.seek(0)
+        f.truncate()
+        f.write(lines[0] + lines[1][:10])
+
+    replayed, _ = _attempt(store, fingerprint, ["a", "b"])
+
+    assert replayed == ["a #0"]
+    with open(journal, encoding="utf-8") as f:
+        assert json.loads(f.readlines()[-1])["response"] == "b #1"
+
+
+def test_start_over_ignores_previous_attempt(store):
+    fingerprint = store.fingerprint(prompt="question")
+    _attempt(store, fingerprint, ["a"])
+
+    replayed, summary = _attempt(store, fingerprint, ["a"], resume=False)
+
+    assert replayed == []
+    assert summary["resumed"] is False
+
+
+def test_discard_removes_the_checkpoint(store):
+    fingerprint = store.fingerprint(prompt="question")
+    checkpoint = store.open(fingerprint)
+    checkpoint.save_generation("output", {"model": "m"})
+    checkpoint.discard()
+    checkpoint.close()
+
+    replayed, summary = _attempt(store, fingerprint, ["a"])
+
+    assert replayed == []
+    assert summary["resumed"] is False
+    assert summary["generation_restored"] is False
+
+
+def test_fingerprint_depends_on_all_parts(store):
+    assert store.fingerprint(prompt="a", run_index=1) == store.fingerprint(run_index=1, prompt="a")
+    assert store.fingerprint(prompt="a", run_index=1) != store.fingerprint(prompt="a", run_index=2)
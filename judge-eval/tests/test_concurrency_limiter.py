@@ -0,0 +1,132 @@
+import pytest
+
+from cancellation import CancellationToken, EvaluationCancelled
+from concurrency_limiter import AdaptiveLimiter, ProviderLimiters, parse_reset_duration, pause_from_headers
+
+
+def _limiter(initial=4, maximum=8):
+    return AdaptiveLimiter("http://provider", "model", initial, maximum, latency_tolerance=3.0)
+
+
+def _call(limiter, signal, latency=1.0, pause=None):
+    limiter.acquire()
+    limiter.release(signal, latency, pause)
+
+
+def test_success_increases_limit_additively():
+    limiter = _limiter(initial=4)
+    for _ in range(4):
+        _call(limiter, "success")
+
+    # One slot per window of `limit` calls
+    assert 4.9 < limiter.limit < 5.0
+    assert limiter.in_flight == 0
+
+
+def test_limit_is_capped():
+    limiter = _limiter(initial=7, maximum=8)
+    for _ in range(50):
+        _call(limiter, "success")
+
+    assert limiter.limit == 8.0
+
+
+def test_rate_limit_halves_once_per_round_trip():
+    limiter = _limiter(initial=8)
+    _call(limiter, "rate_limited")
+    assert limiter.limit == 4.0
+
+    # Calls failing together in the same overload only count once
+    _call(limiter, "rate_limited")
+    assert limiter.limit == 4.0
+
+    limiter.last_decrease_at -= 10
+    _call(limiter, "rate_limited")
+    assert limiter.limit == 2.0
+
+
+def test_server_error_cuts_a_quarter_and_limit_stays_positive():
+    limiter = _limiter(initial=4)
+    _call(limiter, "server_error")
+    assert limiter.limit == 3.0
+
+    for _ in range(5):
+        limiter.last_decrease_at -= 10
+        _call(limiter, "rate_limited")
+    assert limiter.limit == 1.0
+
+
+def test_slow_call_trims_limit():
+    limiter = _limiter(initial=4)
+    _call(limiter, "success", latency=1.0)
+    before = limiter.limit
+
+    _call(limiter, "success", latency=10.0)
+
+    assert limiter.limit == pytest.approx(before * 0.9)
+
+
+def test_neutral_signal_keeps_limit():
+    limiter = _limiter(initial=4)
+    _call(limiter, "neutral")
+
+    assert limiter.limit == 4.0
+
+
+def test_waiting_for_a_paused_provider_stops_when_cancelled():
+    limiter = _limiter(initial=4)
+    _call(limiter, "success", pause=60.0)
+    token = CancellationToken(deadline_seconds=0.2)
+
+    with pytest.raises(EvaluationCancelled):
+        limiter.acquire(token)
+    assert limiter.in_flight == 0
+    assert not any(limiter.waiting.values())
+
+
+def test_slot_records_errors():
+    limiters = ProviderLimiters(initial_limit=4, max_limit=8)
+
+    with pytest.raises(RuntimeError):
+        with limiters.slot("http://provider/", "model"):
+            raise RuntimeError("connection reset")
+
+    limiter = limiters.limiter("http://provider", "model")
+    assert limiter.limit == 3.0
+    assert limiter.in_flight == 0
+
+
+def test_slot_records_status():
+    limiters = ProviderLimiters(initial_limit=4, max_limit=8)
+
+    with limiters.slot("http://provider", "model") as slot:
+        slot.record(429, {"Retry-After": "2"})
+
+    limiter = limiters.limiter("http://provider", "model")
+    assert limiter.limit == 2.0
+    assert limiter.paused_until > 0
+
+
+@pytest.mark.parametrize("value, seconds", [
+    ("12", 12.0),
+    ("1s", 1.0),
+    ("6m0s", 360.0),
+    ("250ms", 0.25),
+    ("1h2m", 3720.0),
+    ("soon", None),
+    (None, None),
+])
+def test_parse_reset_duration(value, seconds):
+    assert parse_reset_duration(value) == seconds
+
+
+def test_pause_from_headers():
+    assert pause_from_headers(429, {"Retry-After-Ms": "1500"}) == 1.5
+    assert pause_from_headers(503, {"retry-after": "3"}) == 3.0
+    # Retry-After only counts on overload answers
+    assert pause_from_headers(200, {"retry-after": "3"}) is None
+    assert pause_from_headers(200, {
+        "x-ratelimit-remaining-requests": "0", "x-ratelimit-reset-requests": "1s",
+        "x-ratelimit-remaining-tokens": "0", "x-ratelimit-reset-tokens": "6m0s"
+    }) == 360.0
+    assert pause_from_headers(200, {"x-ratelimit-remaining-requests": "5"}) is None
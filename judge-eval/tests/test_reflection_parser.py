@@ -0,0 +1,56 @@
+import pytest
+
+from talemetric import TALEMetric
+
+
+@pytest.fixture
+def metric():
+    return TALEMetric(model=None)
+
+
+@pytest.mark.parametrize("response", [
+    "INSUFFICIENT: the evidence does not mention the date",
+    "insufficient - need dates",
+    "**INSUFFICIENT**: need dates",
+    "- __Insufficient__. Only one source",
+    "`INSUFFICIENT`",
+    "## INSUFFICIENT\nThe sources disagree",
+])
+def test_classic_insufficient_continues(metric, response):
+    parsed = metric._parse_reflection_response(response)
+
+    assert parsed["continue_iterate"] is True
+    assert parsed["reason"] == response.strip()
+    assert parsed["next_queries"] == []
+
+
+@pytest.mark.parametrize("response", [
+    "SUFFICIENT",
+    "**SUFFICIENT**: although an insufficient source was discarded",
+    "Sufficient. Nothing is insufficient here",
+    # Only the verdict at the start counts
+    "The evidence is insufficient",
+    "INSUFFICIENTLY covered",
+    "",
+    "   ",
+])
+def test_classic_other_responses_stop(metric, response):
+    assert metric._parse_reflection_response(response)["continue_iterate"] is False
+
+
+def test_fused_json_verdict(metric):
+    parsed = metric._parse_reflection_response(
+        '```json\n{"verdict": "insufficient", "reason": " no dates ", '
+        '"next_queries": ["release date", " ", 3, "launch"]}\n```'
+    )
+
+    assert parsed == {"continue_iterate": True, "reason": "no dates", "next_queries": ["release date", "launch"]}
+
+
+def test_fused_json_reason_does_not_flip_verdict(metric):
+    parsed = metric._parse_reflection_response(
+        '{"verdict": "SUFFICIENT", "reason": "INSUFFICIENT sources were ignored", "next_queries": "unused"}'
+    )
+
+    assert parsed["continue_iterate"] is False
+    assert parsed["next_queries"] == ["unused"]
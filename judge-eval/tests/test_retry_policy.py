@@ -0,0 +1,116 @@
+import pytest
+import requests
+
+from cancellation import CancellationToken, EvaluationCancelled
+from retry_policy import RetryBudget, RetryPolicy, RetryStats
+
+
+class _Operation:
+    """Fails with the given errors, then returns "ok"."""
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.timeouts = []
+
+    def __call__(self, timeout):
+        self.timeouts.append(timeout)
+        if self.errors:
+            raise self.errors.pop(0)
+        return "ok"
+
+
+def _status_error(status):
+    response = requests.Response()
+    response.status_code = status
+    return requests.exceptions.HTTPError(f"{status} error", response=response)
+
+
+def _policy(max_attempts=4, budget=None):
+    return RetryPolicy("judge", max_attempts=max_attempts, base_delay=0.0, timeout=(1.0, 2.0),
+                       budget=budget or RetryBudget())
+
+
+def test_transient_failures_are_retried():
+    operation = _Operation(requests.exceptions.ConnectionError(), _status_error(503))
+    stats = RetryStats()
+
+    assert _policy().run(operation, stats) == "ok"
+    assert len(operation.timeouts) == 3
+    assert stats.summary() == {
+        "total_retries": 2,
+        "by_component": {"judge": {"retries": 2, "calls_retried": 1, "calls_failed": 0}}
+    }
+
+
+def test_permanent_failures_are_not_retried():
+    operation = _Operation(_status_error(400))
+    stats = RetryStats()
+
+    with pytest.raises(requests.exceptions.HTTPError):
+        _policy().run(operation, stats)
+    assert len(operation.timeouts) == 1
+    assert stats.summary()["by_component"]["judge"]["calls_failed"] == 1
+
+
+def test_attempts_are_limited():
+    operation = _Operation(*[requests.exceptions.Timeout() for _ in range(10)])
+
+    with pytest.raises(requests.exceptions.Timeout):
+        _policy(max_attempts=3).run(operation)
+    assert len(operation.timeouts) == 3
+
+
+def test_budget_limits_retries_across_calls():
+    budget = RetryBudget(ratio=0.2, max_tokens=2.0)
+    policy = _policy(max_attempts=10, budget=budget)
+    failing = _Operation(*[requests.exceptions.ConnectionError() for _ in range(10)])
+
+    # The full bucket pays for two retries, then the call fails
+    with pytest.raises(requests.exceptions.ConnectionError):
+        policy.run(failing)
+    assert len(failing.timeouts) == 3
+
+    # Without successful traffic the next failing call is not retried
+    failing.timeouts.clear()
+    with pytest.raises(requests.exceptions.ConnectionError):
+        policy.run(failing)
+    assert len(failing.timeouts) == 1
+
+    # Five calls earn one retry (the failed call above deposited too)
+    for _ in range(4):
+        assert policy.run(_Operation()) == "ok"
+    flaky = _Operation(requests.exceptions.ConnectionError(), requests.exceptions.ConnectionError())
+    with pytest.raises(requests.exceptions.ConnectionError):
+        policy.run(flaky)
+    assert len(flaky.timeouts) == 2
+
+
+def test_budget_is_capped():
+    budget = RetryBudget(ratio=1.0, max_tokens=2.0)
+    for _ in range(10):
+        budget.deposit()
+
+    assert budget.withdraw() and budget.withdraw()
+    assert not budget.withdraw()
+
+
+def test_timeouts_are_clamped_to_the_deadline():
+    operation = _Operation()
+    token = CancellationToken(deadline_seconds=0.5)
+
+    _policy().run(operation, cancellation=token)
+
+    connect_timeout, read_timeout = operation.timeouts[0]
+    assert connect_timeout <= 0.5 and read_timeout <= 0.5
+
+
+def test_cancelled_evaluation_is_not_retried():
+    token = CancellationToken()
+    token.cancel()
+    operation = _Operation()
+    stats = RetryStats()
+
+    with pytest.raises(EvaluationCancelled):
+        _policy().run(operation, stats, cancellation=token)
+    assert operation.timeouts == []
+    assert stats.summary()["by_component"]["judge"]["calls_failed"] == 0
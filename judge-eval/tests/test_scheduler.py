@@ -0,0 +1,127 @@
+from cancellation import CancellationToken
+from scheduler import EvaluationScheduler, INTERACTIVE, BULK
+
+
+def _hold(scheduler):
+    """Take the only slot, so the tickets submitted next have to wait."""
+    ticket = scheduler.submit(INTERACTIVE, flow="holder")
+    assert ticket.future.done()
+    return ticket
+
+
+def _admission_order(scheduler, holder, tickets):
+    """Release the running ticket over and over and return the tickets in the order they were admitted."""
+    order = []
+    running = holder
+    for _ in tickets:
+        scheduler.release(running)
+        running = next(ticket for ticket in tickets if ticket.future.done() and ticket not in order)
+        order.append(running)
+    scheduler.release(running)
+    return order
+
+
+def test_interactive_is_admitted_before_bulk():
+    scheduler = EvaluationScheduler(max_concurrent=1)
+    holder = _hold(scheduler)
+    bulk = scheduler.submit(BULK, flow="benchmark")
+    interactive = scheduler.submit(INTERACTIVE)
+
+    assert not bulk.future.done() and not interactive.future.done()
+    assert _admission_order(scheduler, holder, [bulk, interactive]) == [interactive, bulk]
+
+
+def test_unknown_priority_counts_as_bulk():
+    scheduler = EvaluationScheduler(max_concurrent=1)
+    _hold(scheduler)
+    ticket = scheduler.submit("batch")
+
+    assert ticket.priority == BULK
+
+
+def test_flows_share_slots_by_weight():
+    scheduler = EvaluationScheduler(max_concurrent=1)
+    holder = _hold(scheduler)
+    heavy = [scheduler.submit(BULK, flow="a", weight=2.0) for _ in range(6)]
+    light = [scheduler.submit(BULK, flow="b", weight=1.0) for _ in range(6)]
+
+    order = _admission_order(scheduler, holder, heavy + light)
+
+    # Submitted all at once, flow b is still served from the start, at half the rate of flow a
+    first = order[:6]
+    assert sum(ticket in heavy for ticket in first) == 4
+    assert sum(ticket in light for ticket in first) == 2
+    assert order[1] in light
+    # Within a flow tickets keep their order
+    assert [ticket for ticket in order if ticket in heavy] == heavy
+    assert scheduler.running == 0
+
+
+def test_purge_cancelled_withdraws_waiting_tickets():
+    scheduler = EvaluationScheduler(max_concurrent=1)
+    holder = _hold(scheduler)
+    cancelled_token = CancellationToken()
+    cancelled = scheduler.submit(BULK, flow="benchmark", cancellation=cancelled_token)
+    kept = scheduler.submit(BULK, flow="benchmark", cancellation=CancellationToken())
+
+    cancelled_token.cancel()
+    assert scheduler.purge_cancelled() == 1
+    assert cancelled.future.cancelled()
+    assert scheduler.snapshot()["waiting"][BULK]["total"] == 1
+    assert scheduler.purge_cancelled() == 0
+
+    scheduler.release(holder)
+    assert kept.future.done() and not kept.future.cancelled()
+    # Releasing a withdrawn ticket does not free a slot it never had
+    scheduler.release(cancelled)
+    assert scheduler.running == 1
+
+
+def test_cancelled_ticket_does_not_take_a_slot():
+    scheduler = EvaluationScheduler(max_concurrent=1)
+    holder = _hold(scheduler)
+    token = CancellationToken()
+    cancelled = scheduler.submit(BULK, cancellation=token)
+    waiting = scheduler.submit(BULK)
+
+    token.cancel()
+    scheduler.release(holder)
+
+    assert cancelled.future.cancelled()
+    assert waiting.future.done() and not waiting.future.cancelled()
+    assert scheduler.running == 1
+
+
+def test_release_is_idempotent():
+    scheduler = EvaluationScheduler(max_concurrent=2)
+    first = scheduler.submit(INTERACTIVE)
+    second = scheduler.submit(INTERACTIVE)
+    waiting = scheduler.submit(BULK)
+    assert scheduler.running == 2
+
+    scheduler.release(first)
+    scheduler.release(first)
+    # The second release did not free another slot
+    assert waiting.future.done()
+    assert scheduler.running == 2
+
+    withdrawn = scheduler.submit(BULK)
+    scheduler.release(withdrawn)
+    scheduler.release(withdrawn)
+    assert withdrawn.future.cancelled()
+    assert scheduler.snapshot()["waiting"][BULK]["total"] == 0
+
+    scheduler.release(second)
+    scheduler.release(waiting)
+    scheduler.release(waiting)
+    assert scheduler.running == 0
+
+
+def test_waiting_ahead_counts_more_urgent_classes():
+    scheduler = EvaluationScheduler(max_concurrent=1)
+    _hold(scheduler)
+    scheduler.submit(BULK)
+    scheduler.submit(INTERACTIVE)
+
+    assert scheduler.waiting_ahead(INTERACTIVE) == 1
+    assert scheduler.waiting_ahead(BULK) == 2
@@ -0,0 +1,56 @@
+"""
+CPU-bound processing of fetched pages.
+
+The functions of this module run in the worker processes of the processing
+pool (see processing_pool), which import this module on their own. Keep its
+imports to what the functions need: no logging, metrics or evaluation state.
+The warm-up checks that the pool processes did not import the service with it
+(see loaded_service_modules).
+"""
+
+import re
+import sys
+from typing import Dict, Any, List
+from bs4 import BeautifulSoup
+from evidence_dedup import MinHashSketch
+
+
+# Elements whose text is never page content
+NON_CONTENT_TAGS = ("script", "style", "noscript", "template")
+
+_SPACES_RE = re.compile(r"[ \t\r\f\v\xa0]+")
+
+# Modules of the serving process that pool processes have no use for
+SERVICE_MODULES = ("fastapi", "llmrequestor", "jobs", "main")
+
+
+def clean_text(text: str) -> str:
+    """Collapse runs of spaces and drop blank lines."""
+    lines = (_SPACES_RE.sub(" ", line).strip() for line in text.splitlines())
+    return "\n".join(line for line in lines if line)
+
+
+def extract_page(html: bytes, sketch: bool = True) -> Dict[str, Any]:
+    """
+    Turn a fetched page into evidence.
+
+    Args:
+        html: Page body as fetched; BeautifulSoup detects its encoding
+        sketch: Also shingle the text into the MinHash sketch of the near-duplicate check
+
+    Returns:
+        dict: "content" (the visible text, cleaned) and "sketch" (MinHashSketch or None)
+    """
+    soup = BeautifulSoup(html, "html.parser")
+    for element in soup(NON_CONTENT_TAGS):
+        element.decompose()
+    content = clean_text(soup.get_text("\n"))
+    return {
+        "content": content,
+        "sketch": MinHashSketch(content) if sketch and content else None
+    }
+
+
+def loaded_service_modules() -> List[str]:
+    """Modules of SERVICE_MODULES loaded in this process; none in a pool process."""
+    return [name for name in SERVICE_MODULES if name in sys.modules]
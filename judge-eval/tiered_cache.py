@@ -0,0 +1,201 @@
+"""
+Two-tier cache of JSON documents shared by the serving workers.
+
+With several worker processes (see JUDGE_EVAL_WORKERS in shared_state) a
+cache held only in memory diverges between the workers, while a cache held
+only on disk reads and parses its file again on every hit. A TieredCache
+keeps a bounded in-memory tier per worker in front of a directory shared by
+all of them:
+
+    - entries are written to disk atomically (temporary file and rename), so
+      no worker ever reads a torn file,
+    - a memory hit is validated against the modification time, size and inode
+      of its file with a single stat(), so an entry replaced, expired or
+      removed by another worker is reloaded or dropped instead of served stale,
+    - write-once entries are published with link(), so the first worker to
+      store a key wins and later writers keep the stored value,
+    - with access tracking, a hit sets the access time of its file (at most
+      every ACCESS_RESOLUTION_SECONDS, and whatever the mount's atime
+      options), so size-bounded eviction (see cache_maintenance) can keep the
+      entries used most recently by any worker.
+
+Values returned from the memory tier are shared between callers and must be
+treated as read-only.
+
+Configuration (environment variables):
+    CACHE_MEMORY_MAX_ENTRIES    Entries kept in memory per cache and worker (default: 512)
+"""
+
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+from eval_logger import eval_logger
+from service_metrics import cache_lookups
+
+
+class TieredCache:
+    """
+    Per-worker LRU memory tier in front of a shared directory of JSON files. Thread-safe.
+
+    Args:
+        name: Name of the cache in logs and metrics
+        directory: Directory of the disk tier, shared by all workers
+        memory_entries: Entries kept in the memory tier, 0 to disable it
+        track_access: Record hits in the access time of the files
+    """
+
+    def __init__(self, name: str, directory: str, memory_entries: int = 512, track_access: bool = False):
+        self.name = name
+        self.directory = directory
+        self.memory_entries = max(0, memory_entries)
+        self.track_access = track_access
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, Tuple[Tuple[int, int, int], Any]]" = OrderedDict()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    @staticmethod
+    def _signature(stat: os.stat_result) -> Tuple[int, int, int]:
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    def _remember(self, key: str, signature: Tuple[int, int, int], value: Any):
+        if not self.memory_entries:
+            return
+        with self._lock:
+            self._memory[key] = (signature, value)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def _forget(self, key: str):
+        with self._lock:
+            self._memory.pop(key, None)
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the value stored for a key, or None if it is missing or unreadable."""
+        path = self.path(key)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            self._forget(key)
+            cache_lookups.inc(cache=self.name, tier="miss")
+            return None
+        signature = self._signature(stat)
+        if self.track_access:
+            self._touch(path, stat)
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and entry[0] == signature:
+                self._memory.move_to_end(key)
+                cache_lookups.inc(cache=self.name, tier="memory")
+                return entry[1]
+
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                # Sign the value with the file it is read from; if another worker
+                # replaced the file since the stat above, the next lookup reads it again
+                signature = self._signature(os.fstat(f.fileno()))
+                value = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            self._forget(key)
+            eval_logger.log_error("tiered_cache", f"Failed to read {self.name} cache entry: {e}", {
+                "cache_file": path
+            })
+            cache_lookups.inc(cache=self.name, tier="miss")
+            return None
+
+        self._remember(key, signature, value)
+        cache_lookups.inc(cache=self.name, tier="disk")
+        return value
+
+    @staticmethod
+    def _touch(path: str, stat: os.stat_result):
+        # Sets the access time only; the modification time, and with it the
+        # entry's age and signature, stays as it is
+        now_ns = time.time_ns()
+        if now_ns - stat.st_atime_ns > ACCESS_RESOLUTION_SECONDS * 1_000_000_000:
+            try:
+                os.utime(path, ns=(now_ns, stat.st_mtime_ns))
+            except OSError:
+                pass
+
+    def put(self, key: str, value: Any, exclusive: bool = False, indent: Optional[int] = None) -> bool:
+        """
+        Store a value in both tiers.
+
+        Args:
+            exclusive: Keep an existing entry instead of replacing it (write-once)
+            indent: Indentation of the JSON file
+
+        Returns:
+            bool: True if the value was stored, False if an exclusive entry already existed
+
+        Raises:
+            OSError: The disk tier could not be written
+        """
+        path = self.path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(value, f, ensure_ascii=False, indent=indent)
+            if exclusive:
+                # link() fails if the key was stored in the meantime
+                os.link(tmp_path, path)
+            else:
+                os.replace(tmp_path, path)
+            signature = self._signature(os.stat(path))
+        except FileExistsError:
+            return False
+        finally:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+        self._remember(key, signature, value)
+        return True
+
+    def warm(self) -> int:
+        """
+        Load the most recently written entries of the disk tier into the memory
+        tier, as many as it holds.
+
+        Returns:
+            int: Number of entries loaded
+        """
+        if not self.memory_entries:
+            return 0
+        try:
+            with os.scandir(self.directory) as entries:
+                files = [(entry.stat().st_mtime, entry.name[:-len(".json")]) for entry in entries
+                         if entry.is_file() and entry.name.endswith(".json")]
+        except OSError:
+            return 0
+        files.sort(reverse=True)
+        loaded = 0
+        # Oldest first, so the most recent entries end up last in the LRU order
+        for _, key in reversed(files[:self.memory_entries]):
+            if self.get(key) is not None:
+                loaded += 1
+        return loaded
+
+    def discard(self, key: str):
+        """Remove an entry from both tiers."""
+        self._forget(key)
+        try:
+            os.remove(self.path(key))
+        except OSError:
+            pass
+
+
+# Entries kept in memory per cache and worker
+MEMORY_MAX_ENTRIES = int(os.environ.get("CACHE_MEMORY_MAX_ENTRIES", "512"))
+
+# Least interval between two access time updates of an entry
+ACCESS_RESOLUTION_SECONDS = 300
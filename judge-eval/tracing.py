@@ -0,0 +1,241 @@
+"""
+Lightweight span instrumentation.
+
+Each evaluation owns a Tracer that records a tree of timed spans (phase name,
+start, duration and attributes such as cache hits). The tree is returned with
+the evaluation result and can optionally be exported to a local OpenTelemetry
+collector using the OTLP/HTTP JSON protocol.
+
+Configuration (environment variables):
+    OTEL_EXPORTER_OTLP_ENDPOINT   Collector base URL, e.g. http://otel-collector:4318.
+                                  Export is disabled when unset.
+    OTEL_SERVICE_NAME             Service name reported to the collector (default: judge-eval)
+"""
+
+import os
+import time
+import queue
+import secrets
+import threading
+import contextvars
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+from eval_logger import eval_logger
+
+
+@dataclass
+class Span:
+    """A single timed phase of an evaluation."""
+    name: str
+    tracer: "Tracer"
+    parent: Optional["Span"] = None
+    span_id: str = field(default_factory=lambda: secrets.token_hex(8))
+    start_time: float = field(default_factory=time.time)
+    start_perf: float = field(default_factory=time.perf_counter)
+    duration_ms: Optional[float] = None
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    children: List["Span"] = field(default_factory=list)
+    status: str = "ok"
+
+    def set_attributes(self, **attributes):
+        self.attributes.update(attributes)
+
+    def end(self):
+        if self.duration_ms is None:
+            self.duration_ms = round((time.perf_counter() - self.start_perf) * 1000, 3)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "start": datetime.fromtimestamp(self.start_time).isoformat(),
+            "duration_ms": self.duration_ms,
+            "status": self.status,
+            "attributes": dict(self.attributes),
+            "children": [child.to_dict() for child in self.children]
+        }
+
+
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("current_span", default=None)
+
+
+class Tracer:
+    """Collects the span tree of one evaluation. Thread-safe."""
+
+    def __init__(self):
+        self.trace_id = secrets.token_hex(16)
+        self._lock = threading.Lock()
+        self._roots: List[Span] = []
+
+    @contextmanager
+    def start_span(self, name: str, **attributes):
+        """Open a span; nested span() calls in the with block become its children."""
+        parent = _current_span.get()
+        if parent is not None and parent.tracer is not self:
+            parent = None
+        current = Span(name=name, tracer=self, parent=parent, attributes=attributes)
+        with self._lock:
+            if parent is not None:
+                parent.children.append(current)
+            else:
+                self._roots.append(current)
+
+        token = _current_span.set(current)
+        try:
+            yield current
+        except BaseException as e:
+            current.status = "error"
+            current.attributes.setdefault("error", f"{type(e).__name__}: {e}")
+            raise
+        finally:
+            current.end()
+            _current_span.reset(token)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Return the timing tree as JSON serializable data."""
+        with self._lock:
+            roots = list(self._roots)
+        return {
+            "trace_id": self.trace_id,
+            "spans": [root.to_dict() for root in roots]
+        }
+
+    def spans(self) -> List[Span]:
+        """Return all spans of the trace in depth-first order."""
+        with self._lock:
+            pending = list(reversed(self._roots))
+        result = []
+        while pending:
+            current = pending.pop()
+            result.append(current)
+            pending.extend(reversed(current.children))
+        return result
+
+
+class _NoopSpan:
+    """Stand-in yielded by span() outside of a traced evaluation."""
+
+    def set_attributes(self, **attributes):
+        pass
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Time the with block as a child of the current span.
+
+    Does nothing (and costs next to nothing) when called outside of a traced
+    evaluation, so components can be instrumented unconditionally.
+    """
+    parent = _current_span.get()
+    if parent is None:
+        yield _NoopSpan()
+        return
+    with parent.tracer.start_span(name, **attributes) as current:
+        yield current
+
+
+def set_span_attributes(**attributes):
+    """Add attributes to the current span, if any."""
+    current = _current_span.get()
+    if current is not None:
+        current.set_attributes(**attributes)
+
+
+class OtlpExporter:
+    """
+    Exports finished traces to an OpenTelemetry collector (OTLP/HTTP JSON).
+
+    Traces are queued and sent from a background thread so exporting never
+    adds latency to an evaluation; if the collector is unavailable the trace
+    is dropped after logging the failure.
+    """
+
+    def __init__(self, endpoint: Optional[str], service_name: str = "judge-eval", max_queue: int = 1000):
+        self.endpoint = endpoint.rstrip("/") + "/v1/traces" if endpoint else None
+        self.service_name = service_name
+        self._queue: "queue.Queue[Tracer]" = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._thread_lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.endpoint is not None
+
+    def export(self, tracer: Tracer):
+        """Queue a finished trace for export."""
+        if not self.enabled:
+            return
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait(tracer)
+        except queue.Full:
+            eval_logger.debug("tracing", "Trace export queue full, dropping trace", {
+                "trace_id": tracer.trace_id
+            })
+
+    def _ensure_thread(self):
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="otlp-exporter", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        import requests
+
+        while True:
+            tracer = self._queue.get()
+            try:
+                requests.post(self.endpoint, json=self._encode(tracer), timeout=5).raise_for_status()
+            except Exception as e:
+                print(f"[TRACING] Failed to export trace {tracer.trace_id}: {e}", flush=True)
+
+    def _encode(self, tracer: Tracer) -> Dict[str, Any]:
+        otlp_spans = []
+        for current in tracer.spans():
+            start_ns = int(current.start_time * 1e9)
+            end_ns = start_ns + int((current.duration_ms or 0.0) * 1e6)
+            otlp_span = {
+                "traceId": tracer.trace_id,
+                "spanId": current.span_id,
+                "name": current.name,
+                "kind": 1,
+                "startTimeUnixNano": str(start_ns),
+                "endTimeUnixNano": str(end_ns),
+                "attributes": [_otlp_attribute(key, value) for key, value in current.attributes.items()
+                               if value is not None],
+                "status": {"code": 2 if current.status == "error" else 1}
+            }
+            if current.parent is not None:
+                otlp_span["parentSpanId"] = current.parent.span_id
+            otlp_spans.append(otlp_span)
+
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [_otlp_attribute("service.name", self.service_name)]},
+                "scopeSpans": [{
+                    "scope": {"name": "judge-eval"},
+                    "spans": otlp_spans
+                }]
+            }]
+        }
+
+
+def _otlp_attribute(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        encoded = {"boolValue": value}
+    elif isinstance(value, int):
+        encoded = {"intValue": str(value)}
+    elif isinstance(value, float):
+        encoded = {"doubleValue": value}
+    else:
+        encoded = {"stringValue": str(value)}
+    return {"key": key, "value": encoded}
+
+
+# Global trace exporter instance
+otlp_exporter = OtlpExporter(
+    endpoint=os.environ.get("OTEL_EXPORTER_OTLP_ENDPOINT"),
+    service_name=os.environ.get("OTEL_SERVICE_NAME", "judge-eval")
+)
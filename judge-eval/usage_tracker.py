@@ -0,0 +1,263 @@
+"""
+Token usage accounting.
+
+Every chat completion made for an evaluation (the model under test and every
+judge call) is recorded with its prompt and completion tokens, latency and the
+evaluation phase it belongs to (G-Eval, DAG node, TALE phase, ...). Cache hits
+that avoided a call are recorded as savings. The per-evaluation summary is
+returned with the result and folded into process-wide totals.
+"""
+
+import re
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Dict, Any, Optional
+from service_metrics import tokens_total, judge_phase_tokens_total
+
+
+_current_phase: contextvars.ContextVar[str] = contextvars.ContextVar("usage_phase", default="")
+
+
+@contextmanager
+def usage_phase(name: str):
+    """
+    Attribute all calls made inside the with block to a phase.
+
+    Phases nest, e.g. "dag/binaryjudge#2" for a judge node of a DAG metric.
+    """
+    parent = _current_phase.get()
+    token = _current_phase.set(f"{parent}/{name}" if parent else name)
+    try:
+        yield
+    finally:
+        _current_phase.reset(token)
+
+
+def current_phase() -> str:
+    """Return the phase of the calling code ("" outside of any phase)."""
+    return _current_phase.get()
+
+
+def phase_kind(phase: str) -> str:
+    """Strip node ids and labels from a phase, e.g. "dag/binaryjudge#2:Tone" -> "dag/binaryjudge"."""
+    return "/".join(re.split(r"[#:]", segment, maxsplit=1)[0] for segment in phase.split("/")) if phase else ""
+
+
+def _empty_bucket() -> Dict[str, Any]:
+    return {
+        "calls": 0,
+        "calls_without_usage": 0,
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "total_tokens": 0,
+        "latency_ms": 0.0,
+        "cost": None
+    }
+
+
+def _add_to_bucket(bucket: Dict[str, Any], entry: Dict[str, Any]):
+    bucket["calls"] += entry.get("calls", 1)
+    if entry.get("has_usage", True):
+        bucket["prompt_tokens"] += entry.get("prompt_tokens") or 0
+        bucket["completion_tokens"] += entry.get("completion_tokens") or 0
+        bucket["total_tokens"] += entry.get("total_tokens") or 0
+    else:
+        bucket["calls_without_usage"] += entry.get("calls", 1)
+    bucket["latency_ms"] = round(bucket["latency_ms"] + (entry.get("latency_ms") or 0.0), 1)
+    if entry.get("cost") is not None:
+        bucket["cost"] = (bucket["cost"] or 0.0) + entry["cost"]
+
+
+def _merge_buckets(target: Dict[str, Any], source: Dict[str, Any]):
+    for key in ("calls", "calls_without_usage", "prompt_tokens", "completion_tokens", "total_tokens"):
+        target[key] += source.get(key, 0)
+    target["latency_ms"] = round(target["latency_ms"] + source.get("latency_ms", 0.0), 1)
+    if source.get("cost") is not None:
+        target["cost"] = (target["cost"] or 0.0) + source["cost"]
+
+
+def _usage_entry(usage: Optional[Dict[str, Any]], latency_ms: Optional[float] = None,
+                 prices: Optional[Dict[str, Optional[float]]] = None) -> Dict[str, Any]:
+    usage = usage or {}
+    prompt_tokens = usage.get("prompt_tokens")
+    completion_tokens = usage.get("completion_tokens")
+    total_tokens = usage.get("total_tokens")
+    if total_tokens is None and (prompt_tokens is not None or completion_tokens is not None):
+        total_tokens = (prompt_tokens or 0) + (completion_tokens or 0)
+
+    cost = None
+    if prices and (prices.get("input") is not None or prices.get("output") is not None):
+        cost = ((prompt_tokens or 0) * (prices.get("input") or 0.0)
+                + (completion_tokens or 0) * (prices.get("output") or 0.0)) / 1_000_000
+
+    return {
+        "calls": 1,
+        "has_usage": total_tokens is not None,
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": total_tokens,
+        "latency_ms": latency_ms,
+        "cost": cost
+    }
+
+
+class UsageTracker:
+    """Collects the usage of a single evaluation. Thread-safe."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = []
+        self._savings = []
+
+    def record_call(self, role: str, model_name: str, usage: Optional[Dict[str, Any]],
+                    latency_ms: Optional[float] = None, phase: Optional[str] = None,
+                    prices: Optional[Dict[str, Optional[float]]] = None):
+        """
+        Record one chat completion.
+
+        Args:
+            role: "model_under_test" or "judge"
+            model_name: Name of the model that served the call
+            usage: Usage dict of the completion (prompt_tokens, completion_tokens, total_tokens)
+            latency_ms: Wall-clock duration of the call
+            phase: Phase to attribute the call to, defaults to the current usage_phase
+            prices: Optional {"input": ..., "output": ...} prices per million tokens
+        """
+        entry = _usage_entry(usage, latency_ms, prices)
+        entry.update({
+            "role": role,
+            "model": model_name,
+            "phase": phase if phase is not None else current_phase()
+        })
+        with self._lock:
+            self._calls.append(entry)
+
+    def record_saving(self, kind: str, usage: Optional[Dict[str, Any]] = None, role: str = "judge"):
+        """
+        Record a call that was avoided by a cache hit.
+
+        Args:
+            kind: What served the call instead, e.g. "response_cache" or "geval_steps_cache"
+            usage: Usage of the original call, if known
+            role: Whether the avoided call was a "model_under_test" or a "judge" call
+        """
+        entry = _usage_entry(usage)
+        entry.update({"kind": kind, "role": role})
+        with self._lock:
+            self._savings.append(entry)
+
+    def usage_for_phase(self, phase: str) -> Dict[str, Any]:
+        """Return the summed usage of all calls made in a phase (including nested phases)."""
+        bucket = _empty_bucket()
+        with self._lock:
+            for entry in self._calls:
+                if entry["phase"] == phase or entry["phase"].startswith(phase + "/"):
+                    _add_to_bucket(bucket, entry)
+        return bucket
+
+    def summary(self) -> Dict[str, Any]:
+        """Return the usage of the evaluation broken down by role and judge phase."""
+        with self._lock:
+            calls = list(self._calls)
+            savings = list(self._savings)
+
+        model_under_test = _empty_bucket()
+        judge = _empty_bucket()
+        judge_by_phase = {}
+        total = _empty_bucket()
+        for entry in calls:
+            _add_to_bucket(total, entry)
+            if entry["role"] == "judge":
+                _add_to_bucket(judge, entry)
+                phase = entry["phase"] or "unattributed"
+                _add_to_bucket(judge_by_phase.setdefault(phase, _empty_bucket()), entry)
+            else:
+                _add_to_bucket(model_under_test, entry)
+
+        saved = _empty_bucket()
+        saved_by_kind = {}
+        for entry in savings:
+            _add_to_bucket(saved, entry)
+            _add_to_bucket(saved_by_kind.setdefault(entry["kind"], _empty_bucket()), entry)
+
+        return {
+            "model_under_test": model_under_test,
+            "judge": {**judge, "by_phase": judge_by_phase},
+            "total": total,
+            "savings": {**saved, "by_kind": saved_by_kind}
+        }
+
+
+class UsageTotals:
+    """
+    Process-wide usage aggregated over all finished evaluations.
+
+    Judge phases are aggregated by kind (node ids and labels stripped) so the
+    number of series stays bounded no matter how many DAG metrics exist.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._evaluations = 0
+        self._by_model = {}
+        self._by_judge_phase = {}
+        self._savings = {}
+
+    def add(self, summary: Dict[str, Any], model_name: str = "", judge_model_name: str = ""):
+        """Fold the summary of one evaluation into the totals."""
+        with self._lock:
+            self._evaluations += 1
+            _merge_buckets(self._by_model.setdefault(("model_under_test", model_name), _empty_bucket()),
+                           summary["model_under_test"])
+            _merge_buckets(self._by_model.setdefault(("judge", judge_model_name), _empty_bucket()),
+                           summary["judge"])
+            for phase, bucket in summary["judge"]["by_phase"].items():
+                _merge_buckets(self._by_judge_phase.setdefault(phase_kind(phase), _empty_bucket()), bucket)
+            for kind, bucket in summary["savings"]["by_kind"].items():
+                _merge_buckets(self._savings.setdefault(kind, _empty_bucket()), bucket)
+
+        for role, model, bucket in (("model_under_test", model_name, summary["model_under_test"]),
+                                    ("judge", judge_model_name, summary["judge"])):
+            tokens_total.inc(bucket["prompt_tokens"], role=role, model=model, type="prompt")
+            tokens_total.inc(bucket["completion_tokens"], role=role, model=model, type="completion")
+        for phase, bucket in summary["judge"]["by_phase"].items():
+            judge_phase_tokens_total.inc(bucket["prompt_tokens"], phase=phase_kind(phase), type="prompt")
+            judge_phase_tokens_total.inc(bucket["completion_tokens"], phase=phase_kind(phase), type="completion")
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return a JSON serializable copy of the totals."""
+        with self._lock:
+            return {
+                "evaluations": self._evaluations,
+                "by_model": [
+                    {"role": role, "model": model, **dict(bucket)}
+                    for (role, model), bucket in self._by_model.items()
+                ],
+                "judge_by_phase": {phase: dict(bucket) for phase, bucket in self._by_judge_phase.items()},
+                "savings_by_kind": {kind: dict(bucket) for kind, bucket in self._savings.items()}
+            }
+
+    @staticmethod
+    def merge(snapshots) -> Dict[str, Any]:
+        """Add up snapshots of several processes (see shared_state.WorkerSnapshots)."""
+        by_model, by_judge_phase, savings = {}, {}, {}
+        evaluations = 0
+        for snapshot in snapshots:
+            evaluations += snapshot["evaluations"]
+            for bucket in snapshot["by_model"]:
+                _merge_buckets(by_model.setdefault((bucket["role"], bucket["model"]), _empty_bucket()), bucket)
+            for phase, bucket in snapshot["judge_by_phase"].items():
+                _merge_buckets(by_judge_phase.setdefault(phase, _empty_bucket()), bucket)
+            for kind, bucket in snapshot["savings_by_kind"].items():
+                _merge_buckets(savings.setdefault(kind, _empty_bucket()), bucket)
+        return {
+            "evaluations": evaluations,
+            "by_model": [{"role": role, "model": model, **bucket} for (role, model), bucket in by_model.items()],
+            "judge_by_phase": by_judge_phase,
+            "savings_by_kind": savings
+        }
+
+
+# Global usage totals instance
+usage_totals = UsageTotals()
@@ -0,0 +1,160 @@
+"""
+Optional warm-up of a freshly started service.
+
+DeepEval, the metric implementations and the provider clients are loaded
+lazily (see startup_profile), so the service accepts connections quickly
+after a restart. Without a warm-up the first evaluations would pay for those
+imports, all at once when a benchmark is running. With the warm-up enabled,
+a background thread loads them right after startup, together with:
+
+    - the provider client (OpenAI SDK and its HTTP stack),
+    - the evidence index database,
+    - the text processing pool (its first worker process),
+    - the memory tiers of the response and G-Eval steps caches.
+
+/readyz stays 503 until the warm-up finished, so the docker healthcheck and
+load balancers only send traffic to warm workers. Requests arriving earlier
+are still served. A failing step is logged and skipped; it does not keep the
+service unready.
+
+Configuration (environment variables):
+    EVAL_WARMUP    Set to "false" to skip the warm-up (default: true)
+"""
+
+import os
+import time
+import threading
+from typing import Dict, Any, Callable, List, Optional, Tuple
+from eval_logger import eval_logger
+
+
+DISABLED = "disabled"
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+
+# Modules of the evaluation path that are loaded lazily
+METRIC_MODULES = (
+    "deepeval.test_case",
+    "deepeval.metrics",
+    "deepeval.metrics.dag",
+    "judge",
+    "geval_steps_cache",
+    "metric_creator",
+    "talemetric",
+)
+
+
+def _import_metrics() -> Dict[str, Any]:
+    for module in METRIC_MODULES:
+        # An import statement in effect, so the import profiler times it
+        __import__(module)
+    return {"modules": len(METRIC_MODULES)}
+
+
+def _create_clients() -> Dict[str, Any]:
+    from openai import OpenAI
+    # Building a client loads the HTTP stack and its TLS configuration; no request is sent
+    OpenAI(api_key="warmup", base_url="http://localhost", max_retries=0).close()
+    return {}
+
+
+def _open_evidence_index() -> Dict[str, Any]:
+    from evidence_index import evidence_index
+    evidence_index.search("warmup", limit=1)
+    return {"enabled": evidence_index.enabled}
+
+
+def _start_processing_pool() -> Dict[str, Any]:
+    from processing_pool import processing_pool
+    from text_processing import extract_page, loaded_service_modules
+    processing_pool.run(extract_page, b"<p>warm-up</p>", False)
+    if not processing_pool.workers:
+        return {"workers": 0}
+    # Started from main.py instead of server.py, pool processes import the whole service
+    service_modules = processing_pool.run(loaded_service_modules)
+    if service_modules:
+        eval_logger.log_error("warmup", "Text processing pool processes imported the service; start it with "
+                                        "server.py", {"modules": service_modules})
+    return {"workers": processing_pool.workers, "service_modules_in_pool": service_modules}
+
+
+def _warm_caches() -> Dict[str, Any]:
+    from llmrequestor import response_cache
+    from geval_steps_cache import geval_steps_cache
+    return {
+        "response_entries": response_cache.warm(),
+        "geval_steps_entries": geval_steps_cache.warm()
+    }
+
+
+class Warmup:
+    """
+    Runs the warm-up steps once in a background thread and reports their state.
+
+    Args:
+        enabled: Whether to warm up; if not, the service counts as warm right away
+        steps: (name, function) pairs run in order; functions return details for the report
+    """
+
+    def __init__(self, enabled: bool, steps: List[Tuple[str, Callable[[], Dict[str, Any]]]]):
+        self.enabled = enabled
+        self.steps = steps
+        self.state = PENDING if enabled else DISABLED
+        self._lock = threading.Lock()
+        self._results: List[Dict[str, Any]] = []
+        self._started_at: Optional[float] = None
+        self._duration: Optional[float] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.state in (DISABLED, DONE)
+
+    def start(self):
+        """Start the warm-up thread; idempotent."""
+        with self._lock:
+            if self.state != PENDING:
+                return
+            self.state = RUNNING
+            self._started_at = time.perf_counter()
+        threading.Thread(target=self._run, name="warmup", daemon=True).start()
+
+    def _run(self):
+        for name, step in self.steps:
+            started = time.perf_counter()
+            result: Dict[str, Any] = {"step": name}
+            try:
+                result.update(step() or {})
+                result["ok"] = True
+            except Exception as e:
+                result.update(ok=False, error=str(e))
+                eval_logger.log_error("warmup", f"Warm-up step {name} failed: {e}")
+            result["duration_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            with self._lock:
+                self._results.append(result)
+
+        with self._lock:
+            self._duration = time.perf_counter() - self._started_at
+            self.state = DONE
+        eval_logger.info("warmup", "Warm-up finished", self.snapshot())
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "state": self.state,
+                "duration_seconds": round(self._duration, 3) if self._duration is not None else None,
+                "steps": [dict(result) for result in self._results]
+            }
+
+
+# Global warm-up instance
+warmup = Warmup(
+    enabled=os.environ.get("EVAL_WARMUP", "true").lower() != "false",
+    steps=[
+        ("metrics", _import_metrics),
+        ("clients", _create_clients),
+        ("evidence_index", _open_evidence_index),
+        ("processing_pool", _start_processing_pool),
+        ("caches", _warm_caches),
+    ]
+)
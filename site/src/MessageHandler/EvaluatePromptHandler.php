@@ -14,6 +14,7 @@ use Psr\Log\LoggerInterface;
 use Symfony\Contracts\HttpClient\HttpClientInterface;
 use Symfony\Component\Messenger\Attribute\AsMessageHandler;
 use Symfony\Component\Messenger\MessageBusInterface;
+use Symfony\Component\Messenger\Stamp\DelayStamp;
 
 #[AsMessageHandler]
 final class EvaluatePromptHandler
@@ -76,7 +77,13 @@ final class EvaluatePromptHandler
                     ]
                 ],
                 'system_prompt' => $this->getSystemPrompt($prompt),
-                'run_index' => $message->runIndex
+                'run_index' => $message->runIndex,
+                // Lets the eval service cancel all evaluations of this benchmark at once
+                'benchmark_id' => $benchmark->getId(),
+                // Benchmark runs yield to interactive evaluations in the eval service scheduler
+                'priority' => 'bulk',
+                // Stop the evaluation shortly before the HTTP timeout below gives up on it
+                'deadline_seconds' => 1140
             ];
 
             // Call Python evaluation service
@@ -85,6 +92,20 @@ final class EvaluatePromptHandler
                 'timeout' => 1200 // 20 minutes timeout for evaluation (allow deep reasoning)
             ]);
 
+            // The eval service sheds load with 503 and Retry-After when it is saturated;
+            // requeue the evaluation after the delay without using up an attempt
+            if ($response->getStatusCode() === 503) {
+                $retryAfter = (int) ($response->getHeaders(false)['retry-after'][0] ?? 30);
+                $this->logger->info('Eval service overloaded, requeueing evaluation', [
+                    'promptId' => $message->promptId,
+                    'metricId' => $message->metricId,
+                    'modelId' => $message->modelId,
+                    'retryAfter' => $retryAfter
+                ]);
+                $this->messageBus->dispatch($message, [new DelayStamp(max(1, $retryAfter) * 1000)]);
+                return;
+            }
+
             $result = $response->toArray();
 
             // Use existing result if found, otherwise create new one